@@ -0,0 +1,140 @@
+# Memory / time trade-off of --activation_checkpointing for the 6 level residual DynUNet of get_network on
+# synthetic volumes on the CPU. Every configuration runs in its own process, so that the peak RSS is its own.
+# Reports the time of a forward + backward, the peak size of the activations kept for the backward, the peak RSS
+# and the deviation of the gradients from the run without checkpointing.
+#
+# Example: python benchmark_activation_checkpointing.py --steps 2 --shape 96 96 48 --configs none stage:1 block:2
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+import numpy as np
+import torch
+from monai.losses import DiceCELoss
+from monai.networks.nets.dynunet import DynUNet
+
+from sw_fastedit.utils.checkpointing import enable_activation_checkpointing
+
+# same configuration as the segmentation network of get_network
+NETWORK_KWARGS = dict(
+    spatial_dims=3,
+    in_channels=2,
+    out_channels=2,
+    kernel_size=[3, 3, 3, 3, 3, 3],
+    strides=[1, 2, 2, 2, 2, [2, 2, 1]],
+    upsample_kernel_size=[2, 2, 2, 2, [2, 2, 1]],
+    norm_name="instance",
+    deep_supervision=False,
+    res_block=True,
+)
+
+
+class SavedTensorTracker:
+    """Counts the bytes of the activations autograd keeps alive for the backward (parameters are not counted).
+
+    Tensors saved inside a checkpointed segment are handled by the checkpoint's own hooks and not counted, which
+    is what checkpointing saves.
+    """
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def pack(self, tensor):
+        if tensor.requires_grad and tensor.is_leaf:
+            return tensor
+        return _SavedTensor(tensor, self)
+
+    @staticmethod
+    def unpack(saved):
+        return saved.tensor if isinstance(saved, _SavedTensor) else saved
+
+    def hooks(self):
+        return torch.autograd.graph.saved_tensors_hooks(self.pack, self.unpack)
+
+
+class _SavedTensor:
+    def __init__(self, tensor, tracker):
+        self.tensor = tensor
+        self.nbytes = tensor.numel() * tensor.element_size()
+        self.tracker = tracker
+        tracker.current += self.nbytes
+        tracker.peak = max(tracker.peak, tracker.current)
+
+    def __del__(self):
+        self.tracker.current -= self.nbytes
+
+
+def run_config(config, args, results):
+    mode, every = config
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+    network = DynUNet(**NETWORK_KWARGS)
+    segments = enable_activation_checkpointing(network, mode, every)
+    network.train()
+    loss_function = DiceCELoss(to_onehot_y=True, softmax=True)
+
+    rng = np.random.default_rng(args.seed)
+    shape = (args.batch_size, 1, *args.shape)
+    image = torch.from_numpy(rng.normal(size=shape).astype(np.float32))
+    ep = torch.from_numpy((rng.uniform(size=shape) > 0.999).astype(np.float32))
+    label = torch.from_numpy((rng.uniform(size=shape) > 0.9).astype(np.float32))
+
+    tracker = SavedTensorTracker()
+    times = []
+    for _ in range(args.steps):
+        network.zero_grad(set_to_none=True)
+        start = time.perf_counter()
+        with tracker.hooks():
+            loss = loss_function(network(torch.cat((image, ep), dim=1)), label)
+            loss.backward()
+        times.append(time.perf_counter() - start)
+    # plain floats, a tensor would be shared with the parent through a file descriptor of this process
+    grad_norms = [p.grad.norm().item() for p in network.parameters()]
+    # ru_maxrss is in KiB on Linux
+    results.put(
+        (config, segments, min(times), tracker.peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, grad_norms)
+    )
+
+
+def parse_config(value):
+    mode, _, every = value.partition(":")
+    return mode, int(every) if every else 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=2)
+    parser.add_argument("--batch_size", type=int, default=1)
+    # divisible by (32, 32, 16) for the strides of the network
+    parser.add_argument("--shape", type=int, nargs=3, default=[96, 96, 48])
+    parser.add_argument("--configs", nargs="+", default=["none", "stage:1", "stage:2", "block:1", "block:2"])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=36)
+    args = parser.parse_args()
+
+    context = mp.get_context("spawn")
+    results = context.Queue()
+    reference = None
+    for config in [parse_config(c) for c in args.configs]:
+        process = context.Process(target=run_config, args=(config, args, results))
+        process.start()
+        (mode, every), segments, step_time, saved_peak, max_rss, grad_norms = results.get()
+        grad_norms = torch.tensor(grad_norms)
+        process.join()
+        if reference is None:
+            reference = (step_time, saved_peak, grad_norms)
+        grad_diff = ((grad_norms - reference[2]).abs() / reference[2].clamp(min=1e-12)).max().item()
+        print(
+            f"{mode}:{every} ({segments} segments): {step_time:.2f}s per step ({step_time / reference[0]:.2f}x), "
+            f"saved activations {saved_peak / 2**20:.0f} MiB ({saved_peak / reference[1]:.2f}x), "
+            f"peak RSS {max_rss / 2**20:.0f} MiB, max rel grad norm diff {grad_diff:.1e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
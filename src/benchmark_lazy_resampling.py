@@ -0,0 +1,94 @@
+# Compares the eager spatial part of the pre transforms (Orientationd, Spacingd, DivisiblePadd, RandFlipd,
+# RandRotate90d) with the same chain in MONAI's lazy resampling mode (--lazy_resampling) on synthetic volumes.
+# Reports the time per case and how far the lazy output deviates from the eager one.
+#
+# Example: python benchmark_lazy_resampling.py --cases 5 --shape 384 384 120
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from monai.data import MetaTensor
+from monai.transforms import Compose, DivisiblePadd, Orientationd, RandFlipd, RandRotate90d, Spacingd
+
+AMOS_SPACING = (3 * 1.0, 3 * 1.0, 3 * 1.5)
+
+
+def get_spatial_transforms(keys, image, label):
+    return [
+        Orientationd(keys=keys, axcodes="RAS"),
+        Spacingd(keys=image, pixdim=AMOS_SPACING),
+        Spacingd(keys=label, pixdim=AMOS_SPACING, mode="nearest"),
+        DivisiblePadd(keys=keys, k=32, value=0),
+        # prob=1 so that every case exercises all the augmentations
+        RandFlipd(keys=keys, spatial_axis=[0], prob=1.0),
+        RandFlipd(keys=keys, spatial_axis=[1], prob=1.0),
+        RandFlipd(keys=keys, spatial_axis=[2], prob=1.0),
+        RandRotate90d(keys=keys, prob=1.0, max_k=3),
+    ]
+
+
+def get_synthetic_case(shape, rng):
+    # LPS oriented, anisotropic like a typical AMOS CT
+    spacing = (0.7, 0.7, 2.5)
+    affine = np.diag([-spacing[0], -spacing[1], spacing[2], 1.0])
+    grid = np.stack(np.meshgrid(*[np.arange(s) for s in shape], indexing="ij"))
+    center = np.array(shape)[:, None, None, None] * rng.uniform(0.3, 0.7, size=(3, 1, 1, 1))
+    radius = min(shape) * 0.2
+    distance = np.sqrt((((grid - center) * np.array(spacing)[:, None, None, None]) ** 2).sum(0))
+    label = (distance < radius * spacing[0]).astype(np.float32)
+    image = (rng.normal(size=shape) * 50 + label * 200).astype(np.float32)
+    return {
+        "image": MetaTensor(torch.from_numpy(image)[None], affine=torch.from_numpy(affine)),
+        "label": MetaTensor(torch.from_numpy(label)[None], affine=torch.from_numpy(affine)),
+    }
+
+
+def run_case(transform, data, seed):
+    transform.set_random_state(seed=seed)
+    start_time = time.perf_counter()
+    result = transform({k: v.clone() for k, v in data.items()})
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=5)
+    parser.add_argument("--shape", type=int, nargs=3, default=[384, 384, 120])
+    parser.add_argument("--seed", type=int, default=36)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    rng = np.random.default_rng(args.seed)
+    keys = ("image", "label")
+    eager = Compose(get_spatial_transforms(keys, "image", "label"))
+    lazy = Compose(get_spatial_transforms(keys, "image", "label"), lazy=True)
+
+    eager_times, lazy_times = [], []
+    for i in range(args.cases):
+        data = get_synthetic_case(tuple(args.shape), rng)
+        eager_result, eager_time = run_case(eager, data, args.seed + i)
+        lazy_result, lazy_time = run_case(lazy, data, args.seed + i)
+        eager_times.append(eager_time)
+        lazy_times.append(lazy_time)
+
+        if eager_result["image"].shape != lazy_result["image"].shape:
+            print(f"case {i}: shape mismatch {eager_result['image'].shape} vs {lazy_result['image'].shape}")
+            continue
+        image_diff = torch.abs(eager_result["image"].as_tensor() - lazy_result["image"].as_tensor())
+        label_agreement = (eager_result["label"].as_tensor() == lazy_result["label"].as_tensor()).float().mean()
+        print(
+            f"case {i}: shape {tuple(eager_result['image'].shape)} eager {eager_time:.3f}s lazy {lazy_time:.3f}s "
+            f"image max abs diff {image_diff.max().item():.4f} mean abs diff {image_diff.mean().item():.5f} "
+            f"label agreement {label_agreement.item():.5f}"
+        )
+
+    eager_mean, lazy_mean = np.mean(eager_times), np.mean(lazy_times)
+    print(f"mean eager {eager_mean:.3f}s, mean lazy {lazy_mean:.3f}s, speedup {eager_mean / lazy_mean:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
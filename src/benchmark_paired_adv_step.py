@@ -0,0 +1,223 @@
+# Compares the alternating source / target iterations of SupervisedTrainerUgda (the source graph is kept until the
+# target iteration and both backwards toggle requires_grad and use retain_graph) with the paired step of
+# --paired_adv_step on small synthetic volumes on the CPU.
+# Reports the time per update, the peak size of the tensors saved for the backward and how far the weights of the
+# two variants drift apart when they start from the same weights and see the same batches.
+#
+# Example: python benchmark_paired_adv_step.py --steps 10 --shape 64 64 32 --batch_size 2
+
+from __future__ import annotations
+
+import argparse
+import copy
+import time
+
+import numpy as np
+import torch
+from monai.losses import DiceCELoss
+from monai.networks.nets.dynunet import DynUNet
+
+from sw_fastedit.discriminator import Discriminator
+from sw_fastedit.utils.enums import CommonKeys as Keys
+from sw_fastedit.utils.enums import GanKeys
+from sw_fastedit.utils.trainer import get_trainable_parameters, paired_adversarial_step
+
+
+class SavedTensorTracker:
+    """Counts the bytes of the activations autograd keeps alive for the backward (parameters are not counted)."""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def reset_peak(self):
+        self.peak = self.current
+
+    def pack(self, tensor):
+        if tensor.requires_grad and tensor.is_leaf:
+            return tensor
+        return _SavedTensor(tensor, self)
+
+    @staticmethod
+    def unpack(saved):
+        return saved.tensor if isinstance(saved, _SavedTensor) else saved
+
+    def hooks(self):
+        return torch.autograd.graph.saved_tensors_hooks(self.pack, self.unpack)
+
+
+class _SavedTensor:
+    def __init__(self, tensor, tracker):
+        self.tensor = tensor
+        self.nbytes = tensor.numel() * tensor.element_size()
+        self.tracker = tracker
+        tracker.current += self.nbytes
+        tracker.peak = max(tracker.peak, tracker.current)
+
+    def __del__(self):
+        self.tracker.current -= self.nbytes
+
+
+def get_networks(filters):
+    seg_network = DynUNet(
+        spatial_dims=3,
+        in_channels=2,
+        out_channels=2,
+        kernel_size=[3] * len(filters),
+        strides=[1] + [2] * (len(filters) - 1),
+        upsample_kernel_size=[2] * (len(filters) - 1),
+        filters=filters,
+        norm_name="instance",
+        res_block=True,
+    )
+    dis_network = Discriminator(num_in_channels=3, ndf=filters[0])
+    return seg_network, dis_network
+
+
+def get_batches(steps, batch_size, shape, rng):
+    batches = []
+    for _ in range(steps):
+        pair = []
+        for _ in range(2):
+            inputs = torch.from_numpy(rng.normal(size=(batch_size, 1, *shape)).astype(np.float32))
+            labels = torch.from_numpy((rng.uniform(size=(batch_size, 1, *shape)) > 0.9).astype(np.float32))
+            ep = torch.from_numpy((rng.uniform(size=(batch_size, 1, *shape)) > 0.999).astype(np.float32))
+            pair.append((inputs, labels, ep))
+        batches.append(pair)
+    return batches
+
+
+def get_seg_input(inputs, ep):
+    return torch.cat((inputs, ep), dim=1)
+
+
+def get_dis_input(pred_seg, ep):
+    return torch.cat((pred_seg, ep), dim=1)
+
+
+def set_requires_grad(nets, requires_grad):
+    for net in nets:
+        for param in net.parameters():
+            param.requires_grad = requires_grad
+
+
+def alternating_step(seg_network, dis_network, optimizers, loss_functions, source, target, lambda_adv, step=True):
+    """The two iterations (source, then target) of the default SupervisedTrainerUgda._iteration."""
+    seg_loss_function, dis_loss_function = loss_functions
+    losses = {}
+    for name, (inputs, labels, ep) in (("source", source), ("target", target)):
+        set_requires_grad([seg_network, dis_network], True)
+        seg_network.train()
+        dis_network.train()
+        for optimizer in optimizers:
+            optimizer.zero_grad(set_to_none=False)
+        pred_seg = seg_network(get_seg_input(inputs, ep))
+        gpred = dis_network(get_dis_input(pred_seg, ep))
+        if name == "source":
+            losses["loss_seg"] = seg_loss_function(pred_seg, labels)
+            losses["loss_dis_source"] = dis_loss_function(gpred, torch.ones_like(gpred))
+        else:
+            losses["loss_dis_target"] = dis_loss_function(gpred, torch.zeros_like(gpred))
+            losses["loss_adv"] = dis_loss_function(gpred, torch.ones_like(gpred))
+
+    set_requires_grad([seg_network], False)
+    set_requires_grad([dis_network], True)
+    (losses["loss_dis_source"] + losses["loss_dis_target"]).backward(retain_graph=True)
+    set_requires_grad([dis_network], False)
+    set_requires_grad([seg_network], True)
+    (losses["loss_seg"] + lambda_adv * losses["loss_adv"]).backward()
+    if step:
+        for optimizer in optimizers:
+            optimizer.step()
+    set_requires_grad([dis_network], True)
+    return {k: v.detach() for k, v in losses.items()}
+
+
+def get_optimizers(seg_network, dis_network, lr):
+    return (
+        torch.optim.Adam(seg_network.parameters(), lr=lr),
+        torch.optim.Adam(dis_network.parameters(), lr=lr),
+    )
+
+
+def run(name, step_fn, seg_network, dis_network, batches, lr):
+    optimizers = get_optimizers(seg_network, dis_network, lr)
+    tracker = SavedTensorTracker()
+    times, peaks = [], []
+    for source, target in batches:
+        tracker.reset_peak()
+        start = time.perf_counter()
+        with tracker.hooks():
+            losses = step_fn(seg_network, dis_network, optimizers, source, target)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracker.peak)
+    # the first step includes the allocator warm up
+    mean_time = np.mean(times[1:]) if len(times) > 1 else times[0]
+    print(
+        f"{name}: {mean_time * 1000:.1f} ms per update, peak saved activations {max(peaks) / 2**20:.1f} MiB, "
+        + ", ".join(f"{k} {v.item():.4f}" for k, v in losses.items())
+    )
+    return mean_time, max(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--batch_size", type=int, default=2)
+    parser.add_argument("--shape", type=int, nargs=3, default=[64, 64, 32])
+    parser.add_argument("--filters", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--lambda_adv", type=float, default=0.001)
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=36)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    torch.manual_seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    batches = get_batches(args.steps, args.batch_size, tuple(args.shape), rng)
+    loss_functions = (DiceCELoss(to_onehot_y=True, softmax=True), torch.nn.BCEWithLogitsLoss())
+
+    seg_alternating, dis_alternating = get_networks(args.filters)
+    seg_paired, dis_paired = copy.deepcopy(seg_alternating), copy.deepcopy(dis_alternating)
+    seg_params = get_trainable_parameters(seg_paired)
+
+    def _alternating(seg_network, dis_network, optimizers, source, target):
+        return alternating_step(seg_network, dis_network, optimizers, loss_functions, source, target, args.lambda_adv)
+
+    def _paired(seg_network, dis_network, optimizers, source, target):
+        results = paired_adversarial_step(
+            seg_network,
+            dis_network,
+            optimizers,
+            loss_functions,
+            source,
+            target,
+            get_seg_input=get_seg_input,
+            get_dis_input=get_dis_input,
+            lambda_adv=args.lambda_adv,
+            seg_params=seg_params,
+        )
+        return {
+            "loss_seg": results[Keys.LOSS_SEG],
+            "loss_dis_source": results["loss_dis_source"],
+            "loss_dis_target": results["loss_dis_target"],
+            "loss_adv": results[GanKeys.ADVLOSS],
+        }
+
+    alternating_time, alternating_peak = run("alternating", _alternating, seg_alternating, dis_alternating, batches, args.lr)
+    paired_time, paired_peak = run("paired", _paired, seg_paired, dis_paired, batches, args.lr)
+
+    max_diff = 0.0
+    for a, b in zip(
+        list(seg_alternating.parameters()) + list(dis_alternating.parameters()),
+        list(seg_paired.parameters()) + list(dis_paired.parameters()),
+    ):
+        max_diff = max(max_diff, (a - b).abs().max().item())
+    print(
+        f"after {args.steps} updates: max abs weight diff {max_diff:.2e}, "
+        f"speedup {alternating_time / paired_time:.2f}x, saved activations {paired_peak / alternating_peak:.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Checks the collectives of the distributed training (sw_fastedit.utils.distributed) with the gloo backend on the
+# CPU: two ranks start with different weights and gradients, broadcast_parameters has to give both the weights
+# of rank 0 and all_reduce_gradients the mean of the gradients. Exits with an AssertionError otherwise.
+#
+# Example: python check_distributed.py --world_size 2
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import socket
+
+import torch
+import torch.distributed as dist
+
+from sw_fastedit.utils.distributed import all_gather_objects, all_reduce_gradients, broadcast_parameters
+
+
+def get_networks(rank):
+    # different weights on every rank, the BatchNorm adds buffers to the broadcast
+    torch.manual_seed(rank)
+    network = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.BatchNorm1d(8), torch.nn.Linear(8, 2))
+    network[1].running_mean.fill_(rank)
+    frozen = torch.nn.Linear(2, 2)
+    frozen.requires_grad_(False)
+    return network, frozen
+
+
+def check_broadcast(rank):
+    network, frozen = get_networks(rank)
+    broadcast_parameters([network, frozen])
+    reference = get_networks(0)
+    for received, expected in zip(reference, (network, frozen)):
+        for a, b in zip(received.state_dict().values(), expected.state_dict().values()):
+            assert torch.equal(a, b), f"rank {rank}: the broadcast weights differ from the ones of rank 0"
+
+
+def check_all_reduce(rank, world_size):
+    network, frozen = get_networks(0)
+    params = list(network.parameters()) + list(frozen.parameters())
+    for i, param in enumerate(network.parameters()):
+        # the last parameter has no gradient on rank 1, it contributes zeros
+        if rank == 1 and i == len(list(network.parameters())) - 1:
+            continue
+        param.grad = torch.full_like(param, rank + 1.0)
+    all_reduce_gradients(params)
+
+    mean = sum(range(1, world_size + 1)) / world_size
+    last_mean = (sum(range(1, world_size + 1)) - (2 if world_size > 1 else 0)) / world_size
+    network_params = list(network.parameters())
+    for i, param in enumerate(network_params):
+        expected = last_mean if i == len(network_params) - 1 else mean
+        assert torch.allclose(param.grad, torch.full_like(param, expected)), (
+            f"rank {rank}: gradient {i} is {param.grad.flatten()[0].item()}, expected {expected}"
+        )
+    assert all(param.grad is None for param in frozen.parameters()), "a frozen parameter got a gradient"
+    # every rank has to end up with the same gradients
+    grads = all_gather_objects([param.grad.tolist() for param in network_params])
+    assert all(g == grads[0] for g in grads), f"rank {rank}: the averaged gradients differ between the ranks"
+
+
+def run_rank(rank, world_size, port):
+    torch.set_num_threads(1)
+    dist.init_process_group("gloo", init_method=f"tcp://127.0.0.1:{port}", rank=rank, world_size=world_size)
+    try:
+        check_broadcast(rank)
+        check_all_reduce(rank, world_size)
+    finally:
+        dist.destroy_process_group()
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--world_size", type=int, default=2)
+    args = parser.parse_args()
+
+    context = mp.get_context("spawn")
+    port = get_free_port()
+    processes = [
+        context.Process(target=run_rank, args=(rank, args.world_size, port)) for rank in range(args.world_size)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = [rank for rank, process in enumerate(processes) if process.exitcode != 0]
+    assert len(failed) == 0, f"the checks failed on the ranks {failed}"
+    print(f"broadcast_parameters and all_reduce_gradients are correct with {args.world_size} gloo ranks")
+
+
+if __name__ == "__main__":
+    main()
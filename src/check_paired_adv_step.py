@@ -0,0 +1,104 @@
+# Checks that paired_adversarial_step (--paired_adv_step) computes the same gradients as the alternating source /
+# target iterations of SupervisedTrainerUgda (retain_graph and toggled requires_grad, see alternating_step of
+# benchmark_paired_adv_step.py): both start from the same tiny CPU networks with a fixed seed and get the same batch,
+# the gradients of the segmentation network and of the discriminator are compared before the optimizer step.
+# Exits with an AssertionError otherwise.
+#
+# Example: python check_paired_adv_step.py --seeds 0 1 2
+
+from __future__ import annotations
+
+import argparse
+import copy
+
+import numpy as np
+import torch
+from monai.losses import DiceCELoss
+
+from benchmark_paired_adv_step import (
+    alternating_step,
+    get_batches,
+    get_dis_input,
+    get_networks,
+    get_optimizers,
+    get_seg_input,
+)
+from sw_fastedit.utils.trainer import paired_adversarial_step
+
+
+def get_gradients(network):
+    return [param.grad.clone() for param in network.parameters()]
+
+
+def check_gradients(name, expected, actual, rtol, atol):
+    assert len(expected) == len(actual), f"{name}: {len(actual)} gradients, expected {len(expected)}"
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        assert torch.allclose(a, b, rtol=rtol, atol=atol), (
+            f"{name}: gradient {i} differs, max abs diff {(a - b).abs().max().item():.2e}"
+        )
+
+
+def check_seed(seed, args, loss_functions):
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+    ((source, target),) = get_batches(1, args.batch_size, tuple(args.shape), rng)
+
+    seg_alternating, dis_alternating = get_networks(args.filters)
+    seg_paired, dis_paired = copy.deepcopy(seg_alternating), copy.deepcopy(dis_alternating)
+
+    alternating_step(
+        seg_alternating,
+        dis_alternating,
+        get_optimizers(seg_alternating, dis_alternating, lr=1e-4),
+        loss_functions,
+        source,
+        target,
+        args.lambda_adv,
+        step=False,
+    )
+    paired_adversarial_step(
+        seg_paired,
+        dis_paired,
+        get_optimizers(seg_paired, dis_paired, lr=1e-4),
+        loss_functions,
+        source,
+        target,
+        get_seg_input=get_seg_input,
+        get_dis_input=get_dis_input,
+        lambda_adv=args.lambda_adv,
+        step=False,
+    )
+
+    check_gradients(
+        f"seed {seed}, segmentation network",
+        get_gradients(seg_alternating),
+        get_gradients(seg_paired),
+        args.rtol,
+        args.atol,
+    )
+    check_gradients(
+        f"seed {seed}, discriminator", get_gradients(dis_alternating), get_gradients(dis_paired), args.rtol, args.atol
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--batch_size", type=int, default=2)
+    parser.add_argument("--shape", type=int, nargs=3, default=[16, 16, 8])
+    parser.add_argument("--filters", type=int, nargs="+", default=[4, 8, 16])
+    # large enough that a wrong adversarial gradient is not hidden by the tolerance
+    parser.add_argument("--lambda_adv", type=float, default=0.5)
+    parser.add_argument("--rtol", type=float, default=1e-4)
+    parser.add_argument("--atol", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    loss_functions = (DiceCELoss(to_onehot_y=True, softmax=True), torch.nn.BCEWithLogitsLoss())
+    for seed in args.seeds:
+        check_seed(seed, args, loss_functions)
+    print(f"paired_adversarial_step gives the gradients of the alternating step for the seeds {args.seeds}")
+
+
+if __name__ == "__main__":
+    main()
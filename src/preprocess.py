@@ -0,0 +1,154 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fills the training cache ahead of time on a CPU only node. Takes the same arguments as the train_*.py scripts,
+# runs the deterministic part (LoadImaged ... DivisiblePadd) of the train and val pre transforms of both domains
+# over every case in a process pool and writes the results to the MemmapDataset store in --cache_dir. With
+# --val_subset_size and a --val_subset_spacing_scale other than 1 the coarser val subsets are preprocessed as well.
+# Already stored cases are skipped, so an interrupted run can simply be restarted.
+
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+
+from sw_fastedit.data import get_data, get_store, get_store_pre_transforms, get_val_subset
+from sw_fastedit.utils.argparser import parse_args, setup_environment_for_preprocessing
+from sw_fastedit.utils.volume_store import get_item_hash
+
+logger = logging.getLogger("sw_fastedit")
+
+PROGRESS_LOG_NAME = "preprocess_progress.jsonl"
+MANIFEST_NAME = "preprocess_manifest.json"
+
+# Built once per worker process by init_worker
+stores = None
+
+
+def get_stores(args):
+    """
+    Build the same MemmapDatasets the train, val and val subset loaders use, keyed by (domain, stage).
+    """
+    cpu_device = torch.device("cpu")
+    result = {}
+    for dataset in ["source", "target"]:
+        train_data, val_data, _ = get_data(args, dataset)
+        for stage, data in [("train", train_data), ("val", val_data)]:
+            pre_transforms = get_store_pre_transforms(args, dataset, stage, cpu_device)
+            result[(dataset, stage)] = get_store(args, data, pre_transforms, dataset, stage)
+        if args.val_subset_size > 0 and args.val_subset_spacing_scale != 1.0:
+            # with the spacing of the val set the subset is part of the val store
+            scale = args.val_subset_spacing_scale
+            pre_transforms = get_store_pre_transforms(args, dataset, "val", cpu_device, spacing_scale=scale)
+            subset = get_val_subset(args, dataset, val_data, args.val_subset_size)
+            subset_store = get_store(args, subset, pre_transforms, dataset, "val", spacing_scale=scale)
+            result[(dataset, "val_subset")] = subset_store
+    return result
+
+
+def init_worker(args):
+    global stores
+    # One case per process, intra op parallelism would only oversubscribe the node
+    torch.set_num_threads(1)
+    stores = get_stores(args)
+
+
+def preprocess_case(dataset, stage, index):
+    store = stores[(dataset, stage)]
+    start_time = time.perf_counter()
+    result = {
+        "dataset": dataset,
+        "stage": stage,
+        "index": index,
+        "config_hash": store.config_hash,
+        "item_hash": get_item_hash(store.data[index]),
+    }
+    try:
+        was_cached = store.is_cached(index)
+        data = store.get_cached_item(index)
+        result["status"] = "cached" if was_cached else "done"
+        result["shapes"] = {str(k): list(v.shape) for k, v in data.items() if hasattr(v, "shape")}
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = repr(e)
+    result["seconds"] = round(time.perf_counter() - start_time, 3)
+    return result
+
+
+def write_manifest(args, main_stores, results):
+    manifest = {"caller_args": args.caller_args, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "stores": {}}
+    for (dataset, stage), store in main_stores.items():
+        cases = []
+        for index, item in enumerate(store.data):
+            case = {"data": item, "item_hash": get_item_hash(item)}
+            case.update({k: v for k, v in results.get((dataset, stage, index), {}).items() if k in ["status", "shapes", "error"]})
+            cases.append(case)
+        manifest["stores"][f"{dataset}_{stage}"] = {
+            "config_hash": store.config_hash,
+            "config": store.config,
+            "cases": cases,
+        }
+    with open(os.path.join(args.cache_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+
+def run(args):
+    main_stores = get_stores(args)
+    tasks = [(dataset, stage, index) for (dataset, stage), store in main_stores.items() for index in range(len(store))]
+    logger.info(f"Preprocessing {len(tasks)} cases with {args.preprocessing_workers} workers into {args.cache_dir}")
+
+    results = {}
+    start_time = time.time()
+    with open(os.path.join(args.cache_dir, PROGRESS_LOG_NAME), "a") as progress_log, ProcessPoolExecutor(
+        max_workers=args.preprocessing_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(args,),
+    ) as executor:
+        futures = [executor.submit(preprocess_case, *task) for task in tasks]
+        for i, future in enumerate(as_completed(futures)):
+            result = future.result()
+            results[(result["dataset"], result["stage"], result["index"])] = result
+            progress_log.write(json.dumps(result) + "\n")
+            progress_log.flush()
+
+            elapsed = time.time() - start_time
+            eta = elapsed / (i + 1) * (len(tasks) - i - 1)
+            message = (
+                f"[{i + 1}/{len(tasks)}] {result['dataset']} {result['stage']} {result['index']}: "
+                f"{result['status']} in {result['seconds']}s, ETA {eta:.0f}s"
+            )
+            if result["status"] == "failed":
+                logger.error(f"{message} - {result['error']}")
+            else:
+                logger.info(message)
+
+    write_manifest(args, main_stores, results)
+    failed = sum(r["status"] == "failed" for r in results.values())
+    logger.info(f"Preprocessing finished in {time.time() - start_time:.0f}s, {failed} failed cases")
+
+
+def main():
+    global logger
+
+    args = parse_args()
+    args, logger = setup_environment_for_preprocessing(args)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,11 +18,12 @@
 
 from __future__ import annotations
 
+import copy
 import logging
 import os
 import random
 from collections import OrderedDict
-from functools import reduce
+from functools import partial, reduce
 from pickle import dump
 from typing import Iterable, List
 import sys
@@ -38,14 +39,23 @@ from ignite.handlers import TerminateOnNan
 from monai.data import set_track_meta
 from sw_fastedit.utils.trainer import  SupervisedTrainerEp, SupervisedTrainerDynUnet, SupervisedTrainerPada, SupervisedTrainerDextr, SupervisedTrainerDualDynUNet, SupervisedTrainerUgda
 from sw_fastedit.utils.evaluator import SupervisedEvaluatorEp, SupervisedEvaluatorDynUnet, SupervisedEvaluatorPada, SupervisedEvaluatorDextr, SupervisedEvaluatorDualDynUnet, SupervisedEvaluatorUgda
-from sw_fastedit.utils.validation_handler import ValidationHandler
+from sw_fastedit.utils.validation_handler import AsyncValidationHandler, TieredValidator, ValidationHandler, WeightSnapshot
+from sw_fastedit.utils.async_writer import WriterFlushHandler, set_writer_threads
+from sw_fastedit.utils.metrics import ConfusionMeanDice
+from sw_fastedit.utils.checkpointing import enable_activation_checkpointing
+from sw_fastedit.utils.distributed import get_local_world_size, init_distributed, is_main_process
+from sw_fastedit.utils.metric_accumulator import (
+    DEFAULT_LOG_INTERVAL,
+    MetricAccumulator,
+    set_sanity_check_interval,
+    set_summary_writer,
+)
 from monai.handlers import (
     CheckpointLoader,
     CheckpointSaver,
     GarbageCollector,
     IgniteMetricHandler,
     LrScheduleHandler,
-    MeanDice,
     StatsHandler,
     from_engine,
 )
@@ -54,11 +64,11 @@ from monai.inferers import SimpleInferer
 from monai.losses import DiceCELoss, DiceLoss
 from monai.networks.nets.dynunet import DynUNet
 from monai.optimizers.novograd import Novograd
-from monai.transforms import Compose
 from monai.utils import set_determinism
 
 
 from sw_fastedit.data import (
+    compose_pre_transforms,
     get_post_transforms_dual_dynunet,
     get_post_transforms,
     get_post_transforms_ep,
@@ -66,9 +76,11 @@ from sw_fastedit.data import (
     get_pre_transforms_train_as_list_mri,
     get_pre_transforms_val_as_list_ct,
     get_pre_transforms_val_as_list_mri,
+    PairedBatchLoader,
     get_train_loader,
     get_train_loader_separate,
     get_val_loader_separate,
+    get_val_subset_loaders,
 )
 
 from sw_fastedit.discriminator import Discriminator
@@ -80,6 +92,37 @@ logger = logging.getLogger("sw_fastedit")
 output_dir = None
 
 
+def get_devices(args):
+    """
+    The device of the networks and the sliding window outputs (`device`) and the device the sliding windows
+    run on (`sw_device`). Falls back to the CPU without CUDA, e.g. for distributed training with gloo.
+    """
+    if not torch.cuda.is_available():
+        return torch.device("cpu"), torch.device("cpu")
+    sw_device = torch.device(f"cuda:{args.gpu}")
+    device = sw_device if not args.sw_cpu_output else "cpu"
+    return device, sw_device
+
+
+def get_val_devices(args, device, sw_device):
+    """
+    The `device` and `sw_device` of the evaluators: the ones of the training, or --val_device for the
+    asynchronous validation.
+    """
+    if not args.async_val or args.val_device is None:
+        return device, sw_device
+    return torch.device(args.val_device), torch.device(args.val_device)
+
+
+def get_weight_snapshot(args, networks, device):
+    """
+    The WeightSnapshot of `networks` on `device` the evaluators validate with --async_val, None without it.
+    """
+    if not args.async_val or args.eval_only:
+        return None
+    return WeightSnapshot(networks, device)
+
+
 def get_optimizer(optimizer: str, lr: float, networks):
     """
     Get an optimizer for the given neural network.
@@ -142,7 +185,14 @@ def get_loss_function(loss_args, loss_kwargs=None):
     return loss_function
 
 
-def get_network(labels: Iterable, discriminator: bool = True, extreme_points: bool = True, segmentation: bool = True):
+def get_network(
+    labels: Iterable,
+    discriminator: bool = True,
+    extreme_points: bool = True,
+    segmentation: bool = True,
+    activation_checkpointing: str = "none",
+    checkpoint_every: int = 1,
+):
 
     """
     Get a network for semantic segmentation.
@@ -151,6 +201,8 @@ def get_network(labels: Iterable, discriminator: bool = True, extreme_points: bo
         network_str (str): The type of network. Options: "dynunet", "smalldynunet", "bigdynunet", "hugedynunet".
         labels (Iterable): List of label names.
         non_interactive (bool, optional): Flag indicating whether the network is used in non-interactive mode.
+        activation_checkpointing (str, optional): "none", "stage" or "block", see `enable_activation_checkpointing`.
+        checkpoint_every (int, optional): Only checkpoint every k-th stage / block of the DynUNets.
 
     Returns:
         nn.Module: An instance of the specified U-Net-based neural network.
@@ -230,11 +282,21 @@ def get_network(labels: Iterable, discriminator: bool = True, extreme_points: bo
 
     logger.info(f"Selected network {networks.__class__.__qualname__}")
     logger.info(f"Number of parameters: {parameters:,}")
+    if activation_checkpointing != "none":
+        segments = [enable_activation_checkpointing(n, activation_checkpointing, checkpoint_every) for n in networks]
+        logger.info(f"Activation checkpointing ({activation_checkpointing}) of {segments} segments")
 
 
     return networks
 
-def get_network_ugda(labels: Iterable, discriminator: bool = True, extreme_points: bool = True, segmentation: bool = True):
+def get_network_ugda(
+    labels: Iterable,
+    discriminator: bool = True,
+    extreme_points: bool = True,
+    segmentation: bool = True,
+    activation_checkpointing: str = "none",
+    checkpoint_every: int = 1,
+):
 
     """
     Get a network for semantic segmentation.
@@ -243,6 +305,8 @@ def get_network_ugda(labels: Iterable, discriminator: bool = True, extreme_point
         network_str (str): The type of network. Options: "dynunet", "smalldynunet", "bigdynunet", "hugedynunet".
         labels (Iterable): List of label names.
         non_interactive (bool, optional): Flag indicating whether the network is used in non-interactive mode.
+        activation_checkpointing (str, optional): "none", "stage" or "block", see `enable_activation_checkpointing`.
+        checkpoint_every (int, optional): Only checkpoint every k-th stage / block of the DynUNets.
 
     Returns:
         nn.Module: An instance of the specified U-Net-based neural network.
@@ -307,6 +371,9 @@ def get_network_ugda(labels: Iterable, discriminator: bool = True, extreme_point
 
     logger.info(f"Selected network {networks.__class__.__qualname__}")
     logger.info(f"Number of parameters: {parameters:,}")
+    if activation_checkpointing != "none":
+        segments = [enable_activation_checkpointing(n, activation_checkpointing, checkpoint_every) for n in networks]
+        logger.info(f"Activation checkpointing ({activation_checkpointing}) of {segments} segments")
 
 
     return networks
@@ -363,7 +430,7 @@ def get_scheduler(optimizer, scheduler_str: str, epochs_to_run: int, eta_min: fl
     return lr_scheduler
 
 
-def get_val_handlers(*,garbage_collector=True):
+def get_val_handlers(*,garbage_collector=True, log_interval=DEFAULT_LOG_INTERVAL, metric_prefix="val_"):
     """
     Retrieves a list of event handlers for validation in a MONAI training workflow.
 
@@ -373,6 +440,8 @@ def get_val_handlers(*,garbage_collector=True):
         gpu_size (str): The GPU size, one of "large" or any other value, e.g., "small".
         garbage_collector (bool, optional): Whether to include the GarbageCollector event handler (default is True).
         non_interactive (bool, optional): Whether the training loop is non-interactive, e.g., without clicks (default is False).
+        log_interval (int, optional): Every how many iterations the MetricAccumulator logs (default is DEFAULT_LOG_INTERVAL).
+        metric_prefix (str, optional): Prefix of the accumulated values in the log and TensorBoard (default is "val_").
 
     Returns:
         List[Event_Handler]: A list of event handlers for validation in a MONAI training workflow.
@@ -395,6 +464,10 @@ def get_val_handlers(*,garbage_collector=True):
         StatsHandler(output_transform=lambda x: None),
         # End of epoch GarbageCollection
         GarbageCollector(log_level=10),
+        # Wait for the --save_pred writes of this evaluation
+        WriterFlushHandler(),
+        # Per iteration metrics, read back from the device every log_interval iterations
+        MetricAccumulator(log_interval=log_interval, tag_prefix=metric_prefix),
     ]
     if garbage_collector:
         # https://github.com/Project-MONAI/MONAI/issues/3423
@@ -404,12 +477,94 @@ def get_val_handlers(*,garbage_collector=True):
     return val_handlers
 
 
+def get_validation_handlers(evaluators, val_freq, eval_only: bool, snapshot=None):
+    """
+    The handlers which run the evaluators every `val_freq` epochs (iterations with `eval_only`): one
+    ValidationHandler per evaluator, or with a `snapshot` one AsyncValidationHandler which runs all of them in the
+    background. TieredValidators (see `get_validators`) are also attached to the trainer themselves without a
+    snapshot, so the whole val set is validated at the end of the training.
+    """
+    if snapshot is not None:
+        return [
+            AsyncValidationHandler(
+                validators=evaluators,
+                snapshot=snapshot,
+                interval=val_freq,
+                epoch_level=(not eval_only),
+            )
+        ]
+    return [
+        ValidationHandler(
+            validator=evaluator,
+            interval=val_freq,
+            epoch_level=(not eval_only),
+        )
+        for evaluator in evaluators
+    ] + [
+        # validate the whole val set of the TieredValidators when the training completes
+        evaluator for evaluator in evaluators if isinstance(evaluator, TieredValidator)
+    ]
+
+
+def get_subset_evaluators(
+    args,
+    evaluator_cls,
+    val_device,
+    eval_networks,
+    eval_inferer,
+    val_post_transform,
+    val_key_metric,
+    val_additional_metrics,
+    **evaluator_kwargs,
+):
+    """
+    The evaluators of the source and the target val subset of the tiered validation (--val_subset_size), None
+    without it. They are built like the evaluators of the whole val sets, `evaluator_kwargs` are passed on to
+    `evaluator_cls` (e.g. `amp` or `metric_cmp_fn`), evaluators which take the `args` get them with a partial.
+    """
+    if args.val_subset_size == 0 or args.eval_only:
+        return None
+    return [
+        evaluator_cls(
+            device=val_device,
+            val_data_loader=loader,
+            networks=eval_networks,
+            inferer=eval_inferer,
+            postprocessing=val_post_transform,
+            key_val_metric=copy_metrics(val_key_metric),
+            additional_metrics=copy_metrics(val_additional_metrics),
+            val_handlers=get_val_handlers(
+                garbage_collector=True,
+                log_interval=args.metric_log_interval,
+                metric_prefix=f"val_subset_{dataset}_",
+            ),
+            **evaluator_kwargs,
+        )
+        for dataset, loader in zip(("source", "target"), get_val_subset_loaders(args, val_device))
+    ]
+
+
+def get_validators(args, evaluators, subset_evaluators=None):
+    """
+    What the validation handlers run for the source and the target domain: the `evaluators` of the whole val sets,
+    or with `subset_evaluators` (--val_subset_size) a TieredValidator per domain. The CheckpointSaver stays
+    attached to the evaluator of the whole val set.
+    """
+    if subset_evaluators is None:
+        return list(evaluators)
+    return [
+        TieredValidator(subset_evaluator, evaluator, full_interval=args.val_full_freq)
+        for subset_evaluator, evaluator in zip(subset_evaluators, evaluators)
+    ]
+
+
 def get_train_handlers(
     lr_scheduler,
     evaluator,
     val_freq,
     eval_only: bool,
     garbage_collector=True,
+    log_interval=DEFAULT_LOG_INTERVAL,
 ):
     """
     Retrieves a list of event handlers for training in a MONAI training workflow.
@@ -424,6 +579,7 @@ def get_train_handlers(
         gpu_size (str): The GPU size, one of "large" or any other value.
         garbage_collector (bool, optional): Whether to include the GarbageCollector event handler (default is True).
         non_interactive (bool, optional): Whether the environment is non-interactive (default is False).
+        log_interval (int, optional): Every how many iterations the MetricAccumulator logs (default is DEFAULT_LOG_INTERVAL).
 
     Returns:
         List[Event_Handler]: A list of event handlers for training in a MONAI training workflow.
@@ -449,7 +605,8 @@ def get_train_handlers(
             epoch_level=(not eval_only),
         ),
         
-        StatsHandler(tag_name="train_loss", output_transform=from_engine(["loss"], first=True)),
+        StatsHandler(tag_name="train_loss", output_transform=from_engine(["loss"], first=True), iteration_log=False),
+        MetricAccumulator(log_interval=log_interval, tag_prefix="train_"),
         # End of epoch GarbageCollection
         GarbageCollector(log_level=10),
     ]
@@ -467,6 +624,8 @@ def get_train_handlers_separate(
     val_freq,
     eval_only: bool,
     garbage_collector=True,
+    log_interval=DEFAULT_LOG_INTERVAL,
+    snapshot=None,
 ):
     """
     Retrieves a list of event handlers for training in a MONAI training workflow.
@@ -481,6 +640,8 @@ def get_train_handlers_separate(
         gpu_size (str): The GPU size, one of "large" or any other value.
         garbage_collector (bool, optional): Whether to include the GarbageCollector event handler (default is True).
         non_interactive (bool, optional): Whether the environment is non-interactive (default is False).
+        log_interval (int, optional): Every how many iterations the MetricAccumulator logs (default is DEFAULT_LOG_INTERVAL).
+        snapshot (WeightSnapshot, optional): Validate asynchronously on this snapshot (--async_val), see `get_weight_snapshot`.
 
     Returns:
         List[Event_Handler]: A list of event handlers for training in a MONAI training workflow.
@@ -499,18 +660,10 @@ def get_train_handlers_separate(
 
     train_handlers = [
         LrScheduleHandler(lr_scheduler=lr_scheduler, print_lr=True),
-        ValidationHandler(
-            validator=evaluator_source,
-            interval=val_freq,
-            epoch_level=(not eval_only),
-        ),
-        ValidationHandler(
-            validator=evaluator_target,
-            interval=val_freq,
-            epoch_level=(not eval_only),
-        ),
+        *get_validation_handlers([evaluator_source, evaluator_target], val_freq, eval_only, snapshot=snapshot),
         
-        StatsHandler(tag_name="train_loss", output_transform=from_engine(["loss"], first=True)),
+        StatsHandler(tag_name="train_loss", output_transform=from_engine(["loss"], first=True), iteration_log=False),
+        MetricAccumulator(log_interval=log_interval, tag_prefix="train_"),
         # End of epoch GarbageCollection
         GarbageCollector(log_level=10),
     ]
@@ -529,6 +682,8 @@ def get_train_handlers_separate_adv(
     val_freq,
     eval_only: bool,
     garbage_collector=True,
+    log_interval=DEFAULT_LOG_INTERVAL,
+    snapshot=None,
 ):
     """
     Retrieves a list of event handlers for training in a MONAI training workflow.
@@ -541,6 +696,8 @@ def get_train_handlers_separate_adv(
         sw_roi_size (List): The region of interest size for the sliding window strategy.
         inferer (str): The type of inferer, e.g., "SimpleInferer" or "SlidingWindowInferer".
         garbage_collector (bool, optional): Whether to include the GarbageCollector event handler (default is True).
+        log_interval (int, optional): Every how many iterations the MetricAccumulator logs (default is DEFAULT_LOG_INTERVAL).
+        snapshot (WeightSnapshot, optional): Validate asynchronously on this snapshot (--async_val), see `get_weight_snapshot`.
 
     Returns:
         List[Event_Handler]: A list of event handlers for training in a MONAI training workflow.
@@ -560,18 +717,10 @@ def get_train_handlers_separate_adv(
     train_handlers = [
         LrScheduleHandler(lr_scheduler=lr_scheduler[0], print_lr=True),
         LrScheduleHandler(lr_scheduler=lr_scheduler[1], print_lr=True),
-        ValidationHandler(
-            validator=evaluator_source,
-            interval=val_freq,
-            epoch_level=(not eval_only),
-        ),
-        ValidationHandler(
-            validator=evaluator_target,
-            interval=val_freq,
-            epoch_level=(not eval_only),
-        ),
+        *get_validation_handlers([evaluator_source, evaluator_target], val_freq, eval_only, snapshot=snapshot),
         
-        StatsHandler(tag_name="train_loss", output_transform=from_engine(["loss"], first=True)),
+        StatsHandler(tag_name="train_loss", output_transform=from_engine(["loss"], first=True), iteration_log=False),
+        MetricAccumulator(log_interval=log_interval, tag_prefix="train_"),
         # End of epoch GarbageCollection
         GarbageCollector(log_level=10),
     ]
@@ -583,23 +732,38 @@ def get_train_handlers_separate_adv(
     return train_handlers
 
 
-def get_key_metric(metric, str_to_prepend="") -> OrderedDict:
+def copy_metrics(metrics: dict) -> OrderedDict:
+    """
+    Own instances of the (not yet attached) `metrics` for one evaluator. The metrics keep the state of the running
+    evaluation, so evaluators which may run at the same time (--async_val) must not share them.
+    """
+    return OrderedDict((name, copy.deepcopy(metric)) for name, metric in metrics.items())
+
+
+def get_key_metric(metric, str_to_prepend="", num_classes=2) -> OrderedDict:
     """
     Retrieves key metrics, particularly Mean Dice, for use in a MONAI training workflow.
 
     Args:
         str_to_prepend (str, optional): A string to prepend to the metric name (default is an empty string).
+        num_classes (int, optional): Number of classes of the argmaxed "pred_seg" (default is 2, organ and background).
 
     Returns:
         OrderedDict: An ordered dictionary containing key metrics for training and evaluation.
     """
     key_metrics = OrderedDict()
     if (metric == 'dice'):
-        key_metrics[f"{str_to_prepend}dice"] = MeanDice(output_transform=from_engine(["pred_seg", "label_seg"]), include_background=False, save_details=False)
+        key_metrics[f"{str_to_prepend}dice"] = ConfusionMeanDice(
+            output_transform=from_engine(["pred_seg", "label_seg"]), include_background=False, num_classes=num_classes,
+            save_details=False,
+        )
     elif (metric == 'mse'):
         key_metrics[f"{str_to_prepend}mse"] = MeanSquaredError(output_transform=from_engine(["pred_ep", "label_ep"]))
     elif (metric == 'dice_mse'):
-        key_metrics[f"{str_to_prepend}dice"] = MeanDice(output_transform=from_engine(["pred_seg", "label_seg"]), include_background=False, save_details=False)
+        key_metrics[f"{str_to_prepend}dice"] = ConfusionMeanDice(
+            output_transform=from_engine(["pred_seg", "label_seg"]), include_background=False, num_classes=num_classes,
+            save_details=False,
+        )
         key_metrics[f"{str_to_prepend}mse"] = MeanSquaredError(output_transform=from_engine(["pred_ep", "label_ep"]))
 
     return key_metrics
@@ -663,22 +827,40 @@ def get_trainer_ep(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
 
-    val_loader_1 = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_2 = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+    val_loader_1 = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_2 = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
 
-    post_transform = get_post_transforms_ep(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms_ep(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms_ep(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network(args.labels, discriminator=False, extreme_points=True, segmentation=False)
+    networks = get_network(
+        args.labels,
+        discriminator=False,
+        extreme_points=True,
+        segmentation=False,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[0] = networks[0].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
 
@@ -699,41 +881,64 @@ def get_trainer_ep(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
 
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_1 = SupervisedEvaluatorEp(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_1,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         metric_cmp_fn=lambda current_metric, previous_best: current_metric < previous_best,
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ), 
     )
     evaluator_2 = SupervisedEvaluatorEp(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_2,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         metric_cmp_fn=lambda current_metric, previous_best: current_metric < previous_best,
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ), 
     )
 
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        SupervisedEvaluatorEp,
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+        amp=args.amp,
+        metric_cmp_fn=lambda current_metric, previous_best: current_metric < previous_best,
+    )
+    validator_1, validator_2 = get_validators(args, [evaluator_1, evaluator_2], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader(args, pre_transforms_train_source=pre_transforms_train_source, pre_transforms_train_target=pre_transforms_train_target)
 
 
@@ -746,11 +951,13 @@ def get_trainer_ep(
 
     train_handlers = get_train_handlers_separate(
         lr_scheduler,
-        evaluator_1,
-        evaluator_2,
+        validator_1,
+        validator_2,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
     trainer = SupervisedTrainerEp(
@@ -763,6 +970,7 @@ def get_trainer_ep(
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         metric_cmp_fn=lambda current_metric, previous_best: current_metric < previous_best,
@@ -790,16 +998,17 @@ def get_trainer_ep(
         }
 
 
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        key_metric_negative_sign=True,
-        final_filename="pretrained_deepedit_" + args.target_dataset + "-final.pt",
-        file_prefix=args.target_dataset,
-    ).attach(evaluator_2)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            key_metric_negative_sign=True,
+            final_filename="pretrained_deepedit_" + args.target_dataset + "-final.pt",
+            file_prefix=args.target_dataset,
+        ).attach(evaluator_2)
 
 
 
@@ -859,21 +1068,39 @@ def get_trainer_ep_source(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
-    val_loader_1 = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_2 = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+    val_loader_1 = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_2 = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
 
-    post_transform = get_post_transforms_ep(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms_ep(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms_ep(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network(args.labels, discriminator=False, extreme_points=True, segmentation=False)
+    networks = get_network(
+        args.labels,
+        discriminator=False,
+        extreme_points=True,
+        segmentation=False,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[0] = networks[0].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
 
@@ -894,42 +1121,65 @@ def get_trainer_ep_source(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
 
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_1 = SupervisedEvaluatorEp(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_1,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         metric_cmp_fn=lambda current_metric, previous_best: current_metric < previous_best,
         val_handlers=get_val_handlers(
 
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ), 
     )
     evaluator_2 = SupervisedEvaluatorEp(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_2,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         metric_cmp_fn=lambda current_metric, previous_best: current_metric < previous_best,
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ), 
     )
 
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        SupervisedEvaluatorEp,
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+        amp=args.amp,
+        metric_cmp_fn=lambda current_metric, previous_best: current_metric < previous_best,
+    )
+    validator_1, validator_2 = get_validators(args, [evaluator_1, evaluator_2], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader_separate(args, pre_transforms_train_source=pre_transforms_train_source, pre_transforms_train_target=pre_transforms_train_target)
 
 
@@ -942,11 +1192,13 @@ def get_trainer_ep_source(
 
     train_handlers = get_train_handlers_separate(
         lr_scheduler,
-        evaluator_1,
-        evaluator_2,
+        validator_1,
+        validator_2,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
     trainer = SupervisedTrainerEp(
@@ -959,6 +1211,7 @@ def get_trainer_ep_source(
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         metric_cmp_fn=lambda current_metric, previous_best: current_metric < previous_best,
@@ -986,16 +1239,17 @@ def get_trainer_ep_source(
         }
 
 
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        key_metric_negative_sign=True,
-        final_filename="pretrained_deepedit_" + args.target_dataset + "-final.pt",
-        file_prefix=args.target_dataset,
-    ).attach(evaluator_2)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            key_metric_negative_sign=True,
+            final_filename="pretrained_deepedit_" + args.target_dataset + "-final.pt",
+            file_prefix=args.target_dataset,
+        ).attach(evaluator_2)
 
 
 
@@ -1057,21 +1311,39 @@ def get_trainer_dynunet(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
 
-    val_loader_1 = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_2 = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+    val_loader_1 = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_2 = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
-    post_transform = get_post_transforms(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network(args.labels, discriminator=False, extreme_points=False, segmentation=True)
+    networks = get_network(
+        args.labels,
+        discriminator=False,
+        extreme_points=False,
+        segmentation=True,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[1] = networks[1].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
 
@@ -1092,38 +1364,61 @@ def get_trainer_dynunet(
         val_additional_metrics = get_additional_metrics(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_1 = SupervisedEvaluatorDynUnet(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_1,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ),
     )
     evaluator_2 = SupervisedEvaluatorDynUnet(  
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_2,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ),
     )
+
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        SupervisedEvaluatorDynUnet,
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+        amp=args.amp,
+    )
+    validator_1, validator_2 = get_validators(args, [evaluator_1, evaluator_2], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_1 = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_2 = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_1 = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_2 = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_1 = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_2 = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_1 = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_2 = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader(args, pre_transforms_train_source=pre_transforms_train_1, pre_transforms_train_target=pre_transforms_train_2)
 
 
@@ -1136,11 +1431,13 @@ def get_trainer_dynunet(
 
     train_handlers = get_train_handlers_separate(
         lr_scheduler,
-        evaluator_1,
-        evaluator_2,
+        validator_1,
+        validator_2,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
     trainer = SupervisedTrainerDynUnet(
@@ -1153,6 +1450,7 @@ def get_trainer_dynunet(
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         train_handlers=train_handlers,
@@ -1180,14 +1478,15 @@ def get_trainer_dynunet(
 
 
 
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        final_filename=f"pretrained_deepedit_{args.target_dataset}" + args.network + "-final.pt",
-    ).attach(evaluator_2)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            final_filename=f"pretrained_deepedit_{args.target_dataset}" + args.network + "-final.pt",
+        ).attach(evaluator_2)
 
 
     if trainer is not None:
@@ -1246,21 +1545,39 @@ def get_trainer_dynunet_source(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
 
-    val_loader_source = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_target = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+    val_loader_source = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_target = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
-    post_transform = get_post_transforms(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network(args.labels, discriminator=False, extreme_points=False, segmentation=True)
+    networks = get_network(
+        args.labels,
+        discriminator=False,
+        extreme_points=False,
+        segmentation=True,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[1] = networks[1].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
 
@@ -1279,40 +1596,62 @@ def get_trainer_dynunet_source(
         val_additional_metrics = get_additional_metrics(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_source = SupervisedEvaluatorDynUnet( 
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_source,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ),
     )
 
     evaluator_target = SupervisedEvaluatorDynUnet( 
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_target,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ),
     )
 
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        SupervisedEvaluatorDynUnet,
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+        amp=args.amp,
+    )
+    validator_source, validator_target = get_validators(args, [evaluator_source, evaluator_target], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader_separate(args, pre_transforms_train_source=pre_transforms_train_source, pre_transforms_train_target=pre_transforms_train_target)
 
 
@@ -1325,11 +1664,13 @@ def get_trainer_dynunet_source(
 
     train_handlers = get_train_handlers_separate(
         lr_scheduler,
-        evaluator_source,
-        evaluator_target,
+        validator_source,
+        validator_target,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
     trainer = SupervisedTrainerDynUnet(
@@ -1342,6 +1683,7 @@ def get_trainer_dynunet_source(
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         train_handlers=train_handlers,
@@ -1370,14 +1712,15 @@ def get_trainer_dynunet_source(
 
 
 
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        final_filename="pretrained_deepedit_target" + args.network + "-final.pt",
-    ).attach(evaluator_target)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            final_filename="pretrained_deepedit_target" + args.network + "-final.pt",
+        ).attach(evaluator_target)
 
 
     if trainer is not None:
@@ -1439,21 +1782,39 @@ def get_trainer_dualdynunet(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
 
-    val_loader_source = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_target = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+    val_loader_source = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_target = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
-    post_transform = get_post_transforms_dual_dynunet(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms_dual_dynunet(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms_dual_dynunet(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network_ugda(args.labels, discriminator=False, extreme_points=True, segmentation=True)
+    networks = get_network_ugda(
+        args.labels,
+        discriminator=False,
+        extreme_points=True,
+        segmentation=True,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[0] = networks[0].to(sw_device)
     networks[1] = networks[1].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
@@ -1475,42 +1836,64 @@ def get_trainer_dualdynunet(
         val_additional_metrics = get_additional_metrics(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_source = SupervisedEvaluatorDualDynUnet(
         args=args,
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_source,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ),
     )
 
     evaluator_target = SupervisedEvaluatorDualDynUnet(
         args=args,
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_target,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ),
     )
 
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        partial(SupervisedEvaluatorDualDynUnet, args=args),
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+        amp=args.amp,
+    )
+    validator_source, validator_target = get_validators(args, [evaluator_source, evaluator_target], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader_separate(args, pre_transforms_train_source=pre_transforms_train_source, pre_transforms_train_target=pre_transforms_train_target)
 
     train_key_metric = get_key_metric(metric = 'dice_mse', str_to_prepend="train_")
@@ -1522,11 +1905,13 @@ def get_trainer_dualdynunet(
 
     train_handlers = get_train_handlers_separate(
         lr_scheduler,
-        evaluator_source,
-        evaluator_target,
+        validator_source,
+        validator_target,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
     trainer = SupervisedTrainerDualDynUNet(
@@ -1540,6 +1925,7 @@ def get_trainer_dualdynunet(
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         train_handlers=train_handlers,
@@ -1553,15 +1939,16 @@ def get_trainer_dualdynunet(
         "opt": optimizer,
         "lr": lr_scheduler,
     }
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        final_filename="pretrained_deepedit_target" + args.target_dataset + "-final.pt",
-        file_prefix=args.target_dataset,
-    ).attach(evaluator_target)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            final_filename="pretrained_deepedit_target" + args.target_dataset + "-final.pt",
+            file_prefix=args.target_dataset,
+        ).attach(evaluator_target)
 
 
     if trainer is not None:
@@ -1623,21 +2010,39 @@ def get_trainer_dextr(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
 
-    val_loader_1 = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_2 = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+    val_loader_1 = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_2 = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
-    post_transform = get_post_transforms(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network(args.labels, discriminator=False, extreme_points=True, segmentation=True)
+    networks = get_network(
+        args.labels,
+        discriminator=False,
+        extreme_points=True,
+        segmentation=True,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[0] = networks[0].to(sw_device)
     networks[1] = networks[1].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
@@ -1660,38 +2065,59 @@ def get_trainer_dextr(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
 
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_1 = SupervisedEvaluatorDextr(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_1,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        postprocessing=val_post_transform,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ),
     )
 
     evaluator_2 = SupervisedEvaluatorDextr(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_2,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        postprocessing=val_post_transform,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ),
     )
 
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        SupervisedEvaluatorDextr,
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+    )
+    validator_1, validator_2 = get_validators(args, [evaluator_1, evaluator_2], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader(args, pre_transforms_train_source=pre_transforms_train_source, pre_transforms_train_target=pre_transforms_train_target)
 
 
@@ -1704,11 +2130,13 @@ def get_trainer_dextr(
 
     train_handlers = get_train_handlers_separate(
         lr_scheduler,
-        evaluator_1,
-        evaluator_2,
+        validator_1,
+        validator_2,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
     trainer = SupervisedTrainerDextr(
@@ -1721,6 +2149,7 @@ def get_trainer_dextr(
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         train_handlers=train_handlers,
@@ -1746,15 +2175,16 @@ def get_trainer_dextr(
                 "lr": lr_scheduler,
         }
 
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        final_filename=f"pretrained_deepedit_{args.target_dataset}" + args.network + "-final.pt",
-        file_prefix=args.target_dataset,
-    ).attach(evaluator_2)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            final_filename=f"pretrained_deepedit_{args.target_dataset}" + args.network + "-final.pt",
+            file_prefix=args.target_dataset,
+        ).attach(evaluator_2)
 
 
     if trainer is not None:
@@ -1816,21 +2246,39 @@ def get_trainer_dextr_source(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
 
-    val_loader_source = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_target = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+    val_loader_source = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_target = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
-    post_transform = get_post_transforms(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network(args.labels, discriminator=False, extreme_points=True, segmentation=True)
+    networks = get_network(
+        args.labels,
+        discriminator=False,
+        extreme_points=True,
+        segmentation=True,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[0] = networks[0].to(sw_device)
     networks[1] = networks[1].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
@@ -1853,38 +2301,59 @@ def get_trainer_dextr_source(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
 
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_1 = SupervisedEvaluatorDextr(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_source,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        postprocessing=val_post_transform,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ),
     )
 
     evaluator_2 = SupervisedEvaluatorDextr(
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_target,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        postprocessing=val_post_transform,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ),
     )
 
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        SupervisedEvaluatorDextr,
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+    )
+    validator_1, validator_2 = get_validators(args, [evaluator_1, evaluator_2], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader_separate(args, pre_transforms_train_source=pre_transforms_train_source, pre_transforms_train_target=pre_transforms_train_target)
 
 
@@ -1897,11 +2366,13 @@ def get_trainer_dextr_source(
 
     train_handlers = get_train_handlers_separate(
         lr_scheduler,
-        evaluator_1,
-        evaluator_2,
+        validator_1,
+        validator_2,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
     trainer = SupervisedTrainerDextr(
@@ -1915,6 +2386,7 @@ def get_trainer_dextr_source(
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         train_handlers=train_handlers,
@@ -1939,15 +2411,16 @@ def get_trainer_dextr_source(
                 "lr": lr_scheduler,
         }
 
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        final_filename=f"pretrained_deepedit_{args.target_dataset}" + args.network + "-final.pt",
-        file_prefix=args.target_dataset,
-    ).attach(evaluator_2)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            final_filename=f"pretrained_deepedit_{args.target_dataset}" + args.network + "-final.pt",
+            file_prefix=args.target_dataset,
+        ).attach(evaluator_2)
 
 
     if trainer is not None:
@@ -2011,21 +2484,39 @@ def get_trainer_pada(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
 
-    val_loader_source = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_target = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+    val_loader_source = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_target = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
-    post_transform = get_post_transforms(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network(args.labels, discriminator=True, extreme_points=args.extreme_points, segmentation=True)
+    networks = get_network(
+        args.labels,
+        discriminator=True,
+        extreme_points=args.extreme_points,
+        segmentation=True,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[1] = networks[1].to(sw_device)
     networks[2] = networks[2].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
@@ -2051,42 +2542,64 @@ def get_trainer_pada(
         val_additional_metrics = get_additional_metrics(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_source = SupervisedEvaluatorPada(
         args=args,
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_source,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ),
     )
 
     evaluator_target = SupervisedEvaluatorPada(
         args=args,
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_target,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ),
     )
 
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        partial(SupervisedEvaluatorPada, args=args),
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+        amp=args.amp,
+    )
+    validator_source, validator_target = get_validators(args, [evaluator_source, evaluator_target], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader(args, pre_transforms_train_source=pre_transforms_train_source, pre_transforms_train_target=pre_transforms_train_target)
 
 
@@ -2099,24 +2612,32 @@ def get_trainer_pada(
 
     train_handlers = get_train_handlers_separate_adv(
         lr_scheduler,
-        evaluator_source,
-        evaluator_target,
+        validator_source,
+        validator_target,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
+    if args.paired_adv_step:
+        # one iteration per (source, target) pair instead of one per batch
+        train_loader = PairedBatchLoader(train_loader)
+
     trainer = SupervisedTrainerPada(
         args=args,
         device=device,
         max_epochs=args.epochs,
         train_data_loader=train_loader,
+        epoch_length=len(train_loader),
         networks=networks,
         optimizer=optimizer,
         loss_function=loss_functions,
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         train_handlers=train_handlers,
@@ -2132,15 +2653,16 @@ def get_trainer_pada(
         "lr_seg": lr_scheduler[0],
         "lr_dis": lr_scheduler[1],
     }
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        final_filename="pretrained_deepedit_target" + args.target_dataset + "-final.pt",
-        file_prefix=args.target_dataset,
-    ).attach(evaluator_target)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            final_filename="pretrained_deepedit_target" + args.target_dataset + "-final.pt",
+            file_prefix=args.target_dataset,
+        ).attach(evaluator_target)
 
 
     if trainer is not None:
@@ -2216,21 +2738,39 @@ def get_trainer_ugda(
         - List: List containing training key metric, additional metrics, validation key metric, and additional metrics.
     """
     init(args)
-    device = torch.device(f"cuda:{args.gpu}") if not args.sw_cpu_output else "cpu"
-    sw_device = torch.device(f"cuda:{args.gpu}")
+    device, sw_device = get_devices(args)
+    val_device, val_sw_device = get_val_devices(args, device, sw_device)
     if args.source_dataset == 'image_ct':
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_val_source = Compose(get_pre_transforms_val_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_val_target = Compose(get_pre_transforms_val_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_val_source = compose_pre_transforms(args, get_pre_transforms_val_as_list_mri(args.labels, val_device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_val_target = compose_pre_transforms(args, get_pre_transforms_val_as_list_ct(args.labels, val_device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
 
-    val_loader_source = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_source, dataset='source')
-    val_loader_target = get_val_loader_separate(args, pre_transforms_val=pre_transforms_val_target, dataset='target')
+    val_loader_source = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_source, dataset='source', device=val_device
+    )
+    val_loader_target = get_val_loader_separate(
+        args, pre_transforms_val=pre_transforms_val_target, dataset='target', device=val_device
+    )
 
-    post_transform = get_post_transforms(args.labels, save_pred=args.save_pred, output_dir=args.output_dir)
+    post_transform = get_post_transforms(
+        args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=sw_device
+    )
+    val_post_transform = post_transform
+    if val_sw_device != sw_device:
+        val_post_transform = get_post_transforms(
+            args.labels, save_pred=args.save_pred, output_dir=args.output_dir, device=val_sw_device
+        )
 
-    networks = get_network_ugda(args.labels, discriminator=True, extreme_points=True, segmentation=True)
+    networks = get_network_ugda(
+        args.labels,
+        discriminator=True,
+        extreme_points=True,
+        segmentation=True,
+        activation_checkpointing=args.activation_checkpointing,
+        checkpoint_every=args.checkpoint_every,
+    )
     networks[1] = networks[1].to(sw_device)
     networks[2] = networks[2].to(sw_device)
     train_inferer, eval_inferer = get_inferers()
@@ -2256,42 +2796,64 @@ def get_trainer_ugda(
         val_additional_metrics = get_additional_metrics(
             args.labels, include_background=False, loss_kwargs=loss_kwargs, str_to_prepend="val_"
         )
+    # --async_val: the evaluators validate a copy of the networks in the background
+    snapshot = get_weight_snapshot(args, networks, val_sw_device)
+    eval_networks = networks if snapshot is None else snapshot.copies
+
     evaluator_source = SupervisedEvaluatorUgda(
         args=args,
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_source,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_source_",
         ),
     )
 
     evaluator_target = SupervisedEvaluatorUgda(
         args=args,
-        device=device,
+        device=val_device,
         val_data_loader=val_loader_target,
-        networks=networks,
+        networks=eval_networks,
         inferer=eval_inferer,
-        postprocessing=post_transform,
+        postprocessing=val_post_transform,
         amp=args.amp,
-        key_val_metric=val_key_metric,
-        additional_metrics=val_additional_metrics,
+        key_val_metric=copy_metrics(val_key_metric),
+        additional_metrics=copy_metrics(val_additional_metrics),
         val_handlers=get_val_handlers(
             garbage_collector=True,
+            log_interval=args.metric_log_interval,
+            metric_prefix="val_target_",
         ),
     )
 
+    # tiered validation (--val_subset_size): a val subset every --val_freq epochs, the whole val set less often
+    subset_evaluators = get_subset_evaluators(
+        args,
+        partial(SupervisedEvaluatorUgda, args=args),
+        val_device,
+        eval_networks,
+        eval_inferer,
+        val_post_transform,
+        val_key_metric,
+        val_additional_metrics,
+        amp=args.amp,
+    )
+    validator_source, validator_target = get_validators(args, [evaluator_source, evaluator_target], subset_evaluators)
+
     if args.source_dataset == 'image_ct':
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     else:
-        pre_transforms_train_source = Compose(get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
-        pre_transforms_train_target = Compose(get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
+        pre_transforms_train_source = compose_pre_transforms(args, get_pre_transforms_train_as_list_mri(args.labels, device, args, input_keys=('image_source', 'label'), image='image_source', label='label'))
+        pre_transforms_train_target = compose_pre_transforms(args, get_pre_transforms_train_as_list_ct(args.labels, device, args, input_keys=('image_target', 'label'), image='image_target', label='label'))
     train_loader = get_train_loader(args, pre_transforms_train_source=pre_transforms_train_source, pre_transforms_train_target=pre_transforms_train_target)
 
 
@@ -2304,24 +2866,32 @@ def get_trainer_ugda(
 
     train_handlers = get_train_handlers_separate_adv(
         lr_scheduler,
-        evaluator_source,
-        evaluator_target,
+        validator_source,
+        validator_target,
         args.val_freq,
         args.eval_only,
         garbage_collector=True,
+        log_interval=args.metric_log_interval,
+        snapshot=snapshot,
     )
 
+    if args.paired_adv_step:
+        # one iteration per (source, target) pair instead of one per batch
+        train_loader = PairedBatchLoader(train_loader)
+
     trainer = SupervisedTrainerUgda(
         args=args,
         device=device,
         max_epochs=args.epochs,
         train_data_loader=train_loader,
+        epoch_length=len(train_loader),
         networks=networks,
         optimizer=optimizer,
         loss_function=loss_functions,
         inferer=train_inferer,
         postprocessing=post_transform,
         amp=args.amp,
+        accumulate_steps=args.accumulate_steps,
         key_train_metric=train_key_metric,
         additional_metrics=train_additional_metrics,
         train_handlers=train_handlers,
@@ -2338,15 +2908,16 @@ def get_trainer_ugda(
         "lr_dis": lr_scheduler[1],
     }
 
-    CheckpointSaver(
-        save_dir=args.output_dir,
-        save_dict=save_dict,
-        save_key_metric=True,
-        save_final=True,
-        save_interval=args.save_interval,
-        final_filename="pretrained_deepedit_target" + args.target_dataset + "-final.pt",
-        file_prefix=args.target_dataset,
-    ).attach(evaluator_target)
+    if is_main_process():
+        CheckpointSaver(
+            save_dir=args.output_dir,
+            save_dict=save_dict if snapshot is None else snapshot.save_dict(save_dict),
+            save_key_metric=True,
+            save_final=True,
+            save_interval=args.save_interval,
+            final_filename="pretrained_deepedit_target" + args.target_dataset + "-final.pt",
+            file_prefix=args.target_dataset,
+        ).attach(evaluator_target)
 
 
     if trainer is not None:
@@ -2413,6 +2984,7 @@ def init(args):
 
     Notes:
         - This function is intended to be executed only once during the program's lifetime.
+        - Joins the process group if started with torchrun, see `init_distributed`.
 
     """
 
@@ -2420,9 +2992,11 @@ def init(args):
     # for OOM debugging
     output_dir = args.output_dir
     sys.excepthook = handle_exception
+    init_distributed(args)
 
     if not is_docker():
-        torch.set_num_threads(int(os.cpu_count() / 3))  # Limit number of threads to 1/3 of resources
+        # Limit number of threads to 1/3 of resources, shared by the ranks on this machine
+        torch.set_num_threads(max(int(os.cpu_count() / 3 / get_local_world_size()), 1))
     if args.limit_gpu_memory_to != -1:
         limit = args.limit_gpu_memory_to
         assert limit > 0 and limit < 1, f"Percentage GPU memory limit is invalid! {limit} > 0 or < 1"
@@ -2432,6 +3006,12 @@ def init(args):
     torch.backends.cudnn.allow_tf32 = True
     torch.backends.cudnn.deterministic = True
 
+    if args.save_pred:
+        set_writer_threads(args.save_pred_workers)
+    set_sanity_check_interval(args.sanity_check_interval)
+    if not args.no_log and is_main_process():
+        set_summary_writer(os.path.join(args.output_dir, "tensorboard"))
+
     # DO NOT TOUCH UNLESS YOU KNOW WHAT YOU ARE DOING..
     # I WARNED YOU..
     set_track_meta(True)
@@ -2441,7 +3021,7 @@ def init(args):
 
     set_determinism(seed=args.seed)
 
-    if not is_docker():
+    if not is_docker() and torch.cuda.is_available():
         with cp.cuda.Device(args.gpu):
             cp.random.seed(seed=args.seed)
 
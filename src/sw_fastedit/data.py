@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import glob
 import logging
 import os
+import random
 
 from pathlib import Path
 from typing import Dict, List
@@ -10,11 +10,11 @@ from typing import Dict, List
 import numpy as np
 import torch
 from torch.utils.data import ConcatDataset
-from monai.data import ThreadDataLoader
-from monai.data.dataset import PersistentDataset
+from monai.data import DataLoader, DistributedSampler, ThreadDataLoader, list_data_collate, pad_list_data_collate
+from monai.data.utils import set_rnd
 from monai.data.folder_layout import FolderLayout
 from monai.transforms import (
-    Activationsd,
+    CastToTyped,
     Compose,
     CopyItemsd,
     DivisiblePadd,
@@ -22,18 +22,30 @@ from monai.transforms import (
     Identityd,
     LoadImaged,
     Orientationd,
+    RandCropByPosNegLabeld,
     RandFlipd,
     RandRotate90d,
     SaveImaged,
     ScaleIntensityRanged,
-    ScaleIntensityRangePercentilesd,
     SignalFillEmptyd,
     Spacingd,
+    SpatialPadd,
     ToTensord,
 )
+from monai.transforms.traits import LazyTrait
 from monai.utils.enums import CommonKeys
 
-from sw_fastedit.utils.costum_sampler import AlternatingSampler, SpecificSampler
+from sw_fastedit.utils.prepare_batch import BatchPrefetcher
+from sw_fastedit.utils.manifest import filter_cases, get_manifest, select_stratified_cases
+from sw_fastedit.utils.costum_sampler import (
+    AlternatingSampler,
+    DistributedAlternatingSampler,
+    DistributedSpecificSampler,
+    ShapeBucketBatchSampler,
+    SpecificSampler,
+)
+from sw_fastedit.utils.distributed import get_rank, get_world_size
+from sw_fastedit.utils.volume_store import MemmapDataset
 
 from sw_fastedit.helper_transforms import (
     InitLoggerd,
@@ -41,12 +53,18 @@ from sw_fastedit.helper_transforms import (
 )
 from sw_fastedit.transforms import (
     AddExtremePointsChanneld,
+    AddSeededExtremePointsChanneld,
+    AsyncSaveImaged,
+    AddForegroundIndexd,
+    CropForegroundRegiond,
+    PasteForegroundCropd,
     NormalizeLabelsInDatasetd,
     AddGuidanceSignald,
     SplitDimd,
     SaveImagedSlices,
     AsDiscreted,
     ZScoreNormalized,
+    ScaleIntensityHistogramPercentilesd,
 
 )
 from sw_fastedit.utils.helper import convert_mha_to_nii, convert_nii_to_mha
@@ -55,15 +73,18 @@ logger = logging.getLogger("sw_fastedit")
 
 
 dataset_names = ["AMOS"]
+# Product of the DynUNet strides [1, 2, 2, 2, 2, [2, 2, 1]] in get_network, z is only downsampled four times
+DIVISIBLE_K = (32, 32, 16)
 
 
 
-def get_spacing(args):
+def get_spacing(args, scale: float = 1.0):
     """
     Get the voxel spacing for the specified dataset.
 
     Args:
         args: Additional arguments containing the dataset information.
+        scale (float): Multiplies the spacing, e.g. --val_subset_spacing_scale for a coarser val subset.
 
     Returns:
         Tuple: A tuple representing the voxel spacing in (x, y, z) dimensions.
@@ -79,11 +100,100 @@ def get_spacing(args):
     AMOS_SPACING = (3*1.0, 3*1.0, 3*1.5)
 
     if args.dataset == "AMOS":
-        return AMOS_SPACING
+        spacing = AMOS_SPACING
     else:
         raise UserWarning(f"No valid dataset found: {args.dataset}")
+    return tuple(s * scale for s in spacing)
+
+def get_crop_foreground_transform(args, image_type, input_keys, image, label, train: bool):
+    """
+    Crop stage of --crop_foreground, placed between the resampling and the intensity normalization.
+
+    Args:
+        args: Command line arguments, uses args.crop_foreground, args.organ and args.organ_crop_margin.
+        image_type (str): Either 'CT' or 'MRI', selects the body mask.
+        input_keys (tuple): The keys which get cropped.
+        image (str): Image key the body mask is computed from.
+        label (str): Label key for the organ crop.
+        train (bool): The organ crop (--organ_crop_margin) is only applied to training cases.
+
+    Returns:
+        A `CropForegroundRegiond`, or an `Identityd` without --crop_foreground.
+    """
+    if not args.crop_foreground:
+        return Identityd(keys=input_keys, allow_missing_keys=True)
+    return CropForegroundRegiond(
+        keys=input_keys,
+        source_key=image,
+        image_type=image_type,
+        label_key=label,
+        organ=args.organ if train and args.organ_crop_margin is not None else None,
+        organ_margin=args.organ_crop_margin or 0,
+        allow_missing_keys=True,
+    )
 
-def get_pre_transforms_train_as_list_ct(labels: Dict, device, args, input_keys, label, image):
+
+def get_patch_sampling_transforms(args, image) -> List:
+    """
+    Patch sampling at the end of the training pre transforms for --roi_size.
+
+    The extreme point heatmap has already been rendered on the whole volume at this point, so every patch sees
+    the part of the guidance channel which belongs to it.
+
+    Args:
+        args: Command line arguments, uses args.roi_size, args.num_patches and args.positive_crop_rate.
+        image (str): The image key.
+
+    Returns:
+        List: SpatialPadd to the ROI size and RandCropByPosNegLabeld with --num_patches samples per volume,
+        centered on the organ with probability --positive_crop_rate. Empty without --roi_size.
+    """
+    if args.roi_size is None:
+        return []
+    if any(size % k != 0 for size, k in zip(args.roi_size, DIVISIBLE_K)):
+        raise UserWarning(f"--roi_size {args.roi_size} has to be divisible by {DIVISIBLE_K} like the padded volumes")
+    keys = (image, "label", "label_0", "label_1", "label_seg", "label_ep")
+    return [
+        SpatialPadd(keys=keys, spatial_size=args.roi_size, value=0, allow_missing_keys=True),
+        RandCropByPosNegLabeld(
+            keys=keys,
+            label_key="label_seg",
+            spatial_size=args.roi_size,
+            pos=args.positive_crop_rate,
+            neg=1 - args.positive_crop_rate,
+            num_samples=args.num_patches,
+            allow_missing_keys=True,
+        ),
+    ]
+
+
+def compose_pre_transforms(args, transforms: List) -> Compose:
+    """
+    Compose a list of pre-transforms, optionally in MONAI's lazy resampling mode.
+
+    Args:
+        args: Additional arguments, uses args.lazy_resampling.
+        transforms (List): The output of one of the get_pre_transforms_*_as_list functions.
+
+    Returns:
+        Compose: The composed pre-transforms.
+
+    Note:
+        With --lazy_resampling adjacent spatial transforms (Orientationd, both Spacingds and DivisiblePadd in the
+        cached part, the RandFlipds and RandRotate90d in the random part) only accumulate their affines. Image and
+        label are then resampled once per run of adjacent spatial transforms, with the interpolation mode of the
+        respective Spacingd. TrackTimed wrappers of lazy transforms are removed, otherwise they would force the
+        pending operations to be applied after every step.
+    """
+    if not args.lazy_resampling:
+        return Compose(transforms)
+    transforms = [
+        t.transform if isinstance(t, TrackTimed) and isinstance(t.transform, LazyTrait) else t for t in transforms
+    ]
+    return Compose(transforms, lazy=True)
+
+
+def get_pre_transforms_train_as_list_ct(labels: Dict, device, args, input_keys, label, image, spacing_scale=1.0):
     """
     Get a list of pre-transforms for training data.
 
@@ -92,6 +202,7 @@ def get_pre_transforms_train_as_list_ct(labels: Dict, device, args, input_keys,
         device: The device on which to perform the transformations.
         args: Additional arguments containing information for preprocessing.
         input_keys (tuple): Tuple of input keys, default is ("image", "label").
+        spacing_scale (float): Multiplies the spacing, see `get_spacing`.
 
     Returns:
         List: A list of pre-transforms for training data.
@@ -101,7 +212,7 @@ def get_pre_transforms_train_as_list_ct(labels: Dict, device, args, input_keys,
         It includes operations such as loading images, normalization, cropping, flipping, and more.
     """
     cpu_device = torch.device("cpu")
-    spacing = get_spacing(args)
+    spacing = get_spacing(args, spacing_scale)
     if args.debug:
         loglevel = logging.DEBUG
     else:
@@ -122,13 +233,14 @@ def get_pre_transforms_train_as_list_ct(labels: Dict, device, args, input_keys,
             ),
             ToTensord(keys=input_keys, device=cpu_device, track_meta=True),
             EnsureChannelFirstd(keys=input_keys),
-            NormalizeLabelsInDatasetd(keys=label, labels=labels, device=cpu_device),
             Orientationd(keys=input_keys, axcodes="RAS"),
             Spacingd(keys=image, pixdim=spacing),
             Spacingd(keys=label, pixdim=spacing, mode="nearest") if (label in input_keys) else Identityd(keys=input_keys),
+            get_crop_foreground_transform(args, "CT", input_keys, image, label, train=True),
             # 0.05 and 99.95 percentiles of the spleen HUs, either manually or automatically (only for MRI)
-            ScaleIntensityRangePercentilesd(
-                keys=image, lower=0.05, upper=99.95, b_min=0.0, b_max=1.0, clip=True, relative=False
+            ScaleIntensityHistogramPercentilesd(
+                keys=image, lower=0.05, upper=99.95, b_min=0.0, b_max=1.0, clip=True, relative=False,
+                stats_dir=args.cache_dir,
             ) if args.same_normalization else (
                 ScaleIntensityRanged(
                     keys=image, a_min=-45, a_max=105, b_min=-1.0, b_max=1.0, clip=True
@@ -136,12 +248,16 @@ def get_pre_transforms_train_as_list_ct(labels: Dict, device, args, input_keys,
                     ScaleIntensityRanged(
                         keys=image, a_min=-150, a_max=250, b_min=-1.0, b_max=1.0, clip=True
                     ) if args.organ in [7, 10] else
-                    ScaleIntensityRangePercentilesd(
-                        keys=image, lower=0.05, upper=99.95, b_min=-1.0, b_max=1.0, clip=True, relative=False
+                    ScaleIntensityHistogramPercentilesd(
+                        keys=image, lower=0.05, upper=99.95, b_min=-1.0, b_max=1.0, clip=True, relative=False,
+                        stats_dir=args.cache_dir,
                     )
                 )
             ),
-            DivisiblePadd(keys=input_keys, k=32, value=0),   
+            DivisiblePadd(keys=input_keys, k=DIVISIBLE_K, value=0),
+            # The index keeps the raw organ ids, so it has to be built before the labels get normalized
+            AddForegroundIndexd(keys=label),
+            NormalizeLabelsInDatasetd(keys=label, labels=labels, device=cpu_device),
             #Data augmentation
             RandFlipd(keys=input_keys, spatial_axis=[0], prob=0.10),
             RandFlipd(keys=input_keys, spatial_axis=[1], prob=0.10),
@@ -155,8 +271,10 @@ def get_pre_transforms_train_as_list_ct(labels: Dict, device, args, input_keys,
             AddGuidanceSignald(keys=label,sigma=args.sigma),
             SplitDimd(keys=('label')),
             CopyItemsd(keys=("label_0", "label_1"), times=1,
-                    names=("label_seg", "label_ep"), allow_missing_keys=True)
-         
+                    names=("label_seg", "label_ep"), allow_missing_keys=True),
+            # label_0 is split off the float label + heatmap stack, keep the segmentation uint8 up to the loss / metric
+            CastToTyped(keys=("label_0", "label_seg"), dtype=torch.uint8, allow_missing_keys=True),
+            *get_patch_sampling_transforms(args, image),
 
             # Move to GPU
             # WARNING: Activating the line below leads to minimal gains in performance
@@ -174,7 +292,7 @@ def get_pre_transforms_train_as_list_ct(labels: Dict, device, args, input_keys,
     return t
 
 
-def get_pre_transforms_train_as_list_mri(labels: Dict, device, args, input_keys, label, image):
+def get_pre_transforms_train_as_list_mri(labels: Dict, device, args, input_keys, label, image, spacing_scale=1.0):
     """
     Get a list of pre-transforms for training data.
 
@@ -183,6 +301,7 @@ def get_pre_transforms_train_as_list_mri(labels: Dict, device, args, input_keys,
         device: The device on which to perform the transformations.
         args: Additional arguments containing information for preprocessing.
         input_keys (tuple): Tuple of input keys, default is ("image", "label").
+        spacing_scale (float): Multiplies the spacing, see `get_spacing`.
 
     Returns:
         List: A list of pre-transforms for training data.
@@ -192,7 +311,7 @@ def get_pre_transforms_train_as_list_mri(labels: Dict, device, args, input_keys,
         It includes operations such as loading images, normalization, cropping, flipping, and more.
     """
     cpu_device = torch.device("cpu")
-    spacing = get_spacing(args)
+    spacing = get_spacing(args, spacing_scale)
     if args.debug:
         loglevel = logging.DEBUG
     else:
@@ -212,17 +331,21 @@ def get_pre_transforms_train_as_list_mri(labels: Dict, device, args, input_keys,
             ),
             ToTensord(keys=input_keys, device=cpu_device, track_meta=True),
             EnsureChannelFirstd(keys=input_keys),
-            NormalizeLabelsInDatasetd(keys=label, labels=labels, device=cpu_device),
             Orientationd(keys=input_keys, axcodes="RAS"),
             Spacingd(keys=image, pixdim=spacing),
             Spacingd(keys=label, pixdim=spacing, mode="nearest") if (label in input_keys) else Identityd(keys=input_keys),
+            get_crop_foreground_transform(args, "MRI", input_keys, image, label, train=True),
             # 0.05 and 99.95 percentiles of the spleen HUs, either manually or automatically (only for MRI)
-            ScaleIntensityRangePercentilesd(
-                keys=image, lower=0.05, upper=99.95, b_min=0.0, b_max=1.0, clip=True, relative=False
+            ScaleIntensityHistogramPercentilesd(
+                keys=image, lower=0.05, upper=99.95, b_min=0.0, b_max=1.0, clip=True, relative=False,
+                stats_dir=args.cache_dir,
             ) if args.same_normalization else (
-                ZScoreNormalized(keys=image, clip=True)
+                ZScoreNormalized(keys=image, clip=True, stats_dir=args.cache_dir)
             ),
-            DivisiblePadd(keys=input_keys, k=32, value=0),   
+            DivisiblePadd(keys=input_keys, k=DIVISIBLE_K, value=0),
+            # The index keeps the raw organ ids, so it has to be built before the labels get normalized
+            AddForegroundIndexd(keys=label),
+            NormalizeLabelsInDatasetd(keys=label, labels=labels, device=cpu_device),
             #Data augmentation
             RandFlipd(keys=input_keys, spatial_axis=[0], prob=0.10),
             RandFlipd(keys=input_keys, spatial_axis=[1], prob=0.10),
@@ -236,8 +359,10 @@ def get_pre_transforms_train_as_list_mri(labels: Dict, device, args, input_keys,
             AddGuidanceSignald(keys=label,sigma=args.sigma),
             SplitDimd(keys=('label')),
             CopyItemsd(keys=("label_0", "label_1"), times=1,
-                    names=("label_seg", "label_ep"), allow_missing_keys=True)
-         
+                    names=("label_seg", "label_ep"), allow_missing_keys=True),
+            # label_0 is split off the float label + heatmap stack, keep the segmentation uint8 up to the loss / metric
+            CastToTyped(keys=("label_0", "label_seg"), dtype=torch.uint8, allow_missing_keys=True),
+            *get_patch_sampling_transforms(args, image),
 
             # Move to GPU
             # WARNING: Activating the line below leads to minimal gains in performance
@@ -255,7 +380,7 @@ def get_pre_transforms_train_as_list_mri(labels: Dict, device, args, input_keys,
     return t
 
 
-def get_pre_transforms_val_as_list_ct(labels: Dict, device, args, input_keys, label, image):
+def get_pre_transforms_val_as_list_ct(labels: Dict, device, args, input_keys, label, image, spacing_scale=1.0):
     """
     Get a list of pre-transforms for validation data.
 
@@ -264,6 +389,7 @@ def get_pre_transforms_val_as_list_ct(labels: Dict, device, args, input_keys, la
         device: The device on which to perform the transformations.
         args: Additional arguments containing information for preprocessing.
         input_keys (tuple): Tuple of input keys, default is ("image", "label").
+        spacing_scale (float): Multiplies the spacing, see `get_spacing`.
 
     Returns:
         List: A list of pre-transforms for validation data.
@@ -273,7 +399,7 @@ def get_pre_transforms_val_as_list_ct(labels: Dict, device, args, input_keys, la
         It includes operations such as loading images, normalization, cropping, and more.
     """
     cpu_device = torch.device("cpu")
-    spacing = get_spacing(args)
+    spacing = get_spacing(args, spacing_scale)
 
     if args.debug:
         loglevel = logging.DEBUG
@@ -289,12 +415,13 @@ def get_pre_transforms_val_as_list_ct(labels: Dict, device, args, input_keys, la
             ),  # necessary if the dataloader runs in an extra thread / process
             LoadImaged(keys=input_keys, reader="ITKReader", image_only=False),
             EnsureChannelFirstd(keys=input_keys),
-            NormalizeLabelsInDatasetd(keys=label, labels=labels, device=cpu_device, allow_missing_keys=True),
             Orientationd(keys=input_keys, axcodes="RAS"),
             Spacingd(keys=image, pixdim=spacing),
             Spacingd(keys=label, pixdim=spacing, mode="nearest") if (label in input_keys) else Identityd(keys=input_keys, allow_missing_keys=True),
-            ScaleIntensityRangePercentilesd(
-                keys=image, lower=0.05, upper=99.95, b_min=0.0, b_max=1.0, clip=True, relative=False
+            get_crop_foreground_transform(args, "CT", input_keys, image, label, train=False),
+            ScaleIntensityHistogramPercentilesd(
+                keys=image, lower=0.05, upper=99.95, b_min=0.0, b_max=1.0, clip=True, relative=False,
+                stats_dir=args.cache_dir,
             ) if args.same_normalization else (
                 ScaleIntensityRanged(
                     keys=image, a_min=-45, a_max=105, b_min=-1.0, b_max=1.0, clip=True
@@ -302,18 +429,26 @@ def get_pre_transforms_val_as_list_ct(labels: Dict, device, args, input_keys, la
                     ScaleIntensityRanged(
                         keys=image, a_min=-150, a_max=250, b_min=-1.0, b_max=1.0, clip=True
                     ) if args.organ in [7, 10] else
-                    ScaleIntensityRangePercentilesd(
-                        keys=image, lower=0.05, upper=99.95, b_min=-1.0, b_max=1.0, clip=True, relative=False
+                    ScaleIntensityHistogramPercentilesd(
+                        keys=image, lower=0.05, upper=99.95, b_min=-1.0, b_max=1.0, clip=True, relative=False,
+                        stats_dir=args.cache_dir,
                     )
                 )
             ),
-            DivisiblePadd(keys=input_keys, k=32, value=0),
-            #add ground truth extreme points to label
-            AddExtremePointsChanneld(label_names = args.labels,keys = label, label_key = label,sigma = args.sigma,),
+            DivisiblePadd(keys=input_keys, k=DIVISIBLE_K, value=0),
+            # The index keeps the raw organ ids, so it has to be built before the labels get normalized
+            AddForegroundIndexd(keys=label, allow_missing_keys=True),
+            NormalizeLabelsInDatasetd(keys=label, labels=labels, device=cpu_device, allow_missing_keys=True),
+            # add ground truth extreme points to label, seeded per case so that the whole val sample is cached
+            AddSeededExtremePointsChanneld(
+                label_names=args.labels, keys=label, label_key=label, sigma=args.sigma, seed=args.seed
+            ),
             AddGuidanceSignald(keys=label,sigma=args.sigma),
             SplitDimd(keys=('label')),
             CopyItemsd(keys=("label_0", "label_1"), times=1,
-                    names=("label_seg", "label_ep"), allow_missing_keys=True)
+                    names=("label_seg", "label_ep"), allow_missing_keys=True),
+            # label_0 is split off the float label + heatmap stack, keep the segmentation uint8 up to the loss / metric
+            CastToTyped(keys=("label_0", "label_seg"), dtype=torch.uint8, allow_missing_keys=True),
     
         ]
         
@@ -324,7 +459,7 @@ def get_pre_transforms_val_as_list_ct(labels: Dict, device, args, input_keys, la
     return t
 
 
-def get_pre_transforms_val_as_list_mri(labels: Dict, device, args, input_keys, label, image):
+def get_pre_transforms_val_as_list_mri(labels: Dict, device, args, input_keys, label, image, spacing_scale=1.0):
     """
     Get a list of pre-transforms for validation data.
 
@@ -333,6 +468,7 @@ def get_pre_transforms_val_as_list_mri(labels: Dict, device, args, input_keys, l
         device: The device on which to perform the transformations.
         args: Additional arguments containing information for preprocessing.
         input_keys (tuple): Tuple of input keys, default is ("image", "label").
+        spacing_scale (float): Multiplies the spacing, see `get_spacing`.
 
     Returns:
         List: A list of pre-transforms for validation data.
@@ -342,7 +478,7 @@ def get_pre_transforms_val_as_list_mri(labels: Dict, device, args, input_keys, l
         It includes operations such as loading images, normalization, cropping, and more.
     """
     cpu_device = torch.device("cpu")
-    spacing = get_spacing(args)
+    spacing = get_spacing(args, spacing_scale)
 
     if args.debug:
         loglevel = logging.DEBUG
@@ -357,22 +493,30 @@ def get_pre_transforms_val_as_list_mri(labels: Dict, device, args, input_keys, l
             ),  # necessary if the dataloader runs in an extra thread / process
             LoadImaged(keys=input_keys, reader="ITKReader", image_only=False),
             EnsureChannelFirstd(keys=input_keys),
-            NormalizeLabelsInDatasetd(keys=label, labels=labels, device=cpu_device, allow_missing_keys=True),
             Orientationd(keys=input_keys, axcodes="RAS"),
             Spacingd(keys=image, pixdim=spacing),
-            Spacingd(keys=label, pixdim=spacing, mode="nearest") if (label in input_keys) else Identityd(keys=input_keys, allow_missing_keys=True), 
-            ScaleIntensityRangePercentilesd(
-                keys=image, lower=0.05, upper=99.95, b_min=0.0, b_max=1.0, clip=True, relative=False
+            Spacingd(keys=label, pixdim=spacing, mode="nearest") if (label in input_keys) else Identityd(keys=input_keys, allow_missing_keys=True),
+            get_crop_foreground_transform(args, "MRI", input_keys, image, label, train=False),
+            ScaleIntensityHistogramPercentilesd(
+                keys=image, lower=0.05, upper=99.95, b_min=0.0, b_max=1.0, clip=True, relative=False,
+                stats_dir=args.cache_dir,
             ) if args.same_normalization else (
-                ZScoreNormalized(keys=image, clip=True)
+                ZScoreNormalized(keys=image, clip=True, stats_dir=args.cache_dir)
+            ),
+            DivisiblePadd(keys=input_keys, k=DIVISIBLE_K, value=0),
+            # The index keeps the raw organ ids, so it has to be built before the labels get normalized
+            AddForegroundIndexd(keys=label, allow_missing_keys=True),
+            NormalizeLabelsInDatasetd(keys=label, labels=labels, device=cpu_device, allow_missing_keys=True),
+            # add ground truth extreme points to label, seeded per case so that the whole val sample is cached
+            AddSeededExtremePointsChanneld(
+                label_names=args.labels, keys=label, label_key=label, sigma=args.sigma, seed=args.seed
             ),
-            DivisiblePadd(keys=input_keys, k=32, value=0),
-            #add ground truth extreme points to label
-            AddExtremePointsChanneld(label_names = args.labels,keys = label, label_key = label,sigma = args.sigma,),
             AddGuidanceSignald(keys=label,sigma=args.sigma),
             SplitDimd(keys=('label')),
             CopyItemsd(keys=("label_0", "label_1"), times=1,
-                    names=("label_seg", "label_ep"), allow_missing_keys=True)
+                    names=("label_seg", "label_ep"), allow_missing_keys=True),
+            # label_0 is split off the float label + heatmap stack, keep the segmentation uint8 up to the loss / metric
+            CastToTyped(keys=("label_0", "label_seg"), dtype=torch.uint8, allow_missing_keys=True),
     
         ]
         
@@ -397,7 +541,7 @@ def get_device(data):
 
 
 
-def get_post_transforms_dual_dynunet(labels, *, save_pred=False, output_dir=None, pretransform=None):
+def get_post_transforms_dual_dynunet(labels, *, save_pred=False, output_dir=None, pretransform=None, device=None):
     """
     Get the post transforms used for processing and saving predictions.
 
@@ -406,11 +550,13 @@ def get_post_transforms_dual_dynunet(labels, *, save_pred=False, output_dir=None
         save_pred (bool): Flag to indicate whether to save predictions.
         output_dir (str): Output directory for saving predictions.
         pretransform (Compose): Pre-transform to be applied before inverting the prediction.
+        device: Device the metric inputs are moved to, the GPU of this rank in distributed training. Defaults
+            to cuda:0.
 
     Returns:
         Compose: A composition of transforms for post-processing and saving predictions.
     """
-    cuda_device = torch.device("cuda:0")
+    cuda_device = torch.device("cuda:0") if device is None else device
     if save_pred:
         if output_dir is None:
             raise UserWarning("output_dir may not be empty when save_pred is enabled...")
@@ -431,19 +577,24 @@ def get_post_transforms_dual_dynunet(labels, *, save_pred=False, output_dir=None
         if save_pred
         else Identityd(keys=input_keys, allow_missing_keys=True),
 
-        Activationsd(keys=("pred_seg",), softmax=True),
+        # Class indices only, the Dice is computed from their confusion matrix (see utils/metrics.py). A softmax
+        # before the argmax or one-hot volumes of the prediction and the label are not needed for it.
         AsDiscreted(
-            keys="pred_seg_for_save",
+            keys=("pred_seg", "pred_seg_for_save"),
             argmax=True,
+            dtype=torch.uint8,
+            allow_missing_keys=True,
+        ),
+        # Paste the volumes back into the uncropped frame if --crop_foreground was used
+        PasteForegroundCropd(
+            keys=(
+                "pred_seg_for_save", "seg_for_save", "image_for_save_source", "image_for_save_target",
+                "pred_ep_for_save", "pred_ep_processed_for_save", "ep_for_save",
+            ),
+            allow_missing_keys=True,
         )
         if save_pred
         else Identityd(keys=input_keys, allow_missing_keys=True),
-
-        AsDiscreted(
-            keys=("pred_seg", "label"),
-            argmax=(True, False),
-            to_onehot=(len(labels), len(labels)),
-        ),
         SaveImaged(
             keys=("pred_seg_for_save",),
             writer="ITKWriter",
@@ -521,10 +672,12 @@ def get_post_transforms_dual_dynunet(labels, *, save_pred=False, output_dir=None
         ToTensord(keys=("label_ep", "pred_ep"), device=cuda_device, allow_missing_keys=True),
 
     ]
+    # save in the background writer pool instead of inside the evaluator iteration
+    t = [AsyncSaveImaged(x) if isinstance(x, (SaveImaged, SaveImagedSlices)) else x for x in t]
     return Compose(t)
 
 
-def get_post_transforms(labels, *, save_pred=False, output_dir=None, pretransform=None):
+def get_post_transforms(labels, *, save_pred=False, output_dir=None, pretransform=None, device=None):
     """
     Get the post transforms used for processing and saving predictions.
 
@@ -533,11 +686,13 @@ def get_post_transforms(labels, *, save_pred=False, output_dir=None, pretransfor
         save_pred (bool): Flag to indicate whether to save predictions.
         output_dir (str): Output directory for saving predictions.
         pretransform (Compose): Pre-transform to be applied before inverting the prediction.
+        device: Device the metric inputs are moved to, the GPU of this rank in distributed training. Defaults
+            to cuda:0.
 
     Returns:
         Compose: A composition of transforms for post-processing and saving predictions.
     """
-    cuda_device = torch.device("cuda:0")
+    cuda_device = torch.device("cuda:0") if device is None else device
     if save_pred:
         if output_dir is None:
             raise UserWarning("output_dir may not be empty when save_pred is enabled...")
@@ -560,19 +715,23 @@ def get_post_transforms(labels, *, save_pred=False, output_dir=None, pretransfor
         if save_pred
         else Identityd(keys=input_keys, allow_missing_keys=True),
 
-        Activationsd(keys=("pred_seg",), softmax=True),
+        # Class indices only, the Dice is computed from their confusion matrix (see utils/metrics.py). A softmax
+        # before the argmax or one-hot volumes of the prediction and the label are not needed for it.
         AsDiscreted(
-            keys="pred_seg_for_save",
+            keys=("pred_seg", "pred_seg_for_save"),
             argmax=True,
+            dtype=torch.uint8,
+            allow_missing_keys=True,
+        ),
+        # Paste the volumes back into the uncropped frame if --crop_foreground was used
+        PasteForegroundCropd(
+            keys=(
+                "pred_seg_for_save", "seg_for_save", "image_for_save_source", "image_for_save_target",
+            ),
+            allow_missing_keys=True,
         )
         if save_pred
         else Identityd(keys=input_keys, allow_missing_keys=True),
-
-        AsDiscreted(
-            keys=("pred_seg", "label"),
-            argmax=(True, False),
-            to_onehot=(len(labels), len(labels)),
-        ),
         SaveImaged(
             keys=("pred_seg_for_save",),
             writer="ITKWriter",
@@ -612,10 +771,12 @@ def get_post_transforms(labels, *, save_pred=False, output_dir=None, pretransfor
 
         ToTensord(keys=("image_source", "image_target", "label_seg", "pred_seg"), device=cuda_device, allow_missing_keys=True),
     ]
+    # save in the background writer pool instead of inside the evaluator iteration
+    t = [AsyncSaveImaged(x) if isinstance(x, (SaveImaged, SaveImagedSlices)) else x for x in t]
     return Compose(t)
 
 
-def get_post_transforms_ep(labels, *, save_pred=False, output_dir=None, pretransform=None):
+def get_post_transforms_ep(labels, *, save_pred=False, output_dir=None, pretransform=None, device=None):
     """
     Get the post transforms used for processing and saving predictions.
 
@@ -624,11 +785,13 @@ def get_post_transforms_ep(labels, *, save_pred=False, output_dir=None, pretrans
         save_pred (bool): Flag to indicate whether to save predictions.
         output_dir (str): Output directory for saving predictions.
         pretransform (Compose): Pre-transform to be applied before inverting the prediction.
+        device: Device the metric inputs are moved to, the GPU of this rank in distributed training. Defaults
+            to cuda:0.
 
     Returns:
         Compose: A composition of transforms for post-processing and saving predictions.
     """
-    cuda_device = torch.device("cuda:0")
+    cuda_device = torch.device("cuda:0") if device is None else device
     if save_pred:
         if output_dir is None:
             raise UserWarning("output_dir may not be empty when save_pred is enabled...")
@@ -649,6 +812,16 @@ def get_post_transforms_ep(labels, *, save_pred=False, output_dir=None, pretrans
         if save_pred
         else Identityd(keys=input_keys, allow_missing_keys=True),
 
+        # Paste the volumes back into the uncropped frame if --crop_foreground was used
+        PasteForegroundCropd(
+            keys=(
+                "image_for_save_source", "image_for_save_target", "pred_ep_for_save",
+                "pred_ep_processed_for_save", "ep_for_save",
+            ),
+            allow_missing_keys=True,
+        )
+        if save_pred
+        else Identityd(keys=input_keys, allow_missing_keys=True),
         SaveImaged(
             keys=("image_for_save_source","image_for_save_target"),
             writer="ITKWriter",
@@ -702,10 +875,135 @@ def get_post_transforms_ep(labels, *, save_pred=False, output_dir=None, pretrans
         ToTensord(keys=("label_ep", "pred_ep"), device=cuda_device, allow_missing_keys=True),
 
     ]
+    # save in the background writer pool instead of inside the evaluator iteration
+    t = [AsyncSaveImaged(x) if isinstance(x, (SaveImaged, SaveImagedSlices)) else x for x in t]
     return Compose(t)
 
 
 
+def get_image_type(args, dataset) -> str:
+    """
+    Get the modality folder of the source or target domain.
+
+    Args:
+        args: Command line arguments.
+        dataset (str): Either 'source' or 'target'.
+
+    Returns:
+        str: "CT" or "MRI".
+    """
+    image_key = args.source_dataset if dataset == 'source' else args.target_dataset
+    if image_key == "image_ct":
+        return "CT"
+    elif image_key == "image_mri":
+        return "MRI"
+    raise UserWarning(f"No valid image type found for {dataset}: {image_key}")
+
+
+def get_normalization_name(args, image_type) -> str:
+    """
+    Name the intensity normalization branch the pre transforms select for the given modality.
+    Has to be kept in sync with get_pre_transforms_*_as_list_ct/_mri.
+    """
+    if args.same_normalization:
+        return "percentiles_0.05_99.95_to_0_1"
+    if image_type == "MRI":
+        return "zscore_clip"
+    if args.organ == 6:
+        return "range_-45_105"
+    if args.organ in [7, 10]:
+        return "range_-150_250"
+    return "percentiles_0.05_99.95_to_-1_1"
+
+
+def get_preprocessing_config(args, dataset, stage: str, spacing_scale: float = 1.0) -> Dict:
+    """
+    Describe everything the deterministic part of the pre transforms depends on.
+
+    Args:
+        args: Command line arguments.
+        dataset (str): Either 'source' or 'target'.
+        stage (str): Either 'train' or 'val'.
+        spacing_scale (float): Multiplies the spacing, see `get_spacing`.
+
+    Returns:
+        Dict: The configuration which is hashed into the MemmapDataset store folder. Changing e.g. --organ or
+        --same_normalization therefore never reuses stale volumes.
+    """
+    image_type = get_image_type(args, dataset)
+    config = {
+        "dataset": args.dataset,
+        "image_type": image_type,
+        "spacing": list(get_spacing(args, spacing_scale)),
+        "normalization": get_normalization_name(args, image_type),
+        "organ": args.organ,
+        "labels": args.labels,
+        "axcodes": "RAS",
+        "divisible_k": list(DIVISIBLE_K),
+        "label_dtype": "uint8",
+        "crop_foreground": args.crop_foreground,
+        "organ_crop_margin": args.organ_crop_margin,
+        "lazy_resampling": args.lazy_resampling,
+    }
+    if stage == "val":
+        # only the val stores hold the final samples including the seeded extreme points and their heatmaps
+        config["sigma"] = args.sigma
+        config["extreme_points_seed"] = args.seed
+    return config
+
+
+def get_store_pre_transforms(args, dataset: str, stage: str, device, spacing_scale: float = 1.0) -> Compose:
+    """
+    The composed train or val pre transforms of the source or the target domain, as the trainers build them.
+
+    Args:
+        args: Command line arguments.
+        dataset (str): Either 'source' or 'target'.
+        stage (str): Either 'train' or 'val'.
+        device: The device passed to the pre transforms.
+        spacing_scale (float): Multiplies the spacing, see `get_spacing`.
+
+    Returns:
+        Compose: The pre transforms, composed with `compose_pre_transforms`.
+    """
+    is_ct = get_image_type(args, dataset) == "CT"
+    if stage == "train":
+        get_pre_transforms = get_pre_transforms_train_as_list_ct if is_ct else get_pre_transforms_train_as_list_mri
+    else:
+        get_pre_transforms = get_pre_transforms_val_as_list_ct if is_ct else get_pre_transforms_val_as_list_mri
+    image = f"image_{dataset}"
+    pre_transforms = get_pre_transforms(
+        args.labels, device, args, input_keys=(image, "label"), image=image, label="label", spacing_scale=spacing_scale
+    )
+    return compose_pre_transforms(args, pre_transforms)
+
+
+def get_store(
+    args,
+    data: List[Dict],
+    pre_transforms: Compose,
+    dataset: str,
+    stage: str,
+    in_memory: bool = False,
+    spacing_scale: float = 1.0,
+) -> MemmapDataset:
+    """
+    The MemmapDataset of `data` in --cache_dir. The loaders and preprocess.py both build their stores here, so the
+    offline preprocessing fills exactly the store folders the trainers read.
+
+    Args:
+        args: Command line arguments.
+        data (List[Dict]): The data dictionaries, e.g. from `get_data`.
+        pre_transforms (Compose): The pre transforms, composed with `compose_pre_transforms`.
+        dataset (str): Either 'source' or 'target'.
+        stage (str): Either 'train' or 'val'.
+        in_memory (bool): See MemmapDataset.
+        spacing_scale (float): The spacing scale of `pre_transforms`, see `get_spacing`.
+    """
+    config = get_preprocessing_config(args, dataset, stage, spacing_scale)
+    return MemmapDataset(data, pre_transforms, cache_dir=args.cache_dir, config=config, in_memory=in_memory)
+
+
 def get_AMOS_file_list(args, dataset) -> List[List, List, List]:
     """
     Get file lists for AutoPET dataset.
@@ -717,36 +1015,21 @@ def get_AMOS_file_list(args, dataset) -> List[List, List, List]:
         Tuple[List[Dict[str, str]], List[Dict[str, str]], List[Dict[str, str]]]:
         A tuple containing lists of training, validation, and test data dictionaries.
         Each dictionary contains the paths to the image and label files.
+
+    Note:
+        The cases come from the dataset manifest (see `get_manifest`), images and labels are paired by case id.
+        Cases with broken files and cases whose label does not contain --organ are skipped up front.
     """
-    if dataset == 'source':
-        if args.source_dataset == "image_ct":
-            image_type = "CT"
-        elif args.source_dataset == "image_mri":
-            image_type = "MRI"
-    elif dataset == 'target':
-        if args.target_dataset == "image_ct":
-            image_type = "CT"
-        elif args.target_dataset == "image_mri":
-            image_type = "MRI"
-
-    train_images = sorted(glob.glob(os.path.join(args.input_dir, image_type, "imagesTr", "*.nii.gz")))
-    train_labels = sorted(glob.glob(os.path.join(args.input_dir, image_type,"labelsTr", "*.nii.gz")))
-
-    test_images = sorted(glob.glob(os.path.join(args.input_dir, image_type,"imagesTs", "*.nii.gz")))
-    test_labels = sorted(glob.glob(os.path.join(args.input_dir, image_type,"labelsTs", "*.nii.gz")))
-
-    if(dataset=='source'):
-        train_data = [
-            {"image_source": image_name, "label": label_name} for image_name, label_name in zip(train_images, train_labels)
-        ]
-        val_data = [{"image_source": image_name, "label": label_name} for image_name, label_name in zip(test_images, test_labels)]
-        test_data = [{"image_source": image_name, "label": label_name} for image_name, label_name in zip(test_images, test_labels)]
-    else:
-        train_data = [
-            {"image_target": image_name, "label": label_name} for image_name, label_name in zip(train_images, train_labels)
-        ]
-        val_data = [{"image_target": image_name, "label": label_name} for image_name, label_name in zip(test_images, test_labels)]
-        test_data = [{"image_target": image_name, "label": label_name} for image_name, label_name in zip(test_images, test_labels)]
+    image_type = get_image_type(args, dataset)
+    image_key = "image_source" if dataset == "source" else "image_target"
+
+    manifest = get_manifest(os.path.join(args.input_dir, image_type), args.cache_dir, workers=args.preprocessing_workers)
+    train_cases = filter_cases(manifest["splits"]["train"], organ=args.organ)
+    test_cases = filter_cases(manifest["splits"]["test"], organ=args.organ)
+
+    train_data = [{image_key: case["image"], "label": case["label"]} for case in train_cases]
+    val_data = [{image_key: case["image"], "label": case["label"]} for case in test_cases]
+    test_data = [{image_key: case["image"], "label": case["label"]} for case in test_cases]
 
     return train_data, val_data, test_data
 
@@ -804,6 +1087,180 @@ def get_data(args, dataset):
 
 
 
+def get_train_batching(args, train_ds_source, train_ds_target, alternate: bool) -> Dict:
+    """
+    Sampler and collate arguments of the train loaders.
+
+    Args:
+        args: Command line arguments, uses args.batch_size and args.roi_size.
+        train_ds_source: The source MemmapDataset.
+        train_ds_target: The target MemmapDataset.
+        alternate (bool): Alternate between source and target batches (AlternatingSampler), otherwise only the
+            source dataset is sampled (SpecificSampler).
+
+    Returns:
+        Dict: Keyword arguments for get_data_loader. With --batch_size 1 the samplers from before, otherwise a
+        ShapeBucketBatchSampler with single domain batches of similarly shaped cases. In distributed training
+        the distributed variants, which give every rank its own shard of both datasets.
+    """
+    world_size = get_world_size()
+    if args.batch_size == 1:
+        if world_size > 1:
+            sampler = DistributedAlternatingSampler if alternate else DistributedSpecificSampler
+            sampler = sampler(train_ds_source, train_ds_target, num_replicas=world_size, rank=get_rank(), seed=args.seed)
+        else:
+            sampler = (AlternatingSampler if alternate else SpecificSampler)(train_ds_source, train_ds_target)
+        return {"sampler": sampler, "shuffle": False, "batch_size": 1}
+    batch_sampler = ShapeBucketBatchSampler(
+        train_ds_source,
+        train_ds_target,
+        args.batch_size,
+        alternate=alternate,
+        num_replicas=world_size,
+        rank=get_rank(),
+        seed=args.seed,
+    )
+    return {
+        "batch_sampler": batch_sampler,
+        # patches all have the ROI size, whole volumes are padded to the largest shape within their batch
+        "collate_fn": list_data_collate if args.roi_size is not None else pad_list_data_collate,
+    }
+
+
+def get_val_sampling(val_ds) -> Dict:
+    """
+    Sampler arguments of the val loaders: in distributed training every rank validates its own shard of the
+    cases, the metrics are gathered over the ranks by the metrics themselves.
+    """
+    world_size = get_world_size()
+    if world_size <= 1:
+        return {}
+    # only pad with duplicated cases if otherwise a rank had none
+    return {"sampler": DistributedSampler(val_ds, shuffle=False, even_divisible=len(val_ds) < world_size)}
+
+
+def init_loader_worker(worker_id: int) -> None:
+    """
+    `worker_init_fn` of the data loaders, runs once in every worker process.
+
+    Seeds numpy, random and the random transforms of every dataset from the worker seed, which torch derives from
+    the (set_determinism) seeded main process, so runs stay reproducible for a fixed --num_workers. Afterwards the
+    InitLoggerd of the pipelines is called, it is part of the cached transforms and does not run on store hits.
+    """
+    worker_info = torch.utils.data.get_worker_info()
+    seed = worker_info.seed
+    np.random.seed(seed % 2**32)
+    random.seed(seed)
+
+    dataset = worker_info.dataset
+    datasets = dataset.datasets if isinstance(dataset, ConcatDataset) else [dataset]
+    for i, ds in enumerate(datasets):
+        # independent seeds per (worker, dataset), so neither workers nor source and target augment in lockstep
+        set_rnd(ds, seed=int(np.random.SeedSequence([seed, i]).generate_state(1)[0]))
+        for t in getattr(ds, "pre_transforms", []):
+            if isinstance(t, InitLoggerd):
+                t({})
+
+
+class _PrefetchMixin:
+    """
+    Hands out the batches through a BatchPrefetcher, so the next batch is loaded (and copied to
+    `prefetch_device`) while the engine works on the current one.
+    """
+
+    prefetch_device = None
+    prefetcher = None
+
+    def __iter__(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        self.prefetcher = BatchPrefetcher(super().__iter__(), device=self.prefetch_device)
+        return self.prefetcher
+
+    @property
+    def data_wait_time(self) -> float:
+        """
+        Seconds the engine waited for data in the current (or last) epoch.
+        """
+        return self.prefetcher.wait_time if self.prefetcher is not None else 0.0
+
+
+class PrefetchDataLoader(_PrefetchMixin, DataLoader):
+    pass
+
+
+class PrefetchThreadDataLoader(_PrefetchMixin, ThreadDataLoader):
+    pass
+
+
+class PairedBatchLoader:
+    """
+    Iterates the alternating source / target batches of a train loader (see `get_train_batching`) as
+    (source batch, target batch) pairs, for the --paired_adv_step of the adversarial trainers.
+
+    Note:
+        Not a DataLoader, so the trainer needs `epoch_length=len(loader)`. A trailing unpaired batch is dropped.
+    """
+
+    def __init__(self, loader) -> None:
+        self.loader = loader
+
+    def __len__(self) -> int:
+        return len(self.loader) // 2
+
+    def __iter__(self):
+        iterator = iter(self.loader)
+        for batch_source in iterator:
+            batch_target = next(iterator, None)
+            if batch_target is None:
+                return
+            yield batch_source, batch_target
+
+
+def get_data_loader(args, dataset, buffer_timeout: float = 0.01, prefetch_device=None, **kwargs):
+    """
+    Build the data loader selected with --loader.
+
+    Args:
+        args: Command line arguments, uses args.loader, args.num_workers and args.prefetch_depth.
+        dataset: The dataset to load from.
+        buffer_timeout (float): Polling interval of the ThreadDataLoader buffer, only used by --loader thread.
+        prefetch_device: Device the batches are copied to, defaults to the GPU of the trainers and evaluators.
+        kwargs: Sampler, batch size and collate arguments, e.g. from `get_train_batching`.
+
+    Returns:
+        With --loader thread a ThreadDataLoader which buffers --prefetch_depth batches in a background thread.
+        With --loader process a DataLoader whose worker processes keep --prefetch_depth batches per worker in
+        flight. Worker processes are persistent in both modes.
+
+    Note:
+        Worker processes collate into shared memory and MetaTensors are sent as shared storages, so only the
+        meta dicts are pickled on the way back, never the volumes. In both modes a BatchPrefetcher copies the
+        next batch to the GPU while the current iteration runs.
+    """
+    kwargs["num_workers"] = args.num_workers
+    if args.num_workers > 0:
+        kwargs["worker_init_fn"] = init_loader_worker
+        # keeps the in memory val samples (MemmapDataset in_memory) of the workers across epochs
+        kwargs["persistent_workers"] = True
+    if args.loader == "process":
+        if args.prefetch_depth is not None:
+            kwargs["prefetch_factor"] = args.prefetch_depth
+        loader = PrefetchDataLoader(dataset, **kwargs)
+    else:
+        if args.prefetch_depth is not None:
+            kwargs["buffer_size"] = args.prefetch_depth
+        loader = PrefetchThreadDataLoader(dataset, buffer_timeout=buffer_timeout, **kwargs)
+    # the same device the trainers and evaluators pass to default_prepare_batch
+    if prefetch_device is not None:
+        # the batches of a CPU evaluator stay where the workers put them
+        prefetch_device = torch.device(prefetch_device)
+        loader.prefetch_device = prefetch_device if prefetch_device.type == "cuda" else None
+    elif not args.sw_cpu_output and torch.cuda.is_available():
+        loader.prefetch_device = torch.device(f"cuda:{args.gpu}")
+    return loader
+
+
 def get_train_loader(args, pre_transforms_train_source, pre_transforms_train_target):
     """
     Retrieves a DataLoader for training based on the specified command-line arguments and pre-transforms.
@@ -813,7 +1270,7 @@ def get_train_loader(args, pre_transforms_train_source, pre_transforms_train_tar
         pre_transforms_train: Pre-transforms to be applied to the training data.
 
     Returns:
-        DataLoader for training with asynchronous data loading using PersistentDataset and ThreadDataLoader.
+        DataLoader for training with asynchronous data loading using MemmapDataset and the --loader data loader.
     """
     train_data_source, val_data_source, test_data = get_data(args, 'source')
     train_data_target, val_data_target, test_data = get_data(args, 'target')
@@ -823,20 +1280,16 @@ def get_train_loader(args, pre_transforms_train_source, pre_transforms_train_tar
     total_l_target = len(train_data_target) + len(val_data_target)
     total_l = total_l_source + total_l_target
 
-    train_ds_source = PersistentDataset(train_data_source, pre_transforms_train_source, cache_dir=args.cache_dir)
-    train_ds_target = PersistentDataset(train_data_target, pre_transforms_train_target, cache_dir=args.cache_dir)
+    train_ds_source = get_store(args, train_data_source, pre_transforms_train_source, 'source', 'train')
+    train_ds_target = get_store(args, train_data_target, pre_transforms_train_target, 'target', 'train')
 
-    alternatingSampler = AlternatingSampler(train_ds_source, train_ds_target)
     train_ds = ConcatDataset([train_ds_source, train_ds_target])
 
-    train_loader = ThreadDataLoader(
+    train_loader = get_data_loader(
+        args,
         train_ds,
         buffer_timeout=0.02,
-        shuffle=False,
-        sampler = alternatingSampler,
-        num_workers=args.num_workers,
-        batch_size=1,
-
+        **get_train_batching(args, train_ds_source, train_ds_target, alternate=True),
     )
     logger.info("{} :: Total Records used for Training is: {}/{}".format(args.gpu, len(train_ds), total_l))
     return train_loader
@@ -851,7 +1304,7 @@ def get_train_loader_separate(args, pre_transforms_train_source, pre_transforms_
         pre_transforms_train: Pre-transforms to be applied to the training data.
 
     Returns:
-        DataLoader for training with asynchronous data loading using PersistentDataset and ThreadDataLoader.
+        DataLoader for training with asynchronous data loading using MemmapDataset and the --loader data loader.
     """
     train_data_source, val_data_source, test_data = get_data(args, 'source')
     train_data_target, val_data_target, test_data = get_data(args, 'target')
@@ -861,52 +1314,95 @@ def get_train_loader_separate(args, pre_transforms_train_source, pre_transforms_
     total_l_target = len(train_data_target) + len(val_data_target)
     total_l = total_l_source + total_l_target
 
-    train_ds_source = PersistentDataset(train_data_source, pre_transforms_train_source, cache_dir=args.cache_dir)
-    train_ds_target = PersistentDataset(train_data_target, pre_transforms_train_target, cache_dir=args.cache_dir)
-
-    alternatingSampler = SpecificSampler(train_ds_source, train_ds_target)
+    train_ds_source = get_store(args, train_data_source, pre_transforms_train_source, 'source', 'train')
+    train_ds_target = get_store(args, train_data_target, pre_transforms_train_target, 'target', 'train')
 
-    train_loader = ThreadDataLoader(
+    train_loader = get_data_loader(
+        args,
         train_ds_source,
-        shuffle=False,
-        sampler=alternatingSampler,
-        num_workers=args.num_workers,
-        batch_size=1,
-
+        **get_train_batching(args, train_ds_source, train_ds_target, alternate=False),
     )
     logger.info("{} :: Total Records used for Training is: {}/{}".format(args.gpu, len(train_ds_source), total_l))
     return train_loader
 
 
-def get_val_loader_separate(args, pre_transforms_val, dataset:str):
+def get_val_subset(args, dataset: str, val_data: List[Dict], size: int) -> List[Dict]:
+    """
+    The `size` val cases of `dataset` which are stratified by the volume of --organ, see `select_stratified_cases`.
+    The subset only depends on the val cases, so it stays the same for all epochs and runs.
+    """
+    image_key = "image_source" if dataset == "source" else "image_target"
+    manifest = get_manifest(
+        os.path.join(args.input_dir, get_image_type(args, dataset)), args.cache_dir, workers=args.preprocessing_workers
+    )
+    cases = {case["image"]: case for split in manifest["splits"].values() for case in split}
+    subset = select_stratified_cases([cases[data[image_key]] for data in val_data], size, args.organ)
+    images = {case["image"] for case in subset}
+    return [data for data in val_data if data[image_key] in images]
+
+
+def get_val_loader_separate(args, pre_transforms_val, dataset:str, device=None, subset_size=None, spacing_scale=1.0):
     """
     Retrieves a DataLoader for validation based on the specified command-line arguments and pre-transforms.
 
     Args:
         args: Command-line arguments specifying the dataset, input directory, and other options.
         pre_transforms_val: Pre-transforms to be applied to the validation data.
+        device: Device of the evaluator the batches are prefetched to, defaults to the one of the training.
+        subset_size: Only load this many val cases, see `get_val_subset`.
+        spacing_scale: The spacing scale of `pre_transforms_val`, see `get_spacing`.
 
     Returns:
-        DataLoader for validation with asynchronous data loading using PersistentDataset and ThreadDataLoader.
+        DataLoader for validation with asynchronous data loading using MemmapDataset and the --loader data loader.
     """
     train_data, val_data, test_data = get_data(args, dataset)
 
 
     total_l = len(train_data + val_data)
+    if subset_size is not None:
+        val_data = get_val_subset(args, dataset, val_data, subset_size)
 
-    val_ds = PersistentDataset(val_data, pre_transforms_val, cache_dir=args.cache_dir)
+    in_memory = not args.no_val_ram_cache
+    val_ds = get_store(args, val_data, pre_transforms_val, dataset, 'val', in_memory=in_memory, spacing_scale=spacing_scale)
 
-    val_loader = ThreadDataLoader(
-        val_ds,
-        num_workers=args.num_workers,
-        batch_size=1,
-    )
+    val_loader = get_data_loader(args, val_ds, batch_size=1, prefetch_device=device, **get_val_sampling(val_ds))
     logger.info("{} :: Total Records used for Validation is: {}/{}".format(args.gpu, len(val_ds), total_l))
 
     return val_loader
 
 
 
+def get_val_subset_loaders(args, device) -> List:
+    """
+    Loaders of the subsets of --val_subset_size cases of the source and the target val set, which the tiered
+    validation (see TieredValidator) validates every time, resampled to --val_subset_spacing_scale times the
+    spacing. The coarser samples are stored separately, the spacing is part of the preprocessing config.
+
+    Args:
+        args: Command line arguments.
+        device: Device of the evaluators.
+
+    Returns:
+        List: The source and the target loader.
+    """
+    loaders = []
+    for dataset in ("source", "target"):
+        pre_transforms_val = get_store_pre_transforms(
+            args, dataset, "val", device, spacing_scale=args.val_subset_spacing_scale
+        )
+        loaders.append(
+            get_val_loader_separate(
+                args,
+                pre_transforms_val,
+                dataset,
+                device=device,
+                subset_size=args.val_subset_size,
+                spacing_scale=args.val_subset_spacing_scale,
+            )
+        )
+    return loaders
+
+
 def get_val_loader(args, pre_transforms_val_source, pre_transforms_val_target):
     """
     Retrieves a DataLoader for validation based on the specified command-line arguments and pre-transforms.
@@ -916,7 +1412,7 @@ def get_val_loader(args, pre_transforms_val_source, pre_transforms_val_target):
         pre_transforms_val: Pre-transforms to be applied to the validation data.
 
     Returns:
-        DataLoader for validation with asynchronous data loading using PersistentDataset and ThreadDataLoader.
+        DataLoader for validation with asynchronous data loading using MemmapDataset and the --loader data loader.
     """
     train_data_source, val_data_source, test_data = get_data(args, 'source')
     target, val_data_target, test_data = get_data(args, 'target')
@@ -927,15 +1423,12 @@ def get_val_loader(args, pre_transforms_val_source, pre_transforms_val_target):
     total_l = total_l_source + total_l_target
 
 
-    val_ds_source = PersistentDataset(val_data_source, pre_transforms_val_source, cache_dir=args.cache_dir)
-    val_ds_target = PersistentDataset(val_data_target, pre_transforms_val_target, cache_dir=args.cache_dir)
+    in_memory = not args.no_val_ram_cache
+    val_ds_source = get_store(args, val_data_source, pre_transforms_val_source, 'source', 'val', in_memory=in_memory)
+    val_ds_target = get_store(args, val_data_target, pre_transforms_val_target, 'target', 'val', in_memory=in_memory)
     val_ds = ConcatDataset([val_ds_source, val_ds_target])
 
-    val_loader = ThreadDataLoader(
-        val_ds,
-        num_workers=args.num_workers,
-        batch_size=1,
-    )
+    val_loader = get_data_loader(args, val_ds, batch_size=1, **get_val_sampling(val_ds))
     logger.info("{} :: Total Records used for Validation is: {}/{}".format(args.gpu, len(val_ds), total_l))
 
     return val_loader
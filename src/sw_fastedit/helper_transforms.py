@@ -18,7 +18,7 @@ from monai.transforms import (
 from sw_fastedit.utils.helper import (
     describe_batch_data,
 )
-from sw_fastedit.utils.logger import get_logger, setup_loggers
+from sw_fastedit.utils.logger import ensure_loggers, get_logger
 
 logger = None
 
@@ -45,7 +45,7 @@ class TrackTimed(Transform):
         data = self.transform(data)
         end_time = time.perf_counter()
         total_time = end_time - start_time
-        logger.info(f"-------- {self.transform.__class__.__qualname__:<20.20}() took {total_time:.3f} seconds")
+        logger.info("-------- %-20.20s() took %.3f seconds", self.transform.__class__.__qualname__, total_time)
 
         return data
 
@@ -75,12 +75,12 @@ class InitLoggerd(MapTransform):
         if self.no_log:
             self.log_dir = None
 
-        setup_loggers(self.loglevel, self.log_dir)
+        ensure_loggers(self.loglevel, self.log_dir)
         logger = get_logger()
 
     def __call__(self, data: Mapping[Hashable, torch.Tensor]) -> Mapping[Hashable, torch.Tensor]:
         global logger
-        if logger is None:
-            setup_loggers(self.loglevel, self.log_dir)
+        # Only sets the loggers up in a new worker process, threads share the writer thread of the main process
+        ensure_loggers(self.loglevel, self.log_dir)
         logger = get_logger()
         return data
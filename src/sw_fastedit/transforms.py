@@ -43,6 +43,7 @@ from monai.utils import ImageMetaKey as Key
 from monai.utils import convert_to_dst_type, look_up_option, optional_import
 
 from monai.utils import TransformBackends, convert_data_type, convert_to_tensor,  look_up_option
+from monai.utils import convert_to_numpy, get_equivalent_dtype
 
 
 __all__ = ["LoadImaged", "LoadImageD", "LoadImageDict", "SaveImaged", "SaveImageD", "SaveImageDict"]
@@ -51,25 +52,28 @@ DEFAULT_POST_FIX = PostFix.meta()
 
 
 import gc
+import hashlib
 import os
 import json
 import logging
 import re
 from typing import Dict, Hashable, List, Mapping, Tuple
 from copy import deepcopy
+from functools import lru_cache, reduce
 from pydoc import locate
 
 import torch
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import find_objects, gaussian_filter
+from scipy.special import erf
 from monai.config import KeysCollection
 from monai.data import MetaTensor
-from monai.networks.layers import GaussianFilter
 from monai.transforms import (
     MapTransform,
     Randomizable,
     LazyTransform,
     InvertibleTransform,
     Flip,
+    SpatialCrop,
 )
 from monai.transforms.post.array import (
     AsDiscrete,
@@ -83,10 +87,8 @@ from monai.transforms.utils import get_extreme_points
 from monai.transforms.utils_pytorch_numpy_unification import concatenate
 from monai.utils.type_conversion import convert_to_dst_type
 from monai.transforms.utils import check_non_lazy_pending_ops
-from monai.transforms.utils_pytorch_numpy_unification import where
 from monai.transforms.utility.array import SplitDim
 from monai.transforms.traits import MultiSampleTrait
-from monai.transforms.utils_pytorch_numpy_unification import clip
 import numpy as np
 
 
@@ -95,6 +97,8 @@ from sw_fastedit.utils.enums import CommonKeys
 from sw_fastedit.utils.enums import GanKeys
 
 from sw_fastedit.utils.helper import  timeit
+from sw_fastedit.utils.volume_store import IntensityStatsCache
+from sw_fastedit.utils.async_writer import get_writer_pool
 
 logger = logging.getLogger("sw_fastedit")
 
@@ -152,22 +156,454 @@ class AddExtremePointsChanneld(Randomizable, MapTransform):
         self.rescale_max = rescale_max
         
 
-    def randomize(self, label: NdarrayOrTensor) -> None:
-        self.points = get_extreme_points(label, rand_state=self.R, background=self.background, pert=self.pert)
+    def randomize(
+        self,
+        label: NdarrayOrTensor,
+        faces: Sequence[np.ndarray] | None = None,
+        rand_state: np.random.RandomState | None = None,
+    ) -> None:
+        rand_state = self.R if rand_state is None else rand_state
+        if faces is not None:
+            self.points = choose_extreme_points(faces, label.shape, rand_state=rand_state, pert=self.pert)
+        else:
+            self.points = get_extreme_points(label, rand_state=rand_state, background=self.background, pert=self.pert)
+
+    def _get_faces_from_index(self, d: Mapping, label: NdarrayOrTensor) -> list[np.ndarray] | None:
+        # Faces of the selected organ from AddForegroundIndexd, mapped into the voxel grid of the current label
+        index = d.get(CommonKeys.FOREGROUND_INDEX)
+        organ_ids = [v for k, v in self.label_names.items() if k != "background"]
+        if index is None or index["affine"] is None or not isinstance(label, MetaTensor) or len(organ_ids) != 1:
+            return None
+        if organ_ids[0] not in index["organs"]:
+            raise ValueError("label is all background")
+        mapping = np.linalg.inv(np.asarray(label.affine, dtype=np.float64)) @ index["affine"]
+        return transform_foreground_faces(index["organs"][organ_ids[0]]["faces"], mapping, label.shape[1:])
 
-    def __call__(self, data: Mapping[Hashable, torch.Tensor]) -> dict[Hashable, torch.Tensor]:
+    def __call__(
+        self, data: Mapping[Hashable, torch.Tensor], rand_state: np.random.RandomState | None = None
+    ) -> dict[Hashable, torch.Tensor]:
         d = dict(data)
         label = d[self.label_key]
-        if torch.all(data['label'] == 0):
-            print(data['label_meta_dict']['filename_or_obj'])
-            raise ValueError(data['label_meta_dict']['filename_or_object'], "label is all background")
-        self.randomize(label[0, :])
-
+        try:
+            self.randomize(label[0, :], faces=self._get_faces_from_index(d, label), rand_state=rand_state)
+        except ValueError as e:
+            filename = d.get(f"{self.label_key}_meta_dict", {}).get("filename_or_obj")
+            raise ValueError(f"{filename}: {e}") from e
+        # The ragged face arrays cannot be collated into a batch
+        d.pop(CommonKeys.FOREGROUND_INDEX, None)
 
         d['guidance'] = self.points
         return d
 
 
+def get_case_seed(filename: str | None, seed: int = 0) -> int:
+    """
+    Seed for the random state of one case, derived from the file name (not the full path) and a global seed.
+    """
+    name = os.path.basename(str(filename))
+    return int.from_bytes(hashlib.md5(f"{seed}:{name}".encode("utf-8")).digest()[:4], "little")
+
+
+class AddSeededExtremePointsChanneld(MapTransform):
+    """
+    Deterministic counterpart of :py:class:`AddExtremePointsChanneld` for validation.
+
+    The extreme points of every case are drawn with a random state seeded by `get_case_seed` from the label file
+    name and `seed`, so a case always gets the same points. Since the transform is not `Randomizable`, the whole
+    val pipeline becomes deterministic and its output is cached by MemmapDataset.
+
+    Args:
+        keys: keys of the corresponding items to be transformed.
+        label_key: key to label source to get the extreme points.
+        seed: global seed, e.g. --seed.
+        The remaining arguments are the ones of :py:class:`AddExtremePointsChanneld`.
+    """
+
+    def __init__(
+        self,
+        keys: KeysCollection,
+        label_key: str,
+        seed: int = 0,
+        background: int = 0,
+        pert: float = 0.0,
+        sigma: Sequence[float] | float | Sequence[torch.Tensor] | torch.Tensor = 5.0,
+        allow_missing_keys: bool = False,
+        label_names={},
+    ):
+        super().__init__(keys, allow_missing_keys)
+        self.seed = seed
+        self.label_key = label_key
+        self.extreme_points = AddExtremePointsChanneld(
+            keys=keys,
+            label_key=label_key,
+            background=background,
+            pert=pert,
+            sigma=sigma,
+            allow_missing_keys=allow_missing_keys,
+            label_names=label_names,
+        )
+
+    def __call__(self, data: Mapping[Hashable, torch.Tensor]) -> dict[Hashable, torch.Tensor]:
+        label = data[self.label_key]
+        filename = label.meta.get("filename_or_obj") if isinstance(label, MetaTensor) else None
+        if filename is None:
+            filename = data.get(f"{self.label_key}_meta_dict", {}).get("filename_or_obj")
+        rand_state = np.random.RandomState(get_case_seed(filename, self.seed))
+        return self.extreme_points(data, rand_state=rand_state)
+
+
+def _reduce_to_dim(x: NdarrayOrTensor, keep_dim: int) -> NdarrayOrTensor:
+    # any() over all but the batch and the `keep_dim` dimension, from the last to the first
+    for dim in reversed(range(1, x.ndim)):
+        if dim != keep_dim:
+            x = x.any(dim)
+    return x
+
+
+def _get_axis_profiles(mask: NdarrayOrTensor) -> list[np.ndarray]:
+    """
+    For a boolean mask of shape (batch, spatial_dim1, ...) return per spatial axis a (batch, spatial_dim_i)
+    array telling which slices along that axis contain foreground. Only two reductions touch the full mask,
+    everything else works on its projections.
+    """
+    spatial_dims = mask.ndim - 1
+    if spatial_dims == 1:
+        profiles = [mask]
+    else:
+        projection = mask.any(-1)
+        profiles = [_reduce_to_dim(projection, axis + 1) for axis in range(spatial_dims - 1)]
+        profiles.append(_reduce_to_dim(mask.any(1), spatial_dims - 1))
+    return [p.cpu().numpy() if isinstance(p, torch.Tensor) else np.asarray(p) for p in profiles]
+
+
+def get_extreme_points_batched(
+    labels: NdarrayOrTensor,
+    rand_state: np.random.RandomState | None = None,
+    background: int = 0,
+    pert: float = 0.0,
+) -> list[list[tuple[int, ...]]]:
+    """
+    Generate the extreme points of several labels at once, see `get_extreme_points`.
+
+    The foreground mask is computed once for the whole batch, the bounding planes are found from its axis
+    projections and the random point of each extreme is drawn from the foreground voxels of that plane only.
+
+    Args:
+        labels: numpy array or tensor of shape ``(batch, spatial_dim1, [, spatial_dim2, ...])``.
+        rand_state: `np.random.RandomState` object used to select random indices, the global numpy
+            random state if None.
+        background: Value to be consider as background, defaults to 0.
+        pert: Random perturbation amount to add to the points, defaults to 0.0.
+
+    Returns:
+        One list of extreme points per label, in the order of `get_extreme_points`.
+
+    Raises:
+        ValueError: When one of the labels does not have any foreground voxel.
+    """
+    check_non_lazy_pending_ops(labels, name="get_extreme_points")
+    if rand_state is None:
+        rand_state = np.random.random.__self__  # type: ignore
+    if isinstance(labels, MetaTensor):
+        labels = labels.as_tensor()
+
+    mask = labels != background
+    profiles = _get_axis_profiles(mask)
+    spatial_shape = mask.shape[1:]
+
+    batch_points = []
+    for b in range(mask.shape[0]):
+        bounds = []
+        for profile in profiles:
+            occupied = np.flatnonzero(profile[b])
+            if occupied.size == 0:
+                raise ValueError("label is all background")
+            bounds.append((occupied[0], occupied[-1]))
+
+        faces = []
+        for axis, (lower, upper) in enumerate(bounds):
+            for val in (lower, upper):
+                plane = mask[(b,) + (slice(None),) * axis + (int(val),)]
+                if isinstance(plane, torch.Tensor):
+                    candidates = torch.nonzero(plane).cpu().numpy()
+                else:
+                    candidates = np.argwhere(plane)
+                faces.append(np.insert(candidates, axis, val, axis=1))
+        batch_points.append(choose_extreme_points(faces, spatial_shape, rand_state=rand_state, pert=pert))
+    return batch_points
+
+
+def choose_extreme_points(
+    faces: Sequence[np.ndarray], spatial_shape, rand_state: np.random.RandomState, pert: float = 0.0
+) -> list[tuple[int, ...]]:
+    """
+    Draw one (optionally perturbed) point from each extreme face.
+
+    Args:
+        faces: 2 * spatial dims arrays of shape (K, spatial dims), the foreground voxels on the min and max
+            plane of every axis in the order [1st_spatial_dim_min, 1st_spatial_dim_max, ...].
+        spatial_shape: the points are clipped into this shape.
+        rand_state: `np.random.RandomState` object used to select random indices.
+        pert: Random perturbation amount to add to the points, defaults to 0.0.
+    """
+    points = []
+    for candidates in faces:
+        coords = candidates[rand_state.choice(len(candidates))]
+        pt = []
+        for j in range(len(spatial_shape)):
+            # add +- pert to each dimension
+            coord = int(coords[j] + 2.0 * pert * (rand_state.rand() - 0.5))
+            pt.append(max(0, min(coord, spatial_shape[j] - 1)))
+        points.append(tuple(pt))
+    return points
+
+
+def get_foreground_index(label: NdarrayOrTensor) -> dict:
+    """
+    Per organ id bounding box, voxel count and the foreground voxels on the six bounding faces.
+
+    Args:
+        label: integer valued label of shape ``(spatial_dim1, [, spatial_dim2, ...])`` with the raw dataset ids.
+
+    Returns:
+        Dictionary organ id -> {"bbox": (2, spatial dims) array of the inclusive min / max corner,
+        "count": voxel count, "faces": list in the format `choose_extreme_points` expects}.
+    """
+    if isinstance(label, torch.Tensor):
+        label = label.cpu().numpy()
+    label = np.asarray(label).astype(np.int32)
+    counts = np.bincount(label.ravel())
+
+    index = {}
+    # find_objects gets the bounding boxes of all ids in one pass
+    for organ_id, box in enumerate(find_objects(label), start=1):
+        if box is None:
+            continue
+        organ = label[box] == organ_id
+        offset = np.array([sl.start for sl in box])
+        faces = []
+        for axis in range(label.ndim):
+            for val in (0, organ.shape[axis] - 1):
+                candidates = np.argwhere(np.take(organ, val, axis=axis))
+                faces.append((np.insert(candidates, axis, val, axis=1) + offset).astype(np.int32))
+        index[organ_id] = {
+            "bbox": np.stack([offset, offset + np.array(organ.shape) - 1]),
+            "count": int(counts[organ_id]),
+            "faces": faces,
+        }
+    return index
+
+
+def transform_foreground_faces(faces: Sequence[np.ndarray], mapping: np.ndarray, spatial_shape) -> list[np.ndarray] | None:
+    """
+    Map the faces of `get_foreground_index` into another voxel grid of the same volume.
+
+    Args:
+        faces: the faces in the order of `choose_extreme_points`.
+        mapping: homogeneous matrix from the voxel coordinates of the index to the current ones,
+            i.e. inv(current affine) @ index affine.
+        spatial_shape: the current spatial shape.
+
+    Returns:
+        The faces in the current voxel grid, reordered to the min / max planes of the current axes. None if the
+        mapping is not an axis permutation with flips and integer shifts (e.g. an interpolating rotation) or if
+        the faces do not fit into the volume (e.g. after a crop), the label has to be scanned in that case.
+    """
+    dims = len(spatial_shape)
+    rotation, shift = mapping[:dims, :dims], mapping[:dims, dims]
+    if not (np.allclose(rotation, np.rint(rotation), atol=1e-3) and np.allclose(shift, np.rint(shift), atol=1e-3)):
+        return None
+    rotation, shift = np.rint(rotation).astype(np.int64), np.rint(shift).astype(np.int64)
+    if np.any(np.abs(rotation).sum(0) != 1) or np.any(np.abs(rotation).sum(1) != 1):
+        return None
+
+    new_faces = [None] * (2 * dims)
+    for j in range(dims):
+        i = int(np.flatnonzero(rotation[:, j])[0])
+        for side in (0, 1):
+            # a flipped axis swaps its min and max face
+            new_side = side if rotation[i, j] > 0 else 1 - side
+            new_faces[2 * i + new_side] = faces[2 * j + side].astype(np.int64) @ rotation.T + shift
+    for coords in new_faces:
+        if np.any(coords < 0) or np.any(coords >= np.asarray(spatial_shape)):
+            return None
+    return new_faces
+
+
+class AddForegroundIndexd(MapTransform):
+    """
+    Store the `get_foreground_index` of the label together with its affine under CommonKeys.FOREGROUND_INDEX.
+
+    Meant for the cached part of the pre transforms, before the labels get normalized, so that the index holds
+    all organ ids. `AddExtremePointsChanneld` picks it up and maps it through the affine of the current label,
+    which keeps it valid after the flips and 90 degree rotations of the augmentation.
+    """
+
+    def __init__(self, keys: KeysCollection, allow_missing_keys: bool = False):
+        super().__init__(keys, allow_missing_keys)
+
+    def __call__(self, data: Mapping[Hashable, torch.Tensor]) -> dict[Hashable, torch.Tensor]:
+        d = dict(data)
+        for key in self.key_iterator(d):
+            label = d[key]
+            d[CommonKeys.FOREGROUND_INDEX] = {
+                "affine": np.asarray(label.affine, dtype=np.float64) if isinstance(label, MetaTensor) else None,
+                "spatial_shape": tuple(label.shape[1:]),
+                "organs": get_foreground_index(label[0]),
+            }
+        return d
+
+
+def get_mask_bounding_box(mask: NdarrayOrTensor, margin: int = 0) -> Tuple[List[int], List[int]] | None:
+    """
+    Bounding box of a boolean mask of shape (spatial_dim1, [, spatial_dim2, ...]), expanded by `margin` voxels
+    and clipped to the volume.
+
+    Returns:
+        The inclusive start and exclusive end per spatial axis, None if the mask is empty.
+    """
+    box_start, box_end = [], []
+    for profile, size in zip(_get_axis_profiles(mask[None]), mask.shape):
+        occupied = np.flatnonzero(profile[0])
+        if len(occupied) == 0:
+            return None
+        box_start.append(max(int(occupied[0]) - margin, 0))
+        box_end.append(min(int(occupied[-1]) + 1 + margin, size))
+    return box_start, box_end
+
+
+class CropForegroundRegiond(MapTransform):
+    """
+    Crop the resampled volumes to the body of the patient and optionally to a margin around the organ.
+
+    The body mask is an air threshold in HU for CT and a fraction of the 99th intensity percentile for MRI, so
+    the transform has to run before the intensity normalization. The organ crop needs the raw label ids, i.e. it
+    has to run before `NormalizeLabelsInDatasetd`, and is skipped if the organ is missing. The crop itself is a
+    MONAI `SpatialCrop`, which updates the affine and records the operation. The box is additionally stored
+    under CommonKeys.FOREGROUND_CROP so that `PasteForegroundCropd` can move predictions back into the
+    uncropped frame.
+
+    Args:
+        keys: keys of the corresponding items to be cropped.
+        source_key: image the body mask is computed from.
+        image_type: "CT" or "MRI".
+        label_key: raw label for the organ crop.
+        organ: label id of the organ, None disables the organ crop.
+        organ_margin: margin in voxels around the organ.
+        body_margin: margin in voxels around the body.
+        ct_threshold: CT voxels above this HU value belong to the body.
+        mri_fraction: MRI voxels above this fraction of the 99th percentile belong to the body.
+        allow_missing_keys: don't raise exception if key is missing.
+    """
+
+    def __init__(
+        self,
+        keys: KeysCollection,
+        source_key: str,
+        image_type: str,
+        label_key: str | None = None,
+        organ: int | None = None,
+        organ_margin: int = 0,
+        body_margin: int = 2,
+        ct_threshold: float = -500.0,
+        mri_fraction: float = 0.1,
+        allow_missing_keys: bool = False,
+    ):
+        super().__init__(keys, allow_missing_keys)
+        if image_type not in ["CT", "MRI"]:
+            raise ValueError(f"Unknown image type {image_type}")
+        self.source_key = source_key
+        self.image_type = image_type
+        self.label_key = label_key
+        self.organ = organ
+        self.organ_margin = organ_margin
+        self.body_margin = body_margin
+        self.ct_threshold = ct_threshold
+        self.mri_fraction = mri_fraction
+
+    def get_body_mask(self, img: torch.Tensor) -> torch.Tensor:
+        if self.image_type == "CT":
+            threshold = self.ct_threshold
+        else:
+            threshold = self.mri_fraction * get_histogram_percentiles(img, [99.0])[0]
+        return (img > threshold).any(0)
+
+    def __call__(self, data: Mapping[Hashable, torch.Tensor]) -> dict[Hashable, torch.Tensor]:
+        d = dict(data)
+        img = d[self.source_key]
+        box = get_mask_bounding_box(self.get_body_mask(img), self.body_margin)
+        if box is None:
+            filename = img.meta.get("filename_or_obj") if isinstance(img, MetaTensor) else None
+            logger.warning(f"Empty body mask for {filename}, not cropping it")
+            box = [0] * (img.ndim - 1), list(img.shape[1:])
+
+        if self.organ is not None and self.label_key in d:
+            label = d[self.label_key]
+            organ_box = get_mask_bounding_box(label[0] == self.organ, self.organ_margin)
+            if organ_box is not None:
+                # the organ region within the body
+                start = [max(a, b) for a, b in zip(box[0], organ_box[0])]
+                end = [min(a, b) for a, b in zip(box[1], organ_box[1])]
+                if all(a < b for a, b in zip(start, end)):
+                    box = start, end
+
+        d[CommonKeys.FOREGROUND_CROP] = {
+            "box_start": np.asarray(box[0]),
+            "box_end": np.asarray(box[1]),
+            "spatial_shape": np.asarray(img.shape[1:]),
+            "affine": np.asarray(img.affine, dtype=np.float64) if isinstance(img, MetaTensor) else np.eye(img.ndim),
+        }
+        cropper = SpatialCrop(roi_start=box[0], roi_end=box[1])
+        for key in self.key_iterator(d):
+            d[key] = cropper(d[key])
+        return d
+
+
+class PasteForegroundCropd(MapTransform):
+    """
+    Undo `CropForegroundRegiond` and the subsequent symmetric `DivisiblePadd` for predictions, e.g. before
+    `SaveImaged`. The cropped region is written into a zero volume of the uncropped shape, which also gets the
+    uncropped affine. Does nothing if the data was not cropped.
+
+    Args:
+        keys: keys of the channel first volumes to paste back.
+        crop_key: key of the crop box written by `CropForegroundRegiond`.
+        allow_missing_keys: don't raise exception if key is missing.
+    """
+
+    def __init__(
+        self, keys: KeysCollection, crop_key: str = CommonKeys.FOREGROUND_CROP, allow_missing_keys: bool = False
+    ):
+        super().__init__(keys, allow_missing_keys)
+        self.crop_key = crop_key
+
+    def __call__(self, data: Mapping[Hashable, torch.Tensor]) -> dict[Hashable, torch.Tensor]:
+        d = dict(data)
+        if self.crop_key not in d:
+            return d
+        crop = d[self.crop_key]
+        box_start = [int(x) for x in convert_to_numpy(crop["box_start"])]
+        box_end = [int(x) for x in convert_to_numpy(crop["box_end"])]
+        spatial_shape = [int(x) for x in convert_to_numpy(crop["spatial_shape"])]
+        affine = torch.as_tensor(convert_to_numpy(crop["affine"]), dtype=torch.float64)
+        for key in self.key_iterator(d):
+            img = d[key]
+            # DivisiblePadd pads symmetrically, i.e. (total // 2) voxels in front
+            region = [slice(0, None)]
+            for start, end, padded in zip(box_start, box_end, img.shape[1:]):
+                before = (padded - (end - start)) // 2
+                region.append(slice(before, before + end - start))
+            result = torch.zeros((img.shape[0], *spatial_shape), dtype=img.dtype, device=img.device)
+            result[(slice(0, None), *[slice(start, end) for start, end in zip(box_start, box_end)])] = (
+                img.as_tensor()[tuple(region)] if isinstance(img, MetaTensor) else img[tuple(region)]
+            )
+            if isinstance(img, MetaTensor):
+                meta = deepcopy(img.meta)
+                meta["affine"] = affine
+                result = MetaTensor(result, meta=meta)
+            d[key] = result
+        return d
+
 
 def get_extreme_points(
     img: NdarrayOrTensor, rand_state: np.random.RandomState | None = None, background: int = 0, pert: float = 0.0
@@ -192,46 +628,7 @@ def get_extreme_points(
     Raises:
         ValueError: When the input image does not have any foreground pixel.
     """
-    check_non_lazy_pending_ops(img, name="get_extreme_points")
-    rand_state = None
-
-    if rand_state is None:
-        rand_state = np.random.random.__self__  # type: ignore
-
-    if torch.all(img == 0):
-        raise ValueError("label is all background")
-    indices = where(img != background)
-
-    if np.size(indices[0]) == 0:
-        raise ValueError("get_extreme_points: no foreground object in mask!")
-
-    def _get_point(val, dim):
-        """
-        Select one of the indices within slice containing val.
-
-        Args:
-            val : value for comparison
-            dim : dimension in which to look for value
-        """
-
-        idx = where(indices[dim] == val)[0]
-        idx = idx.cpu() if isinstance(idx, torch.Tensor) else idx
-        idx = rand_state.choice(idx) if rand_state is not None else idx
-        pt = []
-        for j in range(img.ndim):
-            # add +- pert to each dimension
-            val = int(indices[j][idx] + 2.0 * pert * (rand_state.rand() if rand_state is not None else 0.5 - 0.5))
-            val = max(val, 0)
-            val = min(val, img.shape[j] - 1)
-            pt.append(val)
-        return pt
-
-    points = []
-    for i in range(img.ndim):
-        points.append(tuple(_get_point(indices[i].min(), i)))
-        points.append(tuple(_get_point(indices[i].max(), i)))
-
-    return points
+    return get_extreme_points_batched(img[None], rand_state=rand_state, background=background, pert=pert)[0]
 
 
 class AddEmptySignalChannels(MapTransform):
@@ -491,6 +888,9 @@ class NormalizeLabelsInDatasetd(MapTransform):
     """
     Normalize label values according to the label names dictionary.
 
+    The label is remapped with a lookup table and stored as uint8, which it stays until the loss or the metric
+    converts it.
+
     Args:
         keys: the ``keys`` parameter will be used to get and set the actual data item to transform.
         labels: dictionary mapping label names to label values.
@@ -522,22 +922,25 @@ class NormalizeLabelsInDatasetd(MapTransform):
 
                 # Initialize a dictionary to store new label numbers
                 new_labels = {"background": 0}
-                
-                # Create a tensor to store normalized labels
-                normalized_label = torch.zeros_like(label, device=self.device)
-
-                # Assign new labels based on the provided dictionary
                 for idx, (key_label, val_label) in enumerate(self.labels.items(), start=1):
                     if key_label != "background":
                         new_labels[key_label] = idx
-                        normalized_label[label == val_label] = idx
+
+                # Remap all values in a single gather, ids which are not in the dict become background
+                raw_label = (label.as_tensor() if isinstance(label, MetaTensor) else torch.as_tensor(label)).long().clamp_(min=0)
+                lut_size = max(int(raw_label.max()), *[int(v) for v in self.labels.values()]) + 1
+                lut = torch.zeros(lut_size, dtype=torch.uint8, device=raw_label.device)
+                for key_label, val_label in self.labels.items():
+                    if key_label != "background":
+                        lut[int(val_label)] = new_labels[key_label]
+                normalized_label = lut[raw_label].to(device=self.device)
 
                 # Store the new labels dictionary
                 data[CommonKeys.LABELS_KEY] = new_labels
 
-                # Update the label tensor
+                # Update the label tensor, a new MetaTensor since assigning .array would cast back to float
                 if isinstance(data[key], MetaTensor):
-                    data[key].array = normalized_label
+                    data[key] = MetaTensor(normalized_label, meta=label.meta, applied_operations=label.applied_operations)
                 else:
                     data[key] = normalized_label
             else:
@@ -547,53 +950,119 @@ class NormalizeLabelsInDatasetd(MapTransform):
 
 
     
+def get_streaming_mean_std(img: torch.Tensor, chunk_size: int = 2**22) -> Tuple[float, float]:
+    """
+    Mean and (unbiased, like `torch.std`) standard deviation of all voxels in one pass.
+
+    Every chunk is reduced with one fused `torch.var_mean`, the partial results are merged in float64 with the
+    parallel Welford update. Nothing of the size of the volume is allocated.
+    """
+    flat = img.reshape(-1)
+    count, mean, m2 = 0, 0.0, 0.0
+    for start in range(0, flat.numel(), chunk_size):
+        chunk = flat[start : start + chunk_size]
+        if not chunk.is_floating_point():
+            chunk = chunk.float()
+        chunk_var, chunk_mean = torch.var_mean(chunk, correction=0)
+        chunk_count = chunk.numel()
+        chunk_mean = chunk_mean.item()
+        chunk_m2 = chunk_var.item() * chunk_count
+        delta = chunk_mean - mean
+        total = count + chunk_count
+        mean += delta * chunk_count / total
+        m2 += chunk_m2 + delta**2 * count * chunk_count / total
+        count = total
+    std = (m2 / (count - 1)) ** 0.5 if count > 1 else float("nan")
+    return mean, std
+
+
+def get_histogram_percentiles(
+    img: torch.Tensor, percentiles: Sequence[float], bins: int = 2**16, chunk_size: int = 2**22
+) -> List[float]:
+    """
+    Percentiles of all voxels from a histogram instead of a full sort.
+
+    One pass gets the value range, a second one the histogram. Within the bin of the requested rank the values
+    are assumed to be evenly spread, so the error is below one bin width, i.e. (max - min) / `bins`.
+    """
+    flat = img.reshape(-1)
+    if not flat.is_floating_point():
+        flat = flat.float()
+    chunks = [flat[start : start + chunk_size] for start in range(0, flat.numel(), chunk_size)]
+    min_val = min(torch.aminmax(chunk)[0].item() for chunk in chunks)
+    max_val = max(torch.aminmax(chunk)[1].item() for chunk in chunks)
+    if min_val == max_val:
+        return [float(min_val)] * len(percentiles)
+
+    scale = bins / (max_val - min_val)
+    # float64 accumulation keeps the counts exact, histc of a single chunk stays below 2**24 per bin
+    hist = torch.zeros(bins, dtype=torch.float64)
+    for chunk in chunks:
+        hist += torch.histc(chunk, bins=bins, min=min_val, max=max_val).to(device="cpu", dtype=torch.float64)
+    hist = hist.numpy()
+    cumulative = np.cumsum(hist)
+
+    result = []
+    for q in percentiles:
+        # same rank as the default "linear" interpolation of np.percentile
+        rank = q / 100.0 * (flat.numel() - 1)
+        k = min(int(np.searchsorted(cumulative, rank, side="right")), bins - 1)
+        before = cumulative[k - 1] if k > 0 else 0
+        fraction = (rank - before + 0.5) / max(hist[k], 1)
+        result.append(min_val + (k + min(max(fraction, 0.0), 1.0)) / scale)
+    return result
+
+
 class ZScoreNormalize(Transform):
     """
     Apply z-score normalization to a numpy array or tensor based on the intensity distribution of the input.
 
     This transform will normalize the input image so that its intensities have a mean of 0 and
-    a standard deviation of 1, across the specified axis or globally if no axis is specified.
+    a standard deviation of 1 over the whole image. The statistics come from a single chunked pass
+    (see `get_streaming_mean_std`), afterwards the image is scaled and clipped in place.
 
     Args:
-        axis: The axis or axes to compute mean and standard deviation over. If None, z-score normalization
-              is applied to the entire image. If an integer or tuple of integers, normalization is done
-              along the specified axes.
-        epsilon: Small constant to avoid division by zero in the standard deviation computation.
+        clip: Whether to clip the normalized intensities to [-1, 1].
         dtype: Output data type, if None, same as input image. Defaults to float32.
-        channel_wise: If True, compute z-score normalization for each channel separately. Defaults to False.
+        stats_cache: Optional `IntensityStatsCache`, if given the per case mean and std are taken from it and
+            only computed if missing.
+
+    Note:
+        The input is modified in place if it already has the output dtype.
     """
 
+    backend = [TransformBackends.TORCH]
+
     def __init__(
         self,
         clip: bool = False,
         dtype: DtypeLike = np.float32,
-
+        stats_cache: IntensityStatsCache | None = None,
     ) -> None:
         self.clip = clip
         self.dtype = dtype
+        self.stats_cache = stats_cache
 
-
-    def _normalize(self, img: NdarrayOrTensor) -> NdarrayOrTensor:
-        # Handle tensor and numpy arrays separately
-        if isinstance(img, torch.Tensor):
-            mean_val = torch.mean(img)
-            std_val = torch.std(img)
-        else:
-            mean_val = np.mean(img)
-            std_val = np.std(img)
-        
-        img = (img - mean_val) / std_val
-        return img
+    def _get_stats(self, img: torch.Tensor) -> Tuple[float, float]:
+        key = self.stats_cache.get_key(img) if self.stats_cache is not None else None
+        stats = self.stats_cache.get(key) if key is not None else {}
+        if "mean" not in stats or "std" not in stats:
+            stats["mean"], stats["std"] = get_streaming_mean_std(img)
+            if key is not None:
+                self.stats_cache.update(key, {"mean": stats["mean"], "std": stats["std"]})
+        return stats["mean"], stats["std"]
 
     def __call__(self, img: NdarrayOrTensor) -> NdarrayOrTensor:
         """
         Apply the z-score normalization to `img`.
         """
         img = convert_to_tensor(img, track_meta=get_track_meta())
-        dtype = self.dtype or img.dtype
-        img = self._normalize(img=img)
+        dtype = get_equivalent_dtype(self.dtype or img.dtype, data_type=torch.Tensor)
+        mean_val, std_val = self._get_stats(img)
+        img = convert_data_type(img, dtype=dtype if dtype.is_floating_point else torch.float32)[0]
+        img.sub_(mean_val).div_(std_val)
         if self.clip:
-            img = clip(img, -1.0, 1.0)
+            img.clamp_(-1.0, 1.0)
         ret: NdarrayOrTensor = convert_data_type(img, dtype=dtype)[0]
         return ret
 
@@ -601,34 +1070,151 @@ class ZScoreNormalize(Transform):
 
 class ZScoreNormalized(MapTransform):
     """
-    Dictionary-based wrapper of :py:class:`monai.transforms.ScaleIntensityRangePercentiles`.
+    Dictionary-based wrapper of :py:class:`ZScoreNormalize`.
 
     Args:
         keys: keys of the corresponding items to be transformed.
             See also: monai.transforms.MapTransform
+        clip: whether to clip the normalized intensities to [-1, 1].
+        dtype: output data type, if None, same as input image. defaults to float32.
+        allow_missing_keys: don't raise exception if key is missing.
+        stats_dir: cache_dir of the volume store, the per case statistics are kept in its `IntensityStatsCache`.
+    """
+
+    backend = ZScoreNormalize.backend
+
+    def __init__(
+        self,
+        keys: KeysCollection,
+        clip: bool = False,
+        dtype: DtypeLike = np.float32,
+        allow_missing_keys: bool = False,
+        stats_dir: str | None = None,
+    ) -> None:
+        super().__init__(keys, allow_missing_keys)
+        self.scaler = ZScoreNormalize(clip, dtype, IntensityStatsCache(stats_dir) if stats_dir is not None else None)
+
+    def __call__(self, data: Mapping[Hashable, NdarrayOrTensor]) -> dict[Hashable, NdarrayOrTensor]:
+        d = dict(data)
+        for key in self.key_iterator(d):
+            d[key] = self.scaler(d[key])
+        return d
+
+
+class ScaleIntensityHistogramPercentiles(Transform):
+    """
+    Drop-in replacement of :py:class:`monai.transforms.ScaleIntensityRangePercentiles` (without channel_wise).
+
+    The percentiles come from `get_histogram_percentiles` instead of a full sort and are cached per case like
+    the statistics of `ZScoreNormalize`. The image is scaled and clipped in place.
+
+    Args:
         lower: lower percentile.
         upper: upper percentile.
         b_min: intensity target range min.
         b_max: intensity target range max.
         clip: whether to perform clip after scaling.
-        relative: whether to scale to the corresponding percentiles of [b_min, b_max]
-        channel_wise: if True, compute intensity percentile and normalize every channel separately.
-            default to False.
+        relative: whether to scale to the corresponding percentiles of [b_min, b_max].
+        dtype: output data type, if None, same as input image. defaults to float32.
+        stats_cache: Optional `IntensityStatsCache`.
+    """
+
+    backend = [TransformBackends.TORCH]
+
+    def __init__(
+        self,
+        lower: float,
+        upper: float,
+        b_min: float,
+        b_max: float,
+        clip: bool = False,
+        relative: bool = False,
+        dtype: DtypeLike = np.float32,
+        stats_cache: IntensityStatsCache | None = None,
+    ) -> None:
+        if lower < 0.0 or lower > 100.0:
+            raise ValueError("Percentiles must be in the range [0, 100]")
+        if upper < 0.0 or upper > 100.0:
+            raise ValueError("Percentiles must be in the range [0, 100]")
+        self.lower = lower
+        self.upper = upper
+        self.b_min = b_min
+        self.b_max = b_max
+        self.clip = clip
+        self.relative = relative
+        self.dtype = dtype
+        self.stats_cache = stats_cache
+
+    def _get_percentiles(self, img: torch.Tensor) -> Tuple[float, float]:
+        key = self.stats_cache.get_key(img) if self.stats_cache is not None else None
+        cached = self.stats_cache.get(key).get("percentiles", {}) if key is not None else {}
+        names = [f"{self.lower:g}", f"{self.upper:g}"]
+        if not all(name in cached for name in names):
+            values = get_histogram_percentiles(img, [self.lower, self.upper])
+            cached = {**cached, **dict(zip(names, values))}
+            if key is not None:
+                self.stats_cache.update(key, {"percentiles": cached})
+        return cached[names[0]], cached[names[1]]
+
+    def __call__(self, img: NdarrayOrTensor) -> NdarrayOrTensor:
+        img = convert_to_tensor(img, track_meta=get_track_meta())
+        dtype = get_equivalent_dtype(self.dtype or img.dtype, data_type=torch.Tensor)
+        a_min, a_max = self._get_percentiles(img)
+        b_min, b_max = self.b_min, self.b_max
+        if self.relative:
+            b_min = ((self.b_max - self.b_min) * (self.lower / 100.0)) + self.b_min
+            b_max = ((self.b_max - self.b_min) * (self.upper / 100.0)) + self.b_min
+
+        img = convert_data_type(img, dtype=dtype if dtype.is_floating_point else torch.float32)[0]
+        if a_max - a_min == 0.0:
+            logger.warning("Divide by zero (a_min == a_max)")
+            img.sub_(a_min).add_(b_min)
+        else:
+            img.sub_(a_min).mul_((b_max - b_min) / (a_max - a_min)).add_(b_min)
+        if self.clip:
+            img.clamp_(b_min, b_max)
+        ret: NdarrayOrTensor = convert_data_type(img, dtype=dtype)[0]
+        return ret
+
+
+class ScaleIntensityHistogramPercentilesd(MapTransform):
+    """
+    Dictionary-based wrapper of :py:class:`ScaleIntensityHistogramPercentiles`.
+
+    Args:
+        keys: keys of the corresponding items to be transformed.
+            See also: monai.transforms.MapTransform
+        lower: lower percentile.
+        upper: upper percentile.
+        b_min: intensity target range min.
+        b_max: intensity target range max.
+        clip: whether to perform clip after scaling.
+        relative: whether to scale to the corresponding percentiles of [b_min, b_max].
         dtype: output data type, if None, same as input image. defaults to float32.
         allow_missing_keys: don't raise exception if key is missing.
+        stats_dir: cache_dir of the volume store, the per case percentiles are kept in its `IntensityStatsCache`.
     """
 
-    backend = ZScoreNormalize.backend
+    backend = ScaleIntensityHistogramPercentiles.backend
 
     def __init__(
         self,
         keys: KeysCollection,
+        lower: float,
+        upper: float,
+        b_min: float,
+        b_max: float,
         clip: bool = False,
+        relative: bool = False,
         dtype: DtypeLike = np.float32,
         allow_missing_keys: bool = False,
+        stats_dir: str | None = None,
     ) -> None:
         super().__init__(keys, allow_missing_keys)
-        self.scaler = ZScoreNormalize(clip, dtype)
+        self.scaler = ScaleIntensityHistogramPercentiles(
+            lower, upper, b_min, b_max, clip, relative, dtype,
+            IntensityStatsCache(stats_dir) if stats_dir is not None else None,
+        )
 
     def __call__(self, data: Mapping[Hashable, NdarrayOrTensor]) -> dict[Hashable, NdarrayOrTensor]:
         d = dict(data)
@@ -637,6 +1223,134 @@ class ZScoreNormalized(MapTransform):
         return d
 
 
+@lru_cache(maxsize=32)
+def get_gaussian_kernel_1d(sigma: float, truncate: float = 4.0, approx: str = "sampled") -> np.ndarray:
+    """
+    Cached 1D Gaussian kernel.
+
+    Args:
+        sigma: standard deviation of the kernel.
+        truncate: radius of the kernel in multiples of sigma.
+        approx: "sampled" reproduces `scipy.ndimage.gaussian_filter` (sampled and normalized),
+            "erf" reproduces `monai.networks.layers.GaussianFilter` (integrated over each voxel, not normalized).
+
+    Returns:
+        The kernel as float64 array of length 2 * radius + 1.
+    """
+    if approx == "sampled":
+        radius = int(truncate * float(sigma) + 0.5)
+        x = np.arange(-radius, radius + 1, dtype=np.float64)
+        kernel = np.exp(-0.5 / float(sigma) ** 2 * x**2)
+        return kernel / kernel.sum()
+    elif approx == "erf":
+        radius = int(max(float(sigma) * truncate, 0.5) + 0.5)
+        x = np.arange(-radius, radius + 1, dtype=np.float64)
+        t = 0.70710678 / abs(float(sigma))
+        return np.clip(0.5 * (erf(t * (x + 0.5)) - erf(t * (x - 0.5))), 0, None)
+    raise ValueError(f"Unknown Gaussian approximation {approx}")
+
+
+@lru_cache(maxsize=32)
+def get_sphere_stencil(
+    sigmas: Tuple[float, ...], truncate: float = 4.0, approx: str = "sampled", threshold: float = 0.1
+) -> np.ndarray:
+    """
+    Cached boolean stencil of all offsets where a single normalized Gaussian click exceeds `threshold`,
+    i.e. the disk the dense implementation gets from thresholding the normalized signal.
+    """
+    kernels = [get_gaussian_kernel_1d(sigma, truncate, approx) for sigma in sigmas]
+    kernels = [kernel / kernel[len(kernel) // 2] for kernel in kernels]
+    return reduce(np.multiply.outer, kernels) > threshold
+
+
+def render_gaussian_points(
+    out: np.ndarray,
+    points,
+    sigma: Sequence[float] | float,
+    truncate: float = 4.0,
+    approx: str = "sampled",
+    mode: str = "reflect",
+    disks: bool = False,
+) -> bool:
+    """
+    Render min/max normalized Gaussians around `points` into the zero initialized array `out`.
+
+    The separable Gaussian is only evaluated inside the +-radius box of each point, so the cost depends on
+    sigma and the number of points instead of the volume size. Up to float rounding the result equals
+    setting the points to 1, filtering the whole volume and min/max normalizing it.
+
+    Args:
+        out: zero initialized array the signal is written into, shape (spatial_dim1, [, spatial_dim2, ...]).
+        points: the click coordinates, points with negative coordinates are skipped.
+        sigma: standard deviation, either one value or one per spatial dimension.
+        truncate: radius of the kernel in multiples of sigma.
+        approx: see `get_gaussian_kernel_1d`.
+        mode: "reflect" for the boundary handling of `scipy.ndimage.gaussian_filter`, "constant" for the zero
+            padding of `monai.networks.layers.GaussianFilter`.
+        disks: fill the precomputed sphere stencil of each point with 1 instead of rendering the Gaussian.
+
+    Returns:
+        True if at least one point has been rendered.
+    """
+    shape = out.shape
+    sigmas = tuple(float(s) for s in ensure_tuple_rep(sigma, len(shape)))
+    kernels = [get_gaussian_kernel_1d(s, truncate, approx) for s in sigmas]
+    radii = [len(kernel) // 2 for kernel in kernels]
+
+    # Setting a voxel to 1 twice is the same as setting it once, points outside of the volume get clamped
+    points = {
+        tuple(max(0, min(int(c), n - 1)) for c, n in zip(np.asarray(p)[-len(shape):], shape))
+        for p in points
+        if not np.any(np.asarray(p) < 0)
+    }
+    if len(points) == 0:
+        return False
+    if mode == "reflect" and any(r >= n for r, n in zip(radii, shape)):
+        # Reflections of reflections would be necessary, just do it densely
+        for p in points:
+            out[p] = 1.0
+        out[...] = gaussian_filter(out, sigma=sigmas, truncate=truncate)
+        out -= out.min()
+        out /= out.max()
+        return True
+
+    box_start = list(shape)
+    box_stop = [0] * len(shape)
+    for p in points:
+        slices, profiles = [], []
+        for axis, (c, n, r, kernel) in enumerate(zip(p, shape, radii, kernels)):
+            lo, hi = max(c - r, 0), min(c + r + 1, n)
+            slices.append(slice(lo, hi))
+            box_start[axis], box_stop[axis] = min(box_start[axis], lo), max(box_stop[axis], hi)
+            if disks:
+                continue
+            profile = kernel[lo - c + r : hi - c + r].copy()
+            if mode == "reflect":
+                # scipy's "reflect" (d c b a | a b c d) mirrors the point to -1 - c and 2 * n - 1 - c
+                x = np.arange(lo, hi)
+                for mirror in (-1 - c, 2 * n - 1 - c):
+                    d = x - mirror
+                    valid = np.abs(d) <= r
+                    profile[valid] += kernel[d[valid] + r]
+            profiles.append(profile)
+
+        if disks:
+            stencil = get_sphere_stencil(sigmas, truncate, approx)
+            stencil = stencil[tuple(slice(sl.start - c + r, sl.stop - c + r) for sl, c, r in zip(slices, p, radii))]
+            out[tuple(slices)][stencil] = 1.0
+        else:
+            out[tuple(slices)] += reduce(np.multiply.outer, profiles).astype(out.dtype, copy=False)
+
+    if disks:
+        return True
+    # Everything outside of the boxes stays exactly 0, so the min is 0 unless the boxes cover the whole volume
+    box = tuple(slice(start, stop) for start, stop in zip(box_start, box_stop))
+    covers_volume = all(start == 0 and stop == n for start, stop, n in zip(box_start, box_stop, shape))
+    min_val = out.min() if covers_volume else 0.0
+    max_val = out[box].max()
+    out[box] -= min_val
+    out[box] /= max_val - min_val
+    return True
 
 
 class AddGuidanceSignald(MapTransform):
@@ -654,23 +1368,15 @@ class AddGuidanceSignald(MapTransform):
         self.sigma = sigma
         self.number_intensity_ch = number_intensity_ch
 
-    def signal(self, shape, points):
-        signal = np.zeros(shape, dtype=np.float32)
-
-        flag = False
-        for p in points:
-            if np.any(np.asarray(p) < 0):
-                continue
-            if len(shape) == 3:
-                signal[p[-3], p[-2], p[-1]] = 1.0
-            else:
-                signal[p[-2], p[-1]] = 1.0
-            flag = True
-
-        if flag:
-            signal = gaussian_filter(signal, sigma=self.sigma)
-            signal = (signal - np.min(signal)) / (np.max(signal) - np.min(signal))
-        return torch.Tensor(signal)[None]
+    def signal(self, shape, points, out: np.ndarray | None = None):
+        """
+        Gaussian heatmap of `points`, equal to scipy's `gaussian_filter` on the clicks followed by min/max
+        normalization, but only evaluated in the neighbourhood of each click (see `render_gaussian_points`).
+        If given, `out` has to be zero initialized and is filled in place.
+        """
+        signal = np.zeros(shape, dtype=np.float32) if out is None else out
+        render_gaussian_points(signal, points, self.sigma)
+        return torch.from_numpy(signal)[None]
 
     def __call__(self, data):
         d = dict(data)
@@ -685,13 +1391,18 @@ class AddGuidanceSignald(MapTransform):
 
                 shape = img.shape[-2:] if len(img.shape) == 3 else img.shape[-3:]
                 device = img.device if isinstance(img, torch.Tensor) else None
-                res = self.signal(shape, guidance).to(device=device)
-                #pos = self.signal(shape, guidance[0]).to(device=device)
-                #neg = self.signal(shape, guidance[1]).to(device=device)
-                result = torch.concat([img if isinstance(img, torch.Tensor) else torch.Tensor(img), res])
-                #print('result unique', torch.unique(result))
+                # Preallocate the output and render the heatmap directly into its last channel
+                channels = img.shape[0]
+                result = torch.zeros((channels + 1, *shape), dtype=torch.float32)
+                result[:channels] = img.as_tensor() if isinstance(img, MetaTensor) else torch.as_tensor(img)
+                self.signal(shape, guidance, out=result[channels].numpy())
+                result = result.to(device=device)
+                if isinstance(img, MetaTensor):
+                    result = MetaTensor(
+                        result, meta=deepcopy(img.meta), applied_operations=deepcopy(img.applied_operations)
+                    )
             else:
-                s = torch.zeros_like(img[0])[None]
+                s = torch.zeros_like(img[0], dtype=torch.float32)[None]
                 result = torch.concat([img, s, s])
             #result = torch.round(result)
             
@@ -745,42 +1456,24 @@ class AddGuidanceSignal(MapTransform):
                 assert (
                     first_point_size == 4 or first_point_size == 3
                 ), f"first_point_size is {first_point_size}, first_point is {guidance[0]}"
-                signal = torch.zeros(
-                    (1, image.shape[-3], image.shape[-2], image.shape[-1]),
-                    device=self.device,
-                )
+                spatial_shape = (image.shape[-3], image.shape[-2], image.shape[-1])
             else:
                 assert first_point_size == 3, f"first_point_size is {first_point_size}, first_point is {guidance[0]}"
-                signal = torch.zeros((1, image.shape[-2], image.shape[-1]), device=self.device)
-
-            sshape = signal.shape
-
-            for point in guidance:
-                if torch.any(point < 0):
-                    continue
-                if dimensions == 3:
-                    # Making sure points fall inside the image dimension
-                    p1 = max(0, min(int(point[-3]), sshape[-3] - 1))
-                    p2 = max(0, min(int(point[-2]), sshape[-2] - 1))
-                    p3 = max(0, min(int(point[-1]), sshape[-1] - 1))
-                    signal[:, p1, p2, p3] = 1.0
-                else:
-                    p1 = max(0, min(int(point[-2]), sshape[-2] - 1))
-                    p2 = max(0, min(int(point[-1]), sshape[-1] - 1))
-                    signal[:, p1, p2] = 1.0
-
-            # Apply a Gaussian filter to the signal
-            if torch.max(signal[0]) > 0:
-                signal_tensor = signal[0]
-                if self.sigma != 0:
-                    pt_gaussian = GaussianFilter(len(signal_tensor.shape), sigma=self.sigma)
-                    signal_tensor = pt_gaussian(signal_tensor.unsqueeze(0).unsqueeze(0))
-                    signal_tensor = signal_tensor.squeeze(0).squeeze(0)
-
-                signal[0] = signal_tensor
-                signal[0] = (signal[0] - torch.min(signal[0])) / (torch.max(signal[0]) - torch.min(signal[0]))
-                if self.disks:
-                    signal[0] = (signal[0] > 0.1) * 1.0  # 0.1 with sigma=1 --> radius = 3, otherwise it is a cube
+                spatial_shape = (image.shape[-2], image.shape[-1])
+
+            # Render on the host only around the clicks, points outside of the image get clamped onto its border
+            signal_np = np.zeros((1, *spatial_shape), dtype=np.float32)
+            points = guidance.cpu().numpy()
+            if self.sigma != 0:
+                # Same kernel and zero padding as monai.networks.layers.GaussianFilter
+                render_gaussian_points(signal_np[0], points, self.sigma, approx="erf", mode="constant", disks=self.disks)
+            else:
+                for point in points:
+                    if np.any(point < 0):
+                        continue
+                    p = tuple(max(0, min(int(c), n - 1)) for c, n in zip(point[-dimensions:], spatial_shape))
+                    signal_np[0][p] = 1.0
+            signal = torch.from_numpy(signal_np).to(device=self.device)
             if not (torch.min(signal[0]).item() >= 0 and torch.max(signal[0]).item() <= 1.0):
                 raise UserWarning(
                     "[WARNING] Bad signal values",
@@ -938,6 +1631,45 @@ class SplitDimd(MapTransform, MultiSampleTrait):
         return d
 
 
+def _detached_copy(value):
+    if isinstance(value, torch.Tensor):
+        # MetaTensor.to keeps the meta data, copy=True also copies tensors which are on the CPU already
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    return value
+
+
+class AsyncSaveImaged(MapTransform):
+    """
+    Run a save transform (SaveImaged, SaveImagedSlices) in the background writer pool.
+
+    The keys of the saver are copied to the CPU and detached, together with the meta dicts they are passed to
+    the writer threads of `get_writer_pool`. The data is returned unchanged right away, so the evaluator
+    iteration does not wait for the compression and the disk. `WriterFlushHandler` waits for the writes.
+
+    Args:
+        saver: The save transform, only its `keys` are copied.
+    """
+
+    def __init__(self, saver: MapTransform) -> None:
+        super().__init__(saver.keys, allow_missing_keys=True)
+        self.saver = saver
+
+    def __call__(self, data: Mapping[Hashable, torch.Tensor]) -> dict[Hashable, torch.Tensor]:
+        d = dict(data)
+        # the meta dicts are small and not modified afterwards, only the volumes are copied
+        copy = {k: v for k, v in d.items() if not isinstance(v, (torch.Tensor, np.ndarray))}
+        nbytes = 0
+        for key in self.key_iterator(d):
+            copy[key] = _detached_copy(d[key])
+            value = copy[key]
+            nbytes += value.nbytes if isinstance(value, np.ndarray) else value.numel() * value.element_size()
+        if nbytes > 0:
+            get_writer_pool().submit(self.saver, copy, nbytes=nbytes)
+        return d
+
+
 class SaveImagedSlices(MapTransform):
     """
     Dictionary-based wrapper of :py:class:`monai.transforms.SaveImage`.
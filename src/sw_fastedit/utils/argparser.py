@@ -22,11 +22,11 @@ import os
 import pathlib
 import sys
 import tempfile
-import time
 import uuid
 
 import torch
 
+from sw_fastedit.utils.distributed import init_distributed
 from sw_fastedit.utils.helper import get_actual_cuda_index_of_device, get_git_information, gpu_usage
 from sw_fastedit.utils.logger import get_logger, setup_loggers
 
@@ -48,7 +48,7 @@ def parse_args():
         "--cache_dir",
         type=str,
         default="None",
-        help="Code uses a CacheDataset, so stores the transforms on the disk. This parameter is where the data gets stored.",
+        help="Code uses a memory-mapped volume store, so stores the transforms on the disk. This parameter is where the data gets stored.",
     )
     parser.add_argument(
         "-ta",
@@ -63,6 +63,9 @@ def parse_args():
         action="store_true",
         help="To save the prediction in the output_dir/prediction if that is desired",
     )
+    parser.add_argument(
+        "--save_pred_workers", type=int, default=4, help="Writer threads which save the predictions in the background"
+    )
 
     parser.add_argument(
         "--limit_gpu_memory_to",
@@ -87,15 +90,56 @@ def parse_args():
     parser.add_argument(
         "--positive_crop_rate", type=float, default=0.6, help="The rate of positive samples for RandCropByPosNegLabeld"
     )
+    parser.add_argument(
+        "--roi_size",
+        type=int,
+        nargs=3,
+        default=None,
+        help="Train on patches of this size instead of whole volumes, has to be divisible by (32, 32, 16)",
+    )
+    parser.add_argument(
+        "--num_patches", type=int, default=1, help="Number of patches sampled from every training volume (--roi_size)"
+    )
 
     # Configuration
     parser.add_argument("-s", "--seed", type=int, default=36)
     parser.add_argument("--gpu", type=int, default=0, help="Which GPU to use.")
+    # Distributed training is started with torchrun, every rank uses the GPU of its LOCAL_RANK instead of --gpu
+    parser.add_argument(
+        "--dist_backend",
+        default=None,
+        choices=["nccl", "gloo"],
+        help="Backend of the process group, defaults to nccl with CUDA and gloo without",
+    )
     parser.add_argument("--no_log", default=False, action="store_true")
+    parser.add_argument(
+        "--sync_log",
+        default=False,
+        action="store_true",
+        help="Write the log in the logging threads instead of a single background writer thread",
+    )
+    parser.add_argument(
+        "--log_rate_limit",
+        type=float,
+        default=10.0,
+        help="Seconds between two per iteration log messages (shapes, file names) of the same kind, 0 logs all",
+    )
     parser.add_argument("--no_data", default=False, action="store_true")
     parser.add_argument("--dont_check_output_dir", default=False, action="store_true")
     parser.add_argument("--debug", default=False, action="store_true")
     parser.add_argument("--debugpy", default=False, action="store_true")
+    parser.add_argument(
+        "--metric_log_interval",
+        type=int,
+        default=20,
+        help="Every how many iterations the losses and metrics are read back from the GPU and logged, 0: epoch means only",
+    )
+    parser.add_argument(
+        "--sanity_check_interval",
+        type=int,
+        default=None,
+        help="Every how many iterations the input / label sanity checks run, default 10 with --debug, off otherwise",
+    )
 
     # Model
     parser.add_argument(
@@ -122,7 +166,27 @@ def parse_args():
     # Training
     parser.add_argument("-a", "--amp", default=True, action="store_true")
     parser.add_argument("--num_workers", type=int, default=1)
+    # thread: ThreadDataLoader, process: persistent worker processes returning the batches through shared memory
+    parser.add_argument("--loader", default="thread", choices=["thread", "process"])
+    parser.add_argument(
+        "--prefetch_depth", type=int, default=None, help="Batches buffered ahead of the training loop, loader default if None"
+    )
+    # The val samples are deterministic (per case seeded extreme points) and kept in RAM after the first epoch
+    parser.add_argument("--no_val_ram_cache", default=False, action="store_true")
+    # Whole volumes are batched by shape (ShapeBucketBatchSampler), with --roi_size every volume adds --num_patches
+    parser.add_argument("--batch_size", type=int, default=1)
+    # Recompute the activations of the DynUNet stages (or of every block) in the backward instead of keeping them
+    parser.add_argument("--activation_checkpointing", default="none", choices=["none", "stage", "block"])
+    parser.add_argument(
+        "--checkpoint_every", type=int, default=1, help="Only checkpoint every k-th stage / block of the DynUNets"
+    )
     parser.add_argument("-e", "--epochs", type=int, default=100)
+    parser.add_argument(
+        "--accumulate_steps",
+        type=int,
+        default=1,
+        help="Accumulate the gradients of N iterations (source / target pairs for PADA / UGDA) per optimizer step",
+    )
     # LOSS
     # If learning rate is set to 0.001, the DiceCELoss will produce Nans very quickly
     parser.add_argument("-lr", "--learning_rate", type=float, default=1e-4)
@@ -134,6 +198,12 @@ def parse_args():
     parser.add_argument("-lr_adv", "--learning_rate_adv", type=float, default=1e-5)
     parser.add_argument("--eta_min_adv", type=float, default=1e-8)
     parser.add_argument("--lambda_adv", type=float, default=1e-4)
+    parser.add_argument(
+        "--paired_adv_step",
+        default=False,
+        action="store_true",
+        help="PADA / UGDA: train on a source and a target batch in one iteration instead of two alternating ones",
+    )
     parser.add_argument("--optimizer", default="Adam", choices=["Adam", "Novograd"])
     parser.add_argument("--loss_ugda", default="DiceCEL2Loss", choices=["DiceCEL2Loss"])
     parser.add_argument("--loss_pada", default="DiceCeAdvLoss", choices=["DiceCeAdvLoss"])
@@ -161,10 +231,46 @@ def parse_args():
     parser.add_argument("--scale_intensity_ranged", default=False, action="store_true")
     parser.add_argument("--additional_metrics", default=False, action="store_true")
     # Can speed up the training by cropping away some percentiles of the data
+    # Crops every case to the body (air threshold for CT, intensity percentile for MRI) after the resampling
     parser.add_argument("--crop_foreground", default=False, action="store_true")
+    parser.add_argument(
+        "--organ_crop_margin",
+        type=int,
+        default=None,
+        help="With --crop_foreground, additionally crop the training cases to the organ plus this margin in voxels",
+    )
+    # Fuses Orientationd, Spacingd, DivisiblePadd, RandFlipd and RandRotate90d into as few resamplings as possible
+    parser.add_argument("--lazy_resampling", default=False, action="store_true")
 
     # Logging
     parser.add_argument("-f", "--val_freq", type=int, default=1)  # Epoch Level
+    # Tiered validation: a fixed subset of the val cases every --val_freq epochs, the whole val set only every
+    # --val_full_freq epochs, when the subset metric improved and at the end. Checkpoints use the whole val set.
+    parser.add_argument(
+        "--val_subset_size",
+        type=int,
+        default=0,
+        help="Number of val cases per domain, stratified by the organ volume, 0 validates the whole val set",
+    )
+    parser.add_argument(
+        "--val_full_freq",
+        type=int,
+        default=5,
+        help="Validate the whole val set every N epochs, has to be a multiple of --val_freq",
+    )
+    parser.add_argument(
+        "--val_subset_spacing_scale",
+        type=float,
+        default=1.0,
+        help="Resample the val subset to this multiple of the spacing, e.g. 2 for a cheaper validation",
+    )
+    # Validate a copy of the weights in background threads (source and target at once) while the training goes on
+    parser.add_argument("--async_val", default=False, action="store_true")
+    parser.add_argument(
+        "--val_device",
+        default=None,
+        help="Device of the --async_val evaluators, e.g. cuda:1 or cpu, defaults to the device of the training",
+    )
     parser.add_argument("--save_interval", type=int, default=10)  # Save checkpoints every x epochs
 
     parser.add_argument("--eval_only", default=False, action="store_true")
@@ -178,15 +284,55 @@ def parse_args():
     parser.add_argument("--gdt", default=False, action="store_true")
 
 
+    # Offline preprocessing (preprocess.py)
+    parser.add_argument("--preprocessing_workers", type=int, default=os.cpu_count())
+
     # Set up additional information concerning the environment and the way the script was called
     args = parser.parse_args()
     return args
 
 
+def setup_environment_for_preprocessing(args):
+    """
+    CPU only counterpart of setup_environment_and_adapt_args used by preprocess.py.
+
+    Args:
+        args: The parsed command line arguments.
+
+    Returns:
+        Tuple: The adapted args and the logger.
+
+    Raises:
+        UserWarning: If no persistent cache directory is given.
+    """
+    args.caller_args = sys.argv
+    args.labels = {"organ":args.organ, "background": 0}
+
+    if args.cache_dir == "None" or args.throw_away_cache:
+        raise UserWarning("Preprocessing needs a persistent cache directory (-c) and cannot be combined with --throw_away_cache")
+    pathlib.Path(args.cache_dir).mkdir(parents=True, exist_ok=True)
+    pathlib.Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+
+    if args.debug:
+        loglevel = logging.DEBUG
+    else:
+        loglevel = logging.INFO
+    if args.no_log:
+        log_folder_path = None
+    else:
+        log_folder_path = args.output_dir
+    setup_loggers(loglevel, log_folder_path, use_queue=not args.sync_log, rate_limit=args.log_rate_limit)
+    logger = get_logger()
+
+    return args, logger
+
+
 def setup_environment_and_adapt_args(args):
     args.caller_args = sys.argv
     args.env = os.environ
     args.git = get_git_information()
+    # sets args.rank and args.world_size and, with torchrun, args.gpu
+    init_distributed(args)
 
     device = torch.device(f"cuda:{args.gpu}")
     
@@ -208,12 +354,12 @@ def setup_environment_and_adapt_args(args):
     #14 bladder
     #15 prostate/ uterus
 
-    if not args.dont_check_output_dir and os.path.isdir(args.output_dir):
+    # in distributed training the ranks share the output dir, rank 0 may already have created it
+    if args.rank == 0 and not args.dont_check_output_dir and os.path.isdir(args.output_dir):
         raise UserWarning(
             f"output path {args.output_dir} already exists. Please choose another path or set --dont_check_output_dir"
         )
-    if not os.path.exists(args.output_dir):
-        pathlib.Path(args.output_dir).mkdir(parents=True)
+    pathlib.Path(args.output_dir).mkdir(parents=True, exist_ok=True)
 
     if args.debug:
         loglevel = logging.DEBUG
@@ -223,12 +369,50 @@ def setup_environment_and_adapt_args(args):
         log_folder_path = None
     else:
         log_folder_path = args.output_dir
-    setup_loggers(loglevel, log_folder_path)
+    if args.rank > 0:
+        # only rank 0 writes the log, the other ranks only report problems
+        loglevel, log_folder_path = logging.WARNING, None
+    setup_loggers(loglevel, log_folder_path, use_queue=not args.sync_log, rate_limit=args.log_rate_limit)
     logger = get_logger()
+    if args.world_size > 1:
+        logger.info(f"Distributed training: rank {args.rank} of {args.world_size}")
+
+    if not 0.0 <= args.positive_crop_rate <= 1.0:
+        raise UserWarning("--positive_crop_rate has to be in [0, 1]")
+    if args.loader == "process" and args.num_workers < 1:
+        raise UserWarning("--loader process needs at least one worker (--num_workers)")
+    if args.prefetch_depth is not None and args.prefetch_depth < 1:
+        raise UserWarning("--prefetch_depth has to be at least 1")
+    if args.accumulate_steps < 1:
+        raise UserWarning("--accumulate_steps has to be at least 1")
+    if args.checkpoint_every < 1:
+        raise UserWarning("--checkpoint_every has to be at least 1")
+    if args.metric_log_interval < 0:
+        raise UserWarning("--metric_log_interval may not be negative")
+    if args.sanity_check_interval is None:
+        args.sanity_check_interval = 10 if args.debug else 0
+
+    if args.val_subset_size < 0:
+        raise UserWarning("--val_subset_size may not be negative")
+    if args.val_full_freq < 1:
+        raise UserWarning("--val_full_freq has to be at least 1")
+    if args.val_subset_size > 0 and args.val_full_freq % args.val_freq != 0:
+        # the tiered validation only runs every --val_freq epochs
+        raise UserWarning("--val_full_freq has to be a multiple of --val_freq")
+    if args.val_subset_spacing_scale <= 0:
+        raise UserWarning("--val_subset_spacing_scale has to be positive")
+    if args.val_device is not None and not args.async_val:
+        raise UserWarning("--val_device needs --async_val")
+    if args.async_val and args.world_size > 1:
+        # the collectives of the background validation would interleave with the ones of the training
+        raise UserWarning("--async_val is not supported in distributed training")
 
     if args.eval_only:
         # Avoid a loading error from the training where it complains the number of epochs is too low
         args.epochs = 100000
+        # the evaluators run in the foreground on the loaded networks
+        args.async_val = False
+        args.val_device = None
 
     if args.cache_dir == "None":
         if not args.throw_away_cache:
@@ -239,23 +423,18 @@ def setup_environment_and_adapt_args(args):
         if args.throw_away_cache:
             args.cache_dir = f"{args.cache_dir}/{uuid.uuid4()}"
         else:
-            logger.warning("Reusing the cache_dir between different network runs may lead to cache inconsistencies.")
-            logger.warning("Most importantly the crops may not be updated if you set them differently")
-            logger.warning("PersistentDataset does not detect this automatically but only checks if the hash matches")
-            logger.warning("Waiting shortly...")
-            time.sleep(10)
+            # The volume store keys its entries by a hash of the preprocessing config, so reusing it is safe
+            logger.info(f"Reusing the cache_dir {args.cache_dir}")
             args.cache_dir = f"{args.cache_dir}"
 
-    if not os.path.exists(args.cache_dir):
-        pathlib.Path(args.cache_dir).mkdir(parents=True)
+    pathlib.Path(args.cache_dir).mkdir(parents=True, exist_ok=True)
 
     if args.data_dir == "None":
         args.data_dir = f"{args.output_dir}/data"
         logger.info(f"--data was None, so that {args.data_dir}/data was selected instead")
 
     if not args.no_data:
-        if not os.path.exists(args.data_dir):
-            pathlib.Path(args.data_dir).mkdir(parents=True)
+        pathlib.Path(args.data_dir).mkdir(parents=True, exist_ok=True)
 
 
     args.real_cuda_device = get_actual_cuda_index_of_device(torch.device(f"cuda:{args.gpu}"))
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, List
+
+from monai.config import IgniteInfo
+from monai.utils import min_version, optional_import
+
+Events, _ = optional_import("ignite.engine", IgniteInfo.OPT_IMPORT_VERSION, min_version, "Events")
+if TYPE_CHECKING:
+    from ignite.engine import Engine
+else:
+    Engine, _ = optional_import("ignite.engine", IgniteInfo.OPT_IMPORT_VERSION, min_version, "Engine")
+
+logger = logging.getLogger("sw_fastedit")
+
+DEFAULT_WRITER_THREADS = 4
+
+# Shared by all AsyncSaveImaged transforms, created on first use
+_writer_pool: AsyncWriterPool | None = None
+
+
+class AsyncWriterPool:
+    """
+    Bounded pool of writer threads, used to save the predictions outside of the evaluator iteration.
+
+    Compressing and writing a volume (gzip, ITK) releases the GIL for most of the time, so threads write in
+    parallel without copying the data into other processes.
+
+    Args:
+        max_workers (int): Number of writer threads.
+        max_pending (int | None): Maximum number of writes that are queued or running. `submit` blocks while the
+            limit is reached (back-pressure), so a slow disk cannot pile up volumes in RAM. 2 * max_workers if None.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WRITER_THREADS, max_pending: int | None = None) -> None:
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="writer")
+        self.slots = threading.BoundedSemaphore(max_pending if max_pending is not None else 2 * max_workers)
+        self.lock = threading.Lock()
+        self.futures: List[Future] = []
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self.start_time = None
+        self.writes = 0
+        self.bytes = 0
+        self.blocked_time = 0.0
+
+    def submit(self, fn: Callable, *args, nbytes: int = 0) -> Future:
+        """
+        Run `fn(*args)` in a writer thread, `nbytes` is only used for the throughput report.
+        """
+        start_time = time.perf_counter()
+        self.slots.acquire()
+        with self.lock:
+            self.blocked_time += time.perf_counter() - start_time
+            if self.start_time is None:
+                self.start_time = start_time
+            self.writes += 1
+            self.bytes += nbytes
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        with self.lock:
+            self.futures.append(future)
+        return future
+
+    def flush(self) -> None:
+        """
+        Wait until all submitted writes are done and log the throughput since the last flush.
+
+        Raises:
+            The first exception of a failed write, after all other writes have finished.
+        """
+        with self.lock:
+            futures, self.futures = self.futures, []
+        errors = [f.exception() for f in futures]
+        errors = [e for e in errors if e is not None]
+        with self.lock:
+            if self.writes > 0:
+                elapsed = time.perf_counter() - self.start_time
+                logger.info(
+                    f"Wrote {self.writes} volumes ({self.bytes / 1024**2:.1f} MB) in {elapsed:.1f}s with "
+                    f"{self.max_workers} writer threads, {self.bytes / 1024**2 / max(elapsed, 1e-6):.1f} MB/s, "
+                    f"blocked {self.blocked_time:.1f}s on a full queue"
+                )
+            self._reset_stats()
+        for e in errors:
+            logger.error(f"Writing a prediction failed: {e!r}")
+        if len(errors) > 0:
+            raise errors[0]
+
+
+def get_writer_pool() -> AsyncWriterPool:
+    global _writer_pool
+    if _writer_pool is None:
+        _writer_pool = AsyncWriterPool()
+    return _writer_pool
+
+
+def set_writer_threads(max_workers: int) -> None:
+    """
+    Set the number of writer threads, e.g. from --save_pred_workers. Pending writes of the old pool are flushed.
+    """
+    global _writer_pool
+    if _writer_pool is not None:
+        if _writer_pool.max_workers == max_workers:
+            return
+        _writer_pool.flush()
+        _writer_pool.executor.shutdown()
+    _writer_pool = AsyncWriterPool(max_workers=max_workers)
+
+
+class WriterFlushHandler:
+    """
+    Wait for the asynchronous prediction writes at the end of every run of the engine (Events.COMPLETED), so the
+    predictions of an evaluation are on disk once it returns.
+    """
+
+    def attach(self, engine: Engine) -> None:
+        engine.add_event_handler(Events.COMPLETED, self)
+
+    def __call__(self, engine: Engine) -> None:
+        if _writer_pool is not None:
+            _writer_pool.flush()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import logging
+from typing import List
+
+import torch
+from monai.networks.nets.dynunet import DynUNet
+from torch import nn
+from torch.utils.checkpoint import checkpoint
+
+logger = logging.getLogger("sw_fastedit")
+
+# none: keep all activations, stage: one segment per encoder / decoder stage,
+# block: the transposed convolution and the residual block of a decoder stage are separate segments
+ACTIVATION_CHECKPOINTING_MODES = ("none", "stage", "block")
+
+
+class CheckpointedForward:
+    """
+    Replaces the `forward` of a single module instance: in training with grad enabled the activations inside the
+    module are not kept for the backward but recomputed from its input (`torch.utils.checkpoint`), otherwise the
+    module runs as usual.
+
+    The non-reentrant checkpoint is used since it supports `torch.autograd.grad`, `retain_graph` and inputs
+    without grad (the image), and restores the autocast state when recomputing. The module itself is not
+    wrapped, so the `state_dict` keys and the skip layers of the DynUNet, which reference the stage modules,
+    stay the same.
+
+    The parameters of the module must keep their `requires_grad` between the forward and every backward which
+    passes through it, the trainers which freeze a network before a backward pass the parameters to update as
+    `inputs` so the backward does not reach the frozen network.
+    """
+
+    def __init__(self, module: nn.Module) -> None:
+        self.module = module
+
+    def __call__(self, *args):
+        forward = type(self.module).forward
+        if self.module.training and torch.is_grad_enabled():
+            return checkpoint(forward, self.module, *args, use_reentrant=False)
+        return forward(self.module, *args)
+
+
+def get_checkpoint_segments(network: DynUNet, mode: str) -> List[nn.Module]:
+    """
+    The modules of `network` which are checkpointed in `mode`, from the full resolution encoder stage to the
+    full resolution decoder stage. The output block is never checkpointed.
+    """
+    if mode not in ACTIVATION_CHECKPOINTING_MODES:
+        raise ValueError(f"Unknown activation checkpointing mode {mode}, use one of {ACTIVATION_CHECKPOINTING_MODES}")
+    if mode == "none":
+        return []
+    segments = [network.input_block, *network.downsamples, network.bottleneck]
+    if mode == "stage":
+        return segments + list(network.upsamples)
+    return segments + [module for up in network.upsamples for module in (up.transp_conv, up.conv_block)]
+
+
+def enable_activation_checkpointing(network: nn.Module, mode: str = "stage", every: int = 1) -> int:
+    """
+    Checkpoint every `every`-th segment (see `get_checkpoint_segments`) of a DynUNet, starting with the full
+    resolution one. Trades a second forward of the checkpointed segments in the backward for the memory of
+    their activations. Other networks (the Discriminator) are left as they are.
+
+    Returns:
+        int: The number of checkpointed segments.
+    """
+    if every < 1:
+        raise ValueError(f"every has to be >= 1, got {every}")
+    if not isinstance(network, DynUNet):
+        return 0
+    segments = get_checkpoint_segments(network, mode)[::every]
+    for module in segments:
+        module.forward = CheckpointedForward(module)
+    return len(segments)
@@ -1,6 +1,13 @@
+import logging
+import math
+
 import torch
 from torch.utils.data import Sampler
 
+from sw_fastedit.utils.distributed import get_rank, get_world_size
+
+logger = logging.getLogger("sw_fastedit")
+
 class AlternatingSampler(Sampler):
     def __init__(self, dataset1, dataset2):
         self.dataset1 = dataset1 #source dataset
@@ -44,4 +51,176 @@ class SpecificSampler(Sampler):
                 yield indices1[i%len(indices1)].item()
 
     def __len__(self):
-        return self.epoch_length
\ No newline at end of file
+        return self.epoch_length
+
+
+def shard(indices, num_samples, num_replicas, rank):
+    """
+    The `num_samples` indices of `rank`: every `num_replicas`-th index starting at `rank`, wrapping around the
+    end of `indices`, so all ranks get the same number of samples and together they cover all of `indices`.
+    """
+    return [indices[(rank + i * num_replicas) % len(indices)] for i in range(num_samples)]
+
+
+class DistributedAlternatingSampler(Sampler):
+    """
+    AlternatingSampler for distributed training: both datasets are shuffled with the same seed on every rank and
+    split into disjoint shards, every rank alternates between its source and its target shard.
+
+    Call `set_epoch` at the start of every epoch (done by the Trainer) to shuffle differently in every epoch.
+
+    Args:
+        dataset1: source dataset.
+        dataset2: target dataset, its indices are offset by len(dataset1) as in the ConcatDataset.
+        num_replicas: number of ranks, defaults to the world size.
+        rank: rank of this process, defaults to the rank in the process group.
+        seed: seed of the shuffling, has to be the same on all ranks.
+    """
+
+    def __init__(self, dataset1, dataset2, num_replicas=None, rank=None, seed=0):
+        self.len1 = len(dataset1)
+        self.len2 = len(dataset2)
+        self.num_replicas = get_world_size() if num_replicas is None else num_replicas
+        self.rank = get_rank() if rank is None else rank
+        self.seed = seed
+        self.epoch = 0
+        self.num_samples1 = math.ceil(self.len1 / self.num_replicas)
+        self.num_samples2 = math.ceil(self.len2 / self.num_replicas)
+        self.epoch_length = 2 * max(self.num_samples1, self.num_samples2)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices1 = torch.randperm(self.len1, generator=generator).tolist()
+        # add length of first dataset to the second one to avoid overlapping indices
+        indices2 = (torch.randperm(self.len2, generator=generator) + self.len1).tolist()
+        indices1 = shard(indices1, self.num_samples1, self.num_replicas, self.rank)
+        indices2 = shard(indices2, self.num_samples2, self.num_replicas, self.rank)
+        for i in range(self.epoch_length):
+            if i % 2 == 0:
+                yield indices1[(i // 2) % len(indices1)]
+            else:
+                yield indices2[(i // 2) % len(indices2)]
+
+    def __len__(self):
+        return self.epoch_length
+
+
+class DistributedSpecificSampler(Sampler):
+    """
+    SpecificSampler for distributed training: the ranks split the samples of SpecificSampler, see
+    DistributedAlternatingSampler for the arguments.
+    """
+
+    def __init__(self, dataset1, dataset2, num_replicas=None, rank=None, seed=0):
+        self.len1 = len(dataset1)
+        self.num_replicas = get_world_size() if num_replicas is None else num_replicas
+        self.rank = get_rank() if rank is None else rank
+        self.seed = seed
+        self.epoch = 0
+        self.epoch_length = math.ceil(2 * max(len(dataset1), len(dataset2)) / self.num_replicas)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices1 = torch.randperm(self.len1, generator=generator).tolist()
+        yield from shard(indices1, self.epoch_length, self.num_replicas, self.rank)
+
+    def __len__(self):
+        return self.epoch_length
+
+
+def get_spatial_shapes(dataset):
+    """
+    Padded spatial shape of every case of a MemmapDataset. Cases which are not in the store yet are preprocessed
+    here, run preprocess.py beforehand to do that in parallel.
+    """
+    shapes = []
+    for index in range(len(dataset)):
+        shape = dataset.get_cached_spatial_shape(index)
+        if shape is None:
+            logger.info(f"Preprocessing case {index} of {len(dataset)} to get its shape")
+            dataset.get_cached_item(index)
+            shape = dataset.get_cached_spatial_shape(index)
+        shapes.append(tuple(shape))
+    return shapes
+
+
+def get_bucket_key(shape):
+    # RandRotate90d swaps the first two axes, so they are compared independently of their order
+    return (shape[-1], max(shape[:-1]), min(shape[:-1])) if len(shape) == 3 else tuple(shape)
+
+
+class ShapeBucketBatchSampler(Sampler):
+    """
+    Batch sampler which only puts cases of the same dataset and of a similar padded shape into one batch.
+
+    Every epoch the cases of each dataset are shuffled, stably sorted by `get_bucket_key` and cut into batches of
+    `batch_size`, then the order of the batches is shuffled. The collate function only has to pad a batch to the
+    largest shape within it instead of the largest shape of the whole dataset.
+
+    Args:
+        dataset1: source MemmapDataset.
+        dataset2: target MemmapDataset, its indices are offset by len(dataset1) as in the ConcatDataset.
+        batch_size: number of cases per batch.
+        alternate: alternate between batches of both datasets like AlternatingSampler. Otherwise only dataset1 is
+            sampled, for as many cases as SpecificSampler yields.
+        num_replicas: number of ranks in distributed training. With more than one the batches are shuffled with
+            `seed` and the epoch (see `set_epoch`) and the ranks split them like DistributedAlternatingSampler.
+        rank: rank of this process in distributed training.
+        seed: seed of the shuffling in distributed training, has to be the same on all ranks.
+    """
+
+    def __init__(self, dataset1, dataset2, batch_size, alternate=True, num_replicas=1, rank=0, seed=0):
+        self.batch_size = batch_size
+        self.alternate = alternate
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        self.offset = len(dataset1)
+        self.shapes1 = get_spatial_shapes(dataset1)
+        self.shapes2 = get_spatial_shapes(dataset2) if alternate else None
+        self.batches1 = math.ceil(len(dataset1) / batch_size)
+        if alternate:
+            self.batches2 = math.ceil(len(dataset2) / batch_size)
+            self.num_batches = 2 * max(math.ceil(self.batches1 / num_replicas), math.ceil(self.batches2 / num_replicas))
+        else:
+            self.num_batches = math.ceil(math.ceil(2 * max(len(dataset1), len(dataset2)) / batch_size) / num_replicas)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _get_batches(self, shapes, offset, generator=None):
+        order = torch.randperm(len(shapes), generator=generator).tolist()
+        order.sort(key=lambda i: get_bucket_key(shapes[i]))
+        batches = [[i + offset for i in order[j : j + self.batch_size]] for j in range(0, len(order), self.batch_size)]
+        return [batches[i] for i in torch.randperm(len(batches), generator=generator).tolist()]
+
+    def __iter__(self):
+        generator = None
+        if self.num_replicas > 1:
+            # the same batches on all ranks, each rank takes its share of them
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+        batches1 = self._get_batches(self.shapes1, 0, generator)
+        if not self.alternate:
+            yield from shard(batches1, self.num_batches, self.num_replicas, self.rank)
+            return
+        batches2 = self._get_batches(self.shapes2, self.offset, generator)
+        batches1 = shard(batches1, math.ceil(self.batches1 / self.num_replicas), self.num_replicas, self.rank)
+        batches2 = shard(batches2, math.ceil(self.batches2 / self.num_replicas), self.num_replicas, self.rank)
+        for i in range(self.num_batches):
+            if i % 2 == 0:
+                yield batches1[(i // 2) % len(batches1)]
+            else:
+                yield batches2[(i // 2) % len(batches2)]
+
+    def __len__(self):
+        return self.num_batches
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Iterable, List
+
+import torch
+import torch.distributed as dist
+
+logger = logging.getLogger("sw_fastedit")
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    """Rank of this process, also before the process group is initialized (torchrun sets RANK)."""
+    if is_distributed():
+        return dist.get_rank()
+    return int(os.environ.get("RANK", 0))
+
+
+def get_world_size() -> int:
+    if is_distributed():
+        return dist.get_world_size()
+    return int(os.environ.get("WORLD_SIZE", 1))
+
+
+def get_local_world_size() -> int:
+    """Number of ranks on this machine."""
+    return int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+
+
+def is_main_process() -> bool:
+    return get_rank() == 0
+
+
+def init_distributed(args) -> None:
+    """
+    Join the process group if the script was started by torchrun (WORLD_SIZE > 1), otherwise and if the group was
+    already joined it only sets args.rank and args.world_size.
+
+    With CUDA every rank uses the GPU of its LOCAL_RANK (overrides --gpu) and the default backend is nccl.
+    Without CUDA the default backend is gloo, so the distributed training also runs on CPU only machines.
+    """
+    args.rank, args.world_size = get_rank(), get_world_size()
+    if args.world_size <= 1 or is_distributed():
+        return
+    if torch.cuda.is_available():
+        args.gpu = int(os.environ.get("LOCAL_RANK", 0))
+        torch.cuda.set_device(args.gpu)
+    backend = args.dist_backend
+    if backend is None:
+        backend = "nccl" if torch.cuda.is_available() else "gloo"
+    dist.init_process_group(backend=backend)
+
+
+def _to_communication_device(tensor: torch.Tensor) -> torch.Tensor:
+    backend = dist.get_backend()
+    # gloo only implements the CPU collectives
+    if tensor.is_cuda and backend == "gloo":
+        return tensor.cpu()
+    # nccl only implements the CUDA ones, e.g. for the networks a get_trainer_* factory leaves on the CPU
+    if not tensor.is_cuda and backend == "nccl":
+        return tensor.to(torch.device("cuda", torch.cuda.current_device()))
+    return tensor
+
+
+def broadcast_parameters(networks: torch.nn.Module | Iterable[torch.nn.Module], src: int = 0) -> None:
+    """Copy the parameters and buffers of `networks` from rank `src` to all other ranks."""
+    if not is_distributed():
+        return
+    if isinstance(networks, torch.nn.Module):
+        networks = [networks]
+    with torch.no_grad():
+        for network in networks:
+            for tensor in list(network.parameters()) + list(network.buffers()):
+                buffer = _to_communication_device(tensor.data)
+                dist.broadcast(buffer, src=src)
+                if buffer is not tensor.data:
+                    tensor.data.copy_(buffer)
+
+
+def all_reduce_gradients(parameters: Iterable[torch.nn.Parameter]) -> None:
+    """
+    Average the gradients of `parameters` over all ranks, with one all-reduce per device and dtype.
+
+    Every rank has to pass the same parameters in the same order. Trainable parameters without a gradient on this
+    rank contribute zeros, so the flattened buffers match on all ranks.
+    """
+    if not is_distributed() or get_world_size() == 1:
+        return
+    buckets: Dict[Any, List[torch.Tensor]] = {}
+    for param in parameters:
+        if not param.requires_grad:
+            continue
+        if param.grad is None:
+            param.grad = torch.zeros_like(param)
+        buckets.setdefault((param.grad.device, param.grad.dtype), []).append(param.grad)
+    world_size = get_world_size()
+    for grads in buckets.values():
+        flat = torch.cat([grad.reshape(-1) for grad in grads])
+        buffer = _to_communication_device(flat)
+        dist.all_reduce(buffer)
+        buffer.div_(world_size)
+        flat = buffer.to(flat.device)
+        offset = 0
+        for grad in grads:
+            grad.copy_(flat[offset : offset + grad.numel()].view_as(grad))
+            offset += grad.numel()
+
+
+def all_gather_objects(obj: Any) -> List[Any]:
+    """The `obj` of every rank, ordered by rank. [obj] if not distributed."""
+    if not is_distributed():
+        return [obj]
+    objects = [None] * get_world_size()
+    dist.all_gather_object(objects, obj)
+    return objects
+
+
+def set_sampler_epoch(data_loader: Any, epoch: int) -> None:
+    """Call `set_epoch` of the (batch) sampler of `data_loader`, if it has one, so every epoch is shuffled anew."""
+    # PairedBatchLoader wraps the loader
+    loader = getattr(data_loader, "loader", data_loader)
+    for sampler in (getattr(loader, "sampler", None), getattr(loader, "batch_sampler", None)):
+        if hasattr(sampler, "set_epoch"):
+            sampler.set_epoch(epoch)
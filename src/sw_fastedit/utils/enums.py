@@ -338,6 +338,8 @@ class CommonKeys(StrEnum):
 
     """
     LABELS_KEY = "label_names"
+    FOREGROUND_INDEX = "foreground_index"
+    FOREGROUND_CROP = "foreground_crop"
     IMAGE = "image"
     IMAGE_SOURCE = "image_source"
     IMAGE_TARGET = "image_target"
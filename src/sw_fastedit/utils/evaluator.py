@@ -27,15 +27,19 @@ from monai.transforms import Transform
 from monai.utils import ForwardMode, ensure_tuple, min_version, optional_import
 from monai.utils.enums import EngineStatsKeys as ESKeys
 from monai.utils.module import look_up_option
-from monai.metrics import DiceMetric, DiceHelper
+from monai.metrics import DiceMetric
 from monai.metrics import MSEMetric
 from monai.data import decollate_batch
 
 from sw_fastedit.utils.prepare_batch import default_prepare_batch
+from sw_fastedit.utils.logger import ITERATION_LOGGER_NAME
+from sw_fastedit.utils.metrics import ConfusionDiceHelper
+from sw_fastedit.utils.metric_accumulator import accumulate, check_batch, run_sanity_checks
 from sw_fastedit.utils.enums import CommonKeys as Keys
 from sw_fastedit.utils.enums import GanKeys
 
 logger = logging.getLogger("sw_fastedit")
+iteration_logger = logging.getLogger(ITERATION_LOGGER_NAME)
 
 
 if TYPE_CHECKING:
@@ -275,7 +279,7 @@ class SupervisedEvaluatorEp(Evaluator):
 
         self.network = networks
         self.dice_metric = DiceMetric(include_background=False, reduction="mean", get_not_nans=False)
-        self.dice_helper = DiceHelper(include_background=False, sigmoid=False, softmax=True)
+        self.dice_helper = ConfusionDiceHelper(include_background=False)
         self.mse_metric = MSEMetric()
         self.inferer = SimpleInferer() if inferer is None else inferer
 
@@ -305,24 +309,19 @@ class SupervisedEvaluatorEp(Evaluator):
         else:
             print("error with batch, check prepare_batch")
 
-        print('')    
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("labels.shape is {}".format(target_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("labels.shape is %s", target_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
 
         if (keys[0] == 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
       
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        #print('check labels', batchdata["label"].shape)
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
         # put iteration outputs into engine.state
         if keys[0]== 'image_target':    
             engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg, Keys.LABEL_EP: target_ep}
@@ -342,9 +341,8 @@ class SupervisedEvaluatorEp(Evaluator):
         engine.state.output['pred_ep_processed'] = pred_ep_processed
 
         #evalutation extreme points
-        mse_metric = self.mse_metric(y_pred=engine.state.output[Keys.PRED_EP], y=target_ep).item()
-
-        logger.info(f'MSE Metric: {mse_metric}')
+        mse_metric = self.mse_metric(y_pred=engine.state.output[Keys.PRED_EP], y=target_ep)
+        accumulate(engine, mse=mse_metric)
 
         engine.fire_event(IterationEvents.FORWARD_COMPLETED)
         engine.fire_event(IterationEvents.MODEL_COMPLETED)
@@ -446,7 +444,7 @@ class SupervisedEvaluatorDynUnet(Evaluator):
 
         self.network = networks
         self.dice_metric = DiceMetric(include_background=False, reduction="mean", get_not_nans=False)
-        self.dice_helper = DiceHelper(include_background=False, sigmoid=False, softmax=True)
+        self.dice_helper = ConfusionDiceHelper(include_background=False)
         self.mse_metric = MSEMetric()
         self.inferer = SimpleInferer() if inferer is None else inferer
 
@@ -476,24 +474,19 @@ class SupervisedEvaluatorDynUnet(Evaluator):
         else:
             print("error with batch, check prepare_batch")
 
-        print('')    
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("labels.shape is {}".format(target_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("labels.shape is %s", target_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
 
         if (keys[0] == 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
       
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        #print('check labels', batchdata["label"].shape)
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
         # put iteration outputs into engine.state
         if keys[0]== 'image_target':    
             engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg}
@@ -510,8 +503,10 @@ class SupervisedEvaluatorDynUnet(Evaluator):
 
         engine.fire_event(IterationEvents.FORWARD_COMPLETED)
 
-        dice_helper = self.dice_helper(y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg)
-        logger.info(f'Dice Helper: {dice_helper}')
+        dice_helper = self.dice_helper(
+            y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg, check_range=run_sanity_checks(engine)
+        )
+        accumulate(engine, dice=dice_helper[0])
         engine.fire_event(IterationEvents.MODEL_COMPLETED)
         
         return engine.state.output
@@ -610,7 +605,7 @@ class SupervisedEvaluatorDextr(Evaluator):
 
         self.network = networks
         self.dice_metric = DiceMetric(include_background=False, reduction="mean", get_not_nans=False)
-        self.dice_helper = DiceHelper(include_background=False, sigmoid=False, softmax=True)
+        self.dice_helper = ConfusionDiceHelper(include_background=False)
         self.mse_metric = MSEMetric()
         self.inferer = SimpleInferer() if inferer is None else inferer
 
@@ -640,24 +635,19 @@ class SupervisedEvaluatorDextr(Evaluator):
         else:
             print("error with batch, check prepare_batch")
 
-        print('')    
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("labels.shape is {}".format(target_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("labels.shape is %s", target_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
 
         if (keys[0] == 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
       
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        #print('check labels', batchdata["label"].shape)
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
         # put iteration outputs into engine.state
         if keys[0]== 'image_target':    
             engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg, Keys.LABEL_EP: target_ep}
@@ -676,8 +666,10 @@ class SupervisedEvaluatorDextr(Evaluator):
 
         engine.fire_event(IterationEvents.FORWARD_COMPLETED)
 
-        dice_helper = self.dice_helper(y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg)
-        logger.info(f'Dice Helper: {dice_helper} with softmax')
+        dice_helper = self.dice_helper(
+            y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg, check_range=run_sanity_checks(engine)
+        )
+        accumulate(engine, dice=dice_helper[0])
         engine.fire_event(IterationEvents.MODEL_COMPLETED)
         
         return engine.state.output
@@ -778,7 +770,7 @@ class SupervisedEvaluatorPada(Evaluator):
 
         self.network = networks
         self.dice_metric = DiceMetric(include_background=False, reduction="mean", get_not_nans=False)
-        self.dice_helper = DiceHelper(include_background=False, sigmoid=False, softmax=True)
+        self.dice_helper = ConfusionDiceHelper(include_background=False)
         self.mse_metric = MSEMetric()
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.args = args
@@ -809,24 +801,19 @@ class SupervisedEvaluatorPada(Evaluator):
         else:
             print("error with batch, check prepare_batch")
 
-        print('')    
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("labels.shape is {}".format(target_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("labels.shape is %s", target_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
 
         if (keys[0] == 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
       
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        #print('check labels', batchdata["label"].shape)
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
         # put iteration outputs into engine.state
         if keys[0]== 'image_target':    
             engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg, Keys.LABEL_EP: target_ep}
@@ -852,9 +839,11 @@ class SupervisedEvaluatorPada(Evaluator):
                 forward_pass()
 
         #evaluation segmentation
-        dice_helper = self.dice_helper(y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg)
+        dice_helper = self.dice_helper(
+            y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg, check_range=run_sanity_checks(engine)
+        )
 
-        logger.info(f'Dice Metric: {dice_helper[0].item()} dis: {engine.state.output[GanKeys.GPRED].item()}')
+        accumulate(engine, dice=dice_helper[0], dis=engine.state.output[GanKeys.GPRED])
 
         engine.fire_event(IterationEvents.FORWARD_COMPLETED)
         engine.fire_event(IterationEvents.MODEL_COMPLETED)
@@ -956,7 +945,7 @@ class SupervisedEvaluatorDualDynUnet(Evaluator):
 
         self.network = networks
         self.dice_metric = DiceMetric(include_background=False, reduction="mean", get_not_nans=False)
-        self.dice_helper = DiceHelper(include_background=False, sigmoid=False, softmax=True)
+        self.dice_helper = ConfusionDiceHelper(include_background=False)
         self.mse_metric = MSEMetric()
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.args = args
@@ -987,24 +976,19 @@ class SupervisedEvaluatorDualDynUnet(Evaluator):
         else:
             print("error with batch, check prepare_batch")
 
-        print('')    
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("labels.shape is {}".format(target_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("labels.shape is %s", target_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
 
         if (keys[0] == 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
       
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        #print('check labels', batchdata["label"].shape)
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
         # put iteration outputs into engine.state
         if keys[0]== 'image_target':    
             engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg, Keys.LABEL_EP: target_ep}
@@ -1030,10 +1014,12 @@ class SupervisedEvaluatorDualDynUnet(Evaluator):
 
         #evaluation segmentation
         mse_metric = self.mse_metric(y_pred=engine.state.output[Keys.PRED_EP], y=target_ep)
-        dice_helper = self.dice_helper(y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg)
+        dice_helper = self.dice_helper(
+            y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg, check_range=run_sanity_checks(engine)
+        )
 
 
-        logger.info(f'Dice Metric: {dice_helper[0].item()} mse: {mse_metric.item()}')
+        accumulate(engine, dice=dice_helper[0], mse=mse_metric)
 
         engine.fire_event(IterationEvents.FORWARD_COMPLETED)
         engine.fire_event(IterationEvents.MODEL_COMPLETED)
@@ -1136,7 +1122,7 @@ class SupervisedEvaluatorUgda(Evaluator):
 
         self.network = networks
         self.dice_metric = DiceMetric(include_background=False, reduction="mean", get_not_nans=False)
-        self.dice_helper = DiceHelper(include_background=False, sigmoid=False, softmax=True)
+        self.dice_helper = ConfusionDiceHelper(include_background=False)
         self.mse_metric = MSEMetric()
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.args = args
@@ -1167,24 +1153,19 @@ class SupervisedEvaluatorUgda(Evaluator):
         else:
             print("error with batch, check prepare_batch")
 
-        print('')    
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("labels.shape is {}".format(target_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("labels.shape is %s", target_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
 
         if (keys[0] == 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
       
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        #print('check labels', batchdata["label"].shape)
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
         # put iteration outputs into engine.state
         if keys[0]== 'image_target':    
             engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg, Keys.LABEL_EP: target_ep}
@@ -1206,9 +1187,11 @@ class SupervisedEvaluatorUgda(Evaluator):
                 forward_pass()
 
         #evaluation segmentation
-        dice_helper = self.dice_helper(y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg)
+        dice_helper = self.dice_helper(
+            y_pred=engine.state.output[Keys.PRED_SEG], y=target_seg, check_range=run_sanity_checks(engine)
+        )
 
-        logger.info(f'Dice Metric: {dice_helper[0].item()} dis: {engine.state.output[GanKeys.GPRED].item()}')
+        accumulate(engine, dice=dice_helper[0], dis=engine.state.output[GanKeys.GPRED])
 
         engine.fire_event(IterationEvents.FORWARD_COMPLETED)
         engine.fire_event(IterationEvents.MODEL_COMPLETED)
@@ -1,53 +1,176 @@
 from __future__ import annotations
 
+import atexit
 import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Tuple
 
 logger = None
 
+# Messages logged every iteration (shapes, file names) go to this child logger, it is rate limited
+ITERATION_LOGGER_NAME = "sw_fastedit.iteration"
+DEFAULT_RATE_LIMIT = 10.0
+EXTERNAL_LOGGER_NAMES = (
+    "ignite.engine.engine.SupervisedTrainer",
+    "ignite.engine.engine.SupervisedEvaluator",
+)
 
-def setup_loggers(loglevel=logging.INFO, log_file_folder=None):
-    global logger
-    logger = logging.getLogger("sw_fastedit")
-    if logger.hasHandlers():
-        logger.handlers.clear()
-    logger.propagate = False
-    logger.setLevel(logging.DEBUG)
-    # Add the stream handler
-    stream_handler = logging.StreamHandler()
-    # (%(name)s)
-    formatter = logging.Formatter(
-        fmt="[%(asctime)s.%(msecs)03d][%(levelname)s] %(funcName)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-    stream_handler.setFormatter(formatter)
-    stream_handler.setLevel(loglevel)
-    logger.addHandler(stream_handler)
-    file_handler = None
-
-    if log_file_folder is not None:
-        # Add the file handler
-        log_file_path = f"{log_file_folder}/log.txt"
-        file_handler = logging.FileHandler(log_file_path)
-        file_handler.setFormatter(formatter)
-        file_handler.setLevel(loglevel)
-        logger.addHandler(file_handler)
-        logger.info(f"Logging all the data to '{log_file_path}'")
+# The writer thread of the queue mode and the process it was started in, a forked worker needs its own
+_listener: QueueListener | None = None
+_handlers: list = []
+_setup_pid: int | None = None
+_setup_lock = threading.Lock()
+# use_queue and rate_limit of the last setup_loggers call, which ensure_loggers sets up the workers with
+_use_queue = True
+_rate_limit = DEFAULT_RATE_LIMIT
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler which leaves the formatting of the record to the writer thread.
+
+    The default `prepare` merges the `%` arguments into the message in the logging thread, here the record is
+    enqueued as it is, so a log call only costs the creation of the record. The arguments are therefore formatted
+    later and should not be changed in place after the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most one record per call site (file and line) through every `interval` seconds.
+
+    The number of dropped records is appended to the next record of the same call site.
+
+    Args:
+        interval (float): Minimum number of seconds between two records of the same call site, 0 disables the limit.
+    """
+
+    def __init__(self, interval: float = DEFAULT_RATE_LIMIT) -> None:
+        super().__init__()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last_time: Dict[Tuple[str, int], float] = {}
+        self.suppressed: Dict[Tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            last_time = self.last_time.get(key)
+            if last_time is not None and now - last_time < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.last_time[key] = now
+            suppressed = self.suppressed.pop(key, 0)
+        if suppressed > 0:
+            record.msg = f"{record.msg} (suppressed {suppressed} similar messages)"
+        return True
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        # writes all records which are still queued
+        _listener.stop()
+        _listener = None
+
+
+def setup_loggers(loglevel=logging.INFO, log_file_folder=None, use_queue=True, rate_limit=DEFAULT_RATE_LIMIT):
+    """
+    Set up the "sw_fastedit" logger and the loggers of the ignite engines.
+
+    Args:
+        loglevel: Level of the console and file output.
+        log_file_folder: Additionally log to `log_file_folder`/log.txt if not None.
+        use_queue: Only enqueue the records in the logging threads (LazyQueueHandler) and format and write them in a
+            single writer thread (QueueListener), so neither the iterations nor the dataloader threads wait for the
+            console or contend on the file handle. Otherwise the handlers write synchronously.
+        rate_limit: Minimum number of seconds between two messages of the same call site of the
+            ITERATION_LOGGER_NAME logger, see RateLimitFilter.
+    """
+    global logger, _setup_pid, _use_queue, _rate_limit
+    with _setup_lock:
+        _use_queue, _rate_limit = use_queue, rate_limit
+        logger = logging.getLogger("sw_fastedit")
+        _stop_listener()
+        for handler in _handlers:
+            handler.close()
+        _handlers.clear()
+        if logger.hasHandlers():
+            logger.handlers.clear()
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        # Add the stream handler
+        stream_handler = logging.StreamHandler()
+        # (%(name)s)
+        formatter = logging.Formatter(
+            fmt="[%(asctime)s.%(msecs)03d][%(levelname)s] %(funcName)s - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+        stream_handler.setFormatter(formatter)
+        stream_handler.setLevel(loglevel)
+        _handlers.append(stream_handler)
+        log_file_path = None
+
+        if log_file_folder is not None:
+            # Add the file handler
+            log_file_path = f"{log_file_folder}/log.txt"
+            file_handler = logging.FileHandler(log_file_path)
+            file_handler.setFormatter(formatter)
+            file_handler.setLevel(loglevel)
+            _handlers.append(file_handler)
+
+        if use_queue:
+            global _listener
+            record_queue = queue.SimpleQueue()
+            handlers = [LazyQueueHandler(record_queue)]
+            handlers[0].setLevel(loglevel)
+            _listener = QueueListener(record_queue, *_handlers, respect_handler_level=True)
+            _listener.start()
+        else:
+            handlers = _handlers
+        for handler in handlers:
+            logger.addHandler(handler)
+        _setup_pid = os.getpid()
+
+        iteration_logger = logging.getLogger(ITERATION_LOGGER_NAME)
+        for f in [f for f in iteration_logger.filters if isinstance(f, RateLimitFilter)]:
+            iteration_logger.removeFilter(f)
+        iteration_logger.addFilter(RateLimitFilter(rate_limit))
+
+        # Set logging level for external libraries
+        for _ in EXTERNAL_LOGGER_NAMES:
+            l = logging.getLogger(_)
+            if l.hasHandlers():
+                l.handlers.clear()
+            l.propagate = False
+            l.setLevel(loglevel)
+            for handler in handlers:
+                l.addHandler(handler)
+
+    if log_file_path is not None:
+        logger.info("Logging all the data to '%s'", log_file_path)
     else:
         logger.info("Logging only to the console")
 
-    # Set logging level for external libraries
-    for _ in (
-        "ignite.engine.engine.SupervisedTrainer",
-        "ignite.engine.engine.SupervisedEvaluator",
-    ):
-        l = logging.getLogger(_)
-        if l.hasHandlers():
-            l.handlers.clear()
-        l.propagate = False
-        l.setLevel(loglevel)
-        l.addHandler(stream_handler)
-        if file_handler is not None:
-            l.addHandler(file_handler)
+
+def ensure_loggers(loglevel=logging.INFO, log_file_folder=None):
+    """
+    Set up the loggers unless this process already did, e.g. in a forked dataloader worker whose copy of the queue
+    has no writer thread. Cheap enough to be called for every sample. A worker gets the `use_queue` and
+    `rate_limit` of the last setup_loggers call (--sync_log, --log_rate_limit).
+    """
+    if logger is None or _setup_pid != os.getpid():
+        setup_loggers(loglevel, log_file_folder, use_queue=_use_queue, rate_limit=_rate_limit)
 
 
 def get_logger():
@@ -56,3 +179,6 @@ def get_logger():
         raise UserWarning("Logger not initialized")
     else:
         return logger
+
+
+atexit.register(_stop_listener)
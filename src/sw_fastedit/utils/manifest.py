@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import nibabel as nib
+import numpy as np
+
+logger = logging.getLogger("sw_fastedit")
+
+# Bump this whenever the content of a case entry changes, older manifests are rebuilt
+MANIFEST_VERSION = 1
+MANIFEST_DIR_NAME = "manifests"
+SPLITS = {"train": ("imagesTr", "labelsTr"), "test": ("imagesTs", "labelsTs")}
+
+# Manifests already read by this process, keyed by their path
+_manifests: Dict[str, Dict] = {}
+
+
+def get_case_id(path: str) -> str:
+    """
+    Case id of an image or label file, e.g. "amos_0001" for ".../amos_0001.nii.gz".
+    """
+    return Path(os.path.basename(path)).with_suffix("").with_suffix("").name
+
+
+def get_file_stat(path: str) -> List[int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def scan_case(case_id: str, image_path: str | None, label_path: str | None) -> Dict:
+    """
+    Read the header of the image and the full label of one case and check that they fit together.
+
+    Args:
+        case_id (str): The case id both files were paired by.
+        image_path (str | None): Path of the image, None if there is no image for this label.
+        label_path (str | None): Path of the label, None if there is no label for this image.
+
+    Returns:
+        Dict: The manifest entry. Shape, spacing and orientation of the image, the voxel count of every label id
+        and a list of `errors`, a case with errors should not be used.
+    """
+    case = {
+        "case_id": case_id,
+        "image": image_path,
+        "label": label_path,
+        "image_stat": get_file_stat(image_path) if image_path is not None else None,
+        "label_stat": get_file_stat(label_path) if label_path is not None else None,
+        "errors": [],
+    }
+    if image_path is None:
+        case["errors"].append("no image for this label")
+        return case
+    if label_path is None:
+        case["errors"].append("no label for this image")
+        return case
+
+    try:
+        image = nib.load(image_path)
+        case["shape"] = [int(s) for s in image.shape]
+        case["spacing"] = [round(float(s), 5) for s in image.header.get_zooms()[:3]]
+        case["orientation"] = "".join(nib.aff2axcodes(image.affine))
+        # NaNs / infs would silently turn into NaN losses, reading the image once here is cheap in comparison
+        image_data = np.asanyarray(image.dataobj)
+        case["image_finite"] = bool(np.isfinite(image_data).all()) if image_data.dtype.kind == "f" else True
+        del image_data
+        if not case["image_finite"]:
+            case["errors"].append("image contains NaN or inf values")
+
+        label = nib.load(label_path)
+        label_data = np.asanyarray(label.dataobj)
+        if label.shape != image.shape:
+            case["errors"].append(f"label shape {list(label.shape)} does not match the image shape {case['shape']}")
+        if not np.allclose(label.affine, image.affine, atol=1e-3):
+            case["errors"].append("label affine does not match the image affine")
+        if label_data.dtype.kind == "f" and not np.all(np.mod(label_data, 1) == 0):
+            case["errors"].append("label contains non integer values")
+        label_ids = label_data.astype(np.int64, copy=False).ravel()
+        if label_ids.size > 0 and label_ids.min() < 0:
+            case["errors"].append("label contains negative values")
+            label_ids = label_ids[label_ids >= 0]
+        counts = np.bincount(label_ids)
+        case["organs"] = {str(i): int(c) for i, c in enumerate(counts) if i > 0 and c > 0}
+    except Exception as e:
+        case["errors"].append(f"unreadable: {e!r}")
+    return case
+
+
+def _scan_case(task: Tuple) -> Dict:
+    return scan_case(*task)
+
+
+def get_case_pairs(image_dir: str, label_dir: str) -> List[Tuple[str, str | None, str | None]]:
+    """
+    Pair images and labels by case id instead of by their position in the sorted file lists.
+    """
+    images = {get_case_id(p): p for p in glob.glob(os.path.join(image_dir, "*.nii.gz"))}
+    labels = {get_case_id(p): p for p in glob.glob(os.path.join(label_dir, "*.nii.gz"))}
+    return [(case_id, images.get(case_id), labels.get(case_id)) for case_id in sorted(images.keys() | labels.keys())]
+
+
+def _is_up_to_date(case: Dict, image_path: str | None, label_path: str | None) -> bool:
+    return (
+        case.get("image") == image_path
+        and case.get("label") == label_path
+        and case.get("image_stat") == (get_file_stat(image_path) if image_path is not None else None)
+        and case.get("label_stat") == (get_file_stat(label_path) if label_path is not None else None)
+    )
+
+
+def build_manifest(data_dir: str, manifest_path: str, workers: int | None = None) -> Dict:
+    """
+    Scan all cases below `data_dir` and write the manifest to `manifest_path`.
+
+    Cases whose files did not change since an existing manifest was written are taken over from it, only new and
+    changed cases are scanned, in parallel with `workers` processes.
+
+    Args:
+        data_dir (str): Folder with the imagesTr / labelsTr / imagesTs / labelsTs sub folders.
+        manifest_path (str): Where to write the manifest json.
+        workers (int | None): Number of scan processes, all cores if None.
+
+    Returns:
+        Dict: The manifest, {"version", "data_dir", "splits": {split: [case, ...]}}.
+    """
+    old_cases = {}
+    if os.path.isfile(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                old = json.load(f)
+            if old.get("version") == MANIFEST_VERSION:
+                old_cases = {(split, c["case_id"]): c for split, cases in old["splits"].items() for c in cases}
+        except (OSError, ValueError, KeyError):
+            pass
+
+    splits, tasks = {}, []
+    for split, (image_folder, label_folder) in SPLITS.items():
+        splits[split] = []
+        for case_id, image_path, label_path in get_case_pairs(
+            os.path.join(data_dir, image_folder), os.path.join(data_dir, label_folder)
+        ):
+            case = old_cases.get((split, case_id))
+            if case is not None and _is_up_to_date(case, image_path, label_path):
+                splits[split].append(case)
+            else:
+                splits[split].append(None)
+                tasks.append((split, len(splits[split]) - 1, (case_id, image_path, label_path)))
+
+    if len(tasks) > 0:
+        logger.info(f"Scanning {len(tasks)} cases of {data_dir} for the dataset manifest")
+        if workers == 1 or len(tasks) == 1:
+            scanned = [scan_case(*task) for _, _, task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                scanned = list(executor.map(_scan_case, [task for _, _, task in tasks], chunksize=4))
+        for (split, index, _), case in zip(tasks, scanned):
+            splits[split][index] = case
+
+    manifest = {"version": MANIFEST_VERSION, "data_dir": data_dir, "splits": splits}
+    if len(tasks) > 0 or len(old_cases) != sum(len(cases) for cases in splits.values()):
+        Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=Path(manifest_path).parent)
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def get_manifest(data_dir: str, cache_dir: str, workers: int | None = None) -> Dict:
+    """
+    The manifest of `data_dir`, cached in `cache_dir` and read only once per process.
+
+    Args:
+        data_dir (str): Folder with the imagesTr / labelsTr / imagesTs / labelsTs sub folders.
+        cache_dir (str): Root folder of the volume store, the manifests go into its MANIFEST_DIR_NAME sub folder.
+        workers (int | None): Number of scan processes for new or changed cases.
+    """
+    data_dir = os.path.abspath(data_dir)
+    name = f"{Path(data_dir).name}_{hashlib.md5(data_dir.encode('utf-8')).hexdigest()[:8]}.json"
+    manifest_path = os.path.join(cache_dir, MANIFEST_DIR_NAME, name)
+    if manifest_path not in _manifests:
+        _manifests[manifest_path] = build_manifest(data_dir, manifest_path, workers=workers)
+    return _manifests[manifest_path]
+
+
+def filter_cases(cases: Sequence[Dict], organ: int | None = None) -> List[Dict]:
+    """
+    Drop the cases with errors and, if `organ` is given, the cases whose label does not contain it.
+    """
+    result = []
+    for case in cases:
+        if len(case["errors"]) > 0:
+            logger.warning(f"Skipping case {case['case_id']}: {'; '.join(case['errors'])}")
+        elif organ is not None and case["organs"].get(str(organ), 0) == 0:
+            logger.warning(f"Skipping case {case['case_id']}: organ {organ} is not in the label")
+        else:
+            result.append(case)
+    return result
+
+
+def get_organ_volume(case: Dict, organ: int) -> float:
+    """Volume of `organ` in the label of a manifest case in mm³."""
+    return case["organs"].get(str(organ), 0) * float(np.prod(case["spacing"]))
+
+
+def select_stratified_cases(cases: Sequence[Dict], size: int, organ: int) -> List[Dict]:
+    """
+    A fixed subset of `size` cases which covers the whole range of organ volumes: the cases are sorted by the
+    volume of `organ` and split into `size` strata of (almost) the same number of cases, from each the middle
+    case is taken. Small organs, on which the Dice varies the most, are so as present as large ones.
+
+    Returns:
+        List[Dict]: The selected cases in the order of `cases`, all of them if there are not more than `size`.
+    """
+    if size >= len(cases):
+        return list(cases)
+    order = sorted(range(len(cases)), key=lambda i: (get_organ_volume(cases[i], organ), cases[i]["case_id"]))
+    selected = {order[int((stratum + 0.5) * len(cases) / size)] for stratum in range(size)}
+    return [case for i, case in enumerate(cases) if i in selected]
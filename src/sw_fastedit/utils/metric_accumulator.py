@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Dict, Tuple
+
+import torch
+from monai.config import IgniteInfo
+from monai.utils import min_version, optional_import
+
+from sw_fastedit.utils.distributed import all_gather_objects, is_main_process
+
+Events, _ = optional_import("ignite.engine", IgniteInfo.OPT_IMPORT_VERSION, min_version, "Events")
+SummaryWriter, _ = optional_import("torch.utils.tensorboard", name="SummaryWriter")
+if TYPE_CHECKING:
+    from ignite.engine import Engine
+else:
+    Engine, _ = optional_import("ignite.engine", IgniteInfo.OPT_IMPORT_VERSION, min_version, "Engine")
+
+logger = logging.getLogger("sw_fastedit")
+
+DEFAULT_LOG_INTERVAL = 20
+
+# Every how many iterations the sanity checks of a batch run, 0 disables them (set from --sanity_check_interval)
+_sanity_check_interval = 0
+# Shared by the trainers and evaluators of a run, None if no TensorBoard log is written
+_summary_writer = None
+
+
+def set_sanity_check_interval(interval: int) -> None:
+    global _sanity_check_interval
+    _sanity_check_interval = interval
+
+
+def set_summary_writer(log_dir: str | None) -> None:
+    """
+    Write the accumulated values of all MetricAccumulators to a TensorBoard log in `log_dir`, None disables it.
+    """
+    global _summary_writer
+    if _summary_writer is not None:
+        _summary_writer.close()
+    _summary_writer = SummaryWriter(log_dir=log_dir) if log_dir is not None else None
+
+
+def run_sanity_checks(engine: Engine) -> bool:
+    """
+    Whether the sanity checks of the current batch should run, every `_sanity_check_interval` iterations starting
+    with the first one. They need a host sync, so they are off unless --debug is set.
+    """
+    return _sanity_check_interval > 0 and (engine.state.iteration - 1) % _sanity_check_interval == 0
+
+
+def check_batch(inputs: torch.Tensor, labels: torch.Tensor) -> None:
+    """
+    Make sure the guidance channels of `inputs` are empty and warn about samples without any label voxel.
+
+    Args:
+        inputs: the network input (B, C, spatial...), only channel 0 may be set.
+        labels: the labels of the batch (B, 1, spatial...).
+    """
+    # Make sure the signal is empty in the first iteration assertion holds
+    assert torch.sum(inputs[:, 1:, ...]) == 0
+    for label_sum in labels[:, 0].flatten(start_dim=1).sum(dim=1).tolist():
+        if label_sum < 0.1:
+            logger.warning("No valid labels for this sample (probably due to crop)")
+
+
+def accumulate(engine: Engine, **values: torch.Tensor | float | None) -> None:
+    """
+    Add per iteration values (losses, metrics) to the MetricAccumulator attached to `engine`, a no-op without one.
+    """
+    accumulator = getattr(engine, "metric_accumulator", None)
+    if accumulator is not None:
+        accumulator.add(**values)
+
+
+class MetricAccumulator:
+    """
+    Collect per iteration losses and metrics without synchronizing the device.
+
+    The values stay on the device as running sums, they are copied to the host together, every `log_interval`
+    iterations and at the end of every epoch, and then logged and written to TensorBoard (see `set_summary_writer`).
+    NaN values (e.g. the Dice of an empty label) are skipped by the mean.
+
+    In distributed training only rank 0 logs. The iteration means are the ones of rank 0 (no communication
+    during the epoch), the epoch means are the ones of all ranks.
+
+    Args:
+        log_interval (int): Every how many iterations the means of the last window are read back and logged,
+            0 only logs the epoch means.
+        tag_prefix (str): Prepended to every value name, e.g. "train_" or "val_".
+    """
+
+    def __init__(self, log_interval: int = DEFAULT_LOG_INTERVAL, tag_prefix: str = "") -> None:
+        self.log_interval = log_interval
+        self.tag_prefix = tag_prefix
+        self._sums: Dict[str, torch.Tensor] = {}
+        self._counts: Dict[str, torch.Tensor] = {}
+        self._epoch: Dict[str, Tuple[float, float]] = {}
+
+    def attach(self, engine: Engine) -> None:
+        engine.metric_accumulator = self
+        engine.add_event_handler(Events.ITERATION_COMPLETED, self.iteration_completed)
+        engine.add_event_handler(Events.EPOCH_COMPLETED, self.epoch_completed)
+
+    def add(self, **values: torch.Tensor | float | None) -> None:
+        for name, value in values.items():
+            if value is None:
+                continue
+            value = torch.as_tensor(value).detach().float().reshape(-1)
+            valid = ~torch.isnan(value)
+            value_sum = torch.where(valid, value, torch.zeros_like(value)).sum()
+            if name in self._sums:
+                self._sums[name] = self._sums[name] + value_sum.to(self._sums[name].device)
+                self._counts[name] = self._counts[name] + valid.sum().to(self._counts[name].device)
+            else:
+                self._sums[name] = value_sum
+                self._counts[name] = valid.sum()
+
+    def _read(self) -> Dict[str, Tuple[float, float]]:
+        # a single device to host copy for all values of the window
+        if len(self._sums) == 0:
+            return {}
+        names = list(self._sums.keys())
+        device = self._sums[names[0]].device
+        stacked = torch.stack(
+            [torch.stack((self._sums[n].to(device), self._counts[n].to(device).float())) for n in names]
+        ).cpu()
+        self._sums, self._counts = {}, {}
+        return {name: (float(s), float(c)) for name, (s, c) in zip(names, stacked.tolist())}
+
+    def _write(self, means: Dict[str, float], step: int, suffix: str = "") -> None:
+        if _summary_writer is None:
+            return
+        for name, mean in means.items():
+            _summary_writer.add_scalar(f"{self.tag_prefix}{name}{suffix}", mean, step)
+
+    @staticmethod
+    def _format(means: Dict[str, float]) -> str:
+        return ", ".join(f"{name}: {mean:.4f}" for name, mean in means.items())
+
+    def _flush_window(self) -> Dict[str, float]:
+        window = self._read()
+        for name, (s, c) in window.items():
+            epoch_sum, epoch_count = self._epoch.get(name, (0.0, 0.0))
+            self._epoch[name] = (epoch_sum + s, epoch_count + c)
+        return {name: s / c if c > 0 else float("nan") for name, (s, c) in window.items()}
+
+    def iteration_completed(self, engine: Engine) -> None:
+        if self.log_interval <= 0 or engine.state.iteration % self.log_interval != 0:
+            return
+        means = self._flush_window()
+        if len(means) == 0 or not is_main_process():
+            return
+        # the evaluators restart their iteration count with every run, so count the steps of all runs
+        epoch_length = engine.state.epoch_length or engine.state.iteration
+        step = (engine.state.epoch - 1) * epoch_length + (engine.state.iteration - 1) % epoch_length + 1
+        logger.info(
+            f"[{self.tag_prefix.rstrip('_')}] epoch {engine.state.epoch} iteration {engine.state.iteration}: "
+            f"{self._format(means)}"
+        )
+        self._write(means, step)
+
+    def epoch_completed(self, engine: Engine) -> None:
+        self._flush_window()
+        # sums and counts of all ranks, every rank has to take part even without any values
+        epoch: Dict[str, Tuple[float, float]] = {}
+        for rank_epoch in all_gather_objects(self._epoch):
+            for name, (s, c) in rank_epoch.items():
+                epoch_sum, epoch_count = epoch.get(name, (0.0, 0.0))
+                epoch[name] = (epoch_sum + s, epoch_count + c)
+        means = {name: s / c if c > 0 else float("nan") for name, (s, c) in epoch.items()}
+        self._epoch = {}
+        if len(means) == 0 or not is_main_process():
+            return
+        logger.info(f"[{self.tag_prefix.rstrip('_')}] epoch {engine.state.epoch} mean: {self._format(means)}")
+        self._write(means, engine.state.epoch, suffix="_epoch")
+        if _summary_writer is not None:
+            _summary_writer.flush()
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable
+
+import torch
+from monai.handlers.ignite_metric import IgniteMetricHandler
+from monai.metrics import CumulativeIterationMetric
+from monai.metrics.utils import do_metric_reduction
+from monai.utils import MetricReduction
+
+from sw_fastedit.utils.metric_accumulator import run_sanity_checks
+
+if TYPE_CHECKING:
+    from ignite.engine import Engine
+
+__all__ = [
+    "check_class_indices",
+    "get_confusion_matrix",
+    "get_dice_from_confusion_matrix",
+    "ConfusionDiceHelper",
+    "ConfusionDiceMetric",
+    "ConfusionMeanDice",
+]
+
+
+def _to_class_indices(x: torch.Tensor, name: str) -> torch.Tensor:
+    # (B, C, ...) scores / one-hot -> argmax, (B, 1, ...) -> class indices as they are
+    if x.ndim < 3:
+        raise ValueError(f"{name} should have at least 3 dimensions (batch, channel, spatial), got {x.ndim}.")
+    if x.shape[1] > 1:
+        return torch.argmax(x, dim=1)
+    return x[:, 0]
+
+
+def check_class_indices(pred: torch.Tensor, true: torch.Tensor, num_classes: int) -> None:
+    """
+    Raise a ValueError if a class index of `pred` or `true` is outside of [0, num_classes), `get_confusion_matrix`
+    would count it in the matrix of another sample. One reduction and one host sync, so only for the sanity checks.
+    """
+    x_min, x_max = torch.stack(torch.aminmax(torch.cat((pred.flatten(), true.flatten())))).tolist()
+    if x_min < 0 or x_max >= num_classes:
+        raise ValueError(
+            f"y_pred and y should hold class indices in [0, {num_classes}), got values in [{x_min}, {x_max}]."
+        )
+
+
+def get_confusion_matrix(
+    y_pred: torch.Tensor, y: torch.Tensor, num_classes: int | None = None, check_range: bool = False
+) -> torch.Tensor:
+    """
+    Per sample confusion matrix of a segmentation, computed with a single `bincount` over all voxels.
+
+    Args:
+        y_pred: logits / probabilities / one-hot of shape (B, C, spatial...) or class indices of shape (B, 1, spatial...).
+            The argmax over the channels is taken, a softmax would not change it.
+        y: the ground truth, class indices (B, 1, spatial...) or one-hot (B, C, spatial...).
+        num_classes: number of classes, inferred from a multi channel `y_pred` if None.
+        check_range: check the class indices with `check_class_indices`, it needs a host sync.
+
+    Returns:
+        torch.Tensor: int64 tensor of shape (B, num_classes, num_classes), entry [b, i, j] counts the voxels of class
+        i in the ground truth which are predicted as class j.
+
+    Raises:
+        ValueError: with `check_range`, if a class index of `y_pred` or `y` is outside of [0, num_classes).
+    """
+    if num_classes is None:
+        if y_pred.shape[1] == 1:
+            raise ValueError("num_classes is required if y_pred holds class indices.")
+        num_classes = y_pred.shape[1]
+    pred = _to_class_indices(y_pred, "y_pred").long()
+    true = _to_class_indices(y, "y").long()
+    if pred.shape != true.shape:
+        raise ValueError(f"y_pred and y should have the same spatial shape, got {pred.shape} and {true.shape}.")
+    if check_range and pred.numel() > 0:
+        check_class_indices(pred, true, num_classes)
+    batch_size = pred.shape[0]
+    offset = torch.arange(batch_size, device=pred.device).view(-1, *[1] * (pred.ndim - 1)) * num_classes
+    index = (offset + true) * num_classes + pred
+    counts = torch.bincount(index.flatten(), minlength=batch_size * num_classes * num_classes)
+    return counts[: batch_size * num_classes * num_classes].view(batch_size, num_classes, num_classes)
+
+
+def get_dice_from_confusion_matrix(
+    confusion_matrix: torch.Tensor, include_background: bool = True, ignore_empty: bool = True
+) -> torch.Tensor:
+    """
+    Per sample and class Dice from the confusion matrices of `get_confusion_matrix`.
+
+    Args:
+        confusion_matrix: tensor of shape (B, C, C).
+        include_background: whether to keep the Dice of class 0.
+        ignore_empty: NaN for classes which are not in the ground truth (they are skipped by the mean), otherwise 1 if
+            they are not predicted either and 0 if they are. The same convention as `monai.metrics.DiceMetric`.
+
+    Returns:
+        torch.Tensor: float tensor of shape (B, C) or (B, C - 1) without background.
+    """
+    tp = torch.diagonal(confusion_matrix, dim1=1, dim2=2).double()
+    fn = confusion_matrix.sum(dim=2).double() - tp
+    fp = confusion_matrix.sum(dim=1).double() - tp
+    y_o = tp + fn
+    dice = 2.0 * tp / (2.0 * tp + fp + fn).clamp(min=1)
+    empty = y_o == 0
+    if ignore_empty:
+        dice = torch.where(empty, torch.full_like(dice, float("nan")), dice)
+    else:
+        dice = torch.where(empty, (fp == 0).double(), dice)
+    if not include_background:
+        dice = dice[:, 1:]
+    return dice.float()
+
+
+class ConfusionDiceHelper:
+    """
+    Drop in for `monai.metrics.DiceHelper(softmax=True)` on logits and integer labels, see `get_confusion_matrix`.
+
+    Args:
+        include_background: whether to include the Dice of class 0.
+        num_classes: number of classes, inferred from a multi channel `y_pred` if None.
+        reduction: the reduction over batch and classes, default is the mean per class like DiceHelper.
+        get_not_nans: also return the number of not NaN values.
+        ignore_empty: see `get_dice_from_confusion_matrix`.
+    """
+
+    def __init__(
+        self,
+        include_background: bool = True,
+        num_classes: int | None = None,
+        reduction: MetricReduction | str = MetricReduction.MEAN_BATCH,
+        get_not_nans: bool = True,
+        ignore_empty: bool = True,
+    ) -> None:
+        self.include_background = include_background
+        self.num_classes = num_classes
+        self.reduction = reduction
+        self.get_not_nans = get_not_nans
+        self.ignore_empty = ignore_empty
+
+    def __call__(
+        self, y_pred: torch.Tensor, y: torch.Tensor, check_range: bool = False
+    ) -> torch.Tensor | tuple[torch.Tensor, torch.Tensor]:
+        confusion_matrix = get_confusion_matrix(y_pred, y, num_classes=self.num_classes, check_range=check_range)
+        dice = get_dice_from_confusion_matrix(confusion_matrix, self.include_background, self.ignore_empty)
+        f, not_nans = do_metric_reduction(dice, self.reduction)
+        return (f, not_nans) if self.get_not_nans else f
+
+
+class ConfusionDiceMetric(CumulativeIterationMetric):
+    """
+    Mean Dice like `monai.metrics.DiceMetric`, but computed from a confusion matrix of class indices, so neither the
+    prediction nor the label have to be converted into one-hot volumes.
+
+    Args:
+        include_background: whether to include the Dice of class 0.
+        reduction: the reduction of `aggregate`.
+        get_not_nans: also return the number of not NaN values in `aggregate`.
+        ignore_empty: see `get_dice_from_confusion_matrix`.
+        num_classes: number of classes, required if the predictions are class indices.
+    """
+
+    def __init__(
+        self,
+        include_background: bool = True,
+        reduction: MetricReduction | str = MetricReduction.MEAN,
+        get_not_nans: bool = False,
+        ignore_empty: bool = True,
+        num_classes: int | None = None,
+    ) -> None:
+        super().__init__()
+        self.include_background = include_background
+        self.reduction = reduction
+        self.get_not_nans = get_not_nans
+        self.ignore_empty = ignore_empty
+        self.num_classes = num_classes
+        # set by ConfusionMeanDice for the iterations with sanity checks
+        self.check_range = False
+
+    def _compute_tensor(self, y_pred: torch.Tensor, y: torch.Tensor) -> torch.Tensor:  # type: ignore[override]
+        confusion_matrix = get_confusion_matrix(y_pred, y, num_classes=self.num_classes, check_range=self.check_range)
+        return get_dice_from_confusion_matrix(confusion_matrix, self.include_background, self.ignore_empty)
+
+    def aggregate(
+        self, reduction: MetricReduction | str | None = None
+    ) -> torch.Tensor | tuple[torch.Tensor, torch.Tensor]:
+        data = self.get_buffer()
+        if not isinstance(data, torch.Tensor):
+            raise ValueError("the data to aggregate must be PyTorch Tensor.")
+        f, not_nans = do_metric_reduction(data, reduction or self.reduction)
+        return (f, not_nans) if self.get_not_nans else f
+
+
+class ConfusionMeanDice(IgniteMetricHandler):
+    """
+    Ignite handler of `ConfusionDiceMetric`, used like `monai.handlers.MeanDice`.
+    """
+
+    def __init__(
+        self,
+        include_background: bool = True,
+        reduction: MetricReduction | str = MetricReduction.MEAN,
+        num_classes: int | None = None,
+        output_transform: Callable = lambda x: x,
+        save_details: bool = True,
+    ) -> None:
+        metric_fn = ConfusionDiceMetric(
+            include_background=include_background, reduction=reduction, num_classes=num_classes
+        )
+        super().__init__(metric_fn=metric_fn, output_transform=output_transform, save_details=save_details)
+
+    def iteration_completed(self, engine: Engine) -> None:
+        # the class indices are only checked in the iterations of the sanity checks, the check needs a host sync
+        self.metric_fn.check_range = run_sanity_checks(engine)
+        super().iteration_completed(engine)
@@ -11,6 +11,10 @@
 
 from __future__ import annotations
 
+import logging
+import queue
+import threading
+import time
 from abc import ABC, abstractmethod
 from collections.abc import Callable, Sequence
 from typing import TYPE_CHECKING, Any, cast
@@ -38,8 +42,19 @@ __all__ = [
     "default_make_latent",
     "engine_apply_transform",
     "default_metric_cmp_fn",
+    "BatchPrefetcher",
 ]
 
+logger = logging.getLogger("sw_fastedit")
+
+# The keys default_prepare_batch moves to the device
+PREFETCH_KEYS = (
+    CommonKeys.IMAGE_SOURCE,
+    CommonKeys.IMAGE_TARGET,
+    CommonKeys.LABEL_SEG,
+    CommonKeys.LABEL_EP,
+)
+
 def default_prepare_batch(
     batchdata: dict[str, torch.Tensor] | torch.Tensor | Sequence[torch.Tensor],
     device: str | torch.device | None = None,
@@ -102,4 +117,106 @@ def default_prepare_batch(
     return (
             batchdata[CommonKeys.IMAGE_SOURCE].to(device=device, non_blocking=non_blocking, **kwargs),
             batchdata[CommonKeys.IMAGE_TARGET].to(device=device, non_blocking=non_blocking, **kwargs),
-        )
\ No newline at end of file
+        )
+
+
+class BatchPrefetcher:
+    """
+    Iterator which loads the next batch of a data loader in a background thread while the current one is used.
+
+    On a CUDA device the tensors of `keys` are pinned and copied to the device on a separate stream, the batch is
+    handed out once the copy is done. `default_prepare_batch` then finds them on the device already and its
+    `.to(device)` calls are no-ops. Without a CUDA device the batches are only fetched one step ahead, which still
+    overlaps the collation with the iteration.
+
+    Args:
+        iterator: Iterator over the batches, e.g. `iter(data_loader)`.
+        device: Target device of `default_prepare_batch`, None for the plain lookahead.
+        keys: The batch keys to copy to the device.
+        depth (int): Number of batches which are ready or in flight (default 1, double buffering).
+
+    Note:
+        `wait_time` accumulates the seconds the consumer (the engine) was blocked waiting for data, it is logged
+        at the end of every epoch.
+    """
+
+    _END = object()
+
+    def __init__(self, iterator, device: str | torch.device | None = None, keys: Sequence = PREFETCH_KEYS, depth: int = 1):
+        self.device = torch.device(device) if device is not None else None
+        self.use_cuda = self.device is not None and self.device.type == "cuda" and torch.cuda.is_available()
+        self.stream = torch.cuda.Stream(device=self.device) if self.use_cuda else None
+        self.keys = keys
+        self.queue: queue.Queue = queue.Queue(maxsize=depth)
+        self.stop_event = threading.Event()
+        self.wait_time = 0.0
+        self.batches = 0
+        self.thread = threading.Thread(target=self._run, args=(iterator,), daemon=True)
+        self.thread.start()
+
+    def _transfer(self, batchdata):
+        if not self.use_cuda or not isinstance(batchdata, dict):
+            return batchdata, None
+        # a shallow copy keeps the key order, the trainers dispatch on the first key
+        batchdata = dict(batchdata)
+        with torch.cuda.stream(self.stream):
+            for key in self.keys:
+                value = batchdata.get(key)
+                if isinstance(value, torch.Tensor) and value.device.type == "cpu":
+                    batchdata[key] = value.pin_memory().to(self.device, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self.stream)
+        return batchdata, event
+
+    def _put(self, item) -> bool:
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, iterator) -> None:
+        try:
+            for batchdata in iterator:
+                if not self._put(self._transfer(batchdata)):
+                    return
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(self._END)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start_time = time.perf_counter()
+        item = self.queue.get()
+        self.wait_time += time.perf_counter() - start_time
+        if item is self._END:
+            logger.info(
+                f"Waited {self.wait_time:.2f}s for data over {self.batches} batches "
+                f"({self.wait_time / max(self.batches, 1) * 1000:.1f} ms per batch)"
+            )
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+
+        batchdata, event = item
+        if event is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_event(event)
+            for key in self.keys:
+                value = batchdata.get(key)
+                if isinstance(value, torch.Tensor) and value.is_cuda:
+                    # the memory was allocated on the copy stream but is used on the current one
+                    value.record_stream(current_stream)
+        self.batches += 1
+        return batchdata
+
+    def close(self) -> None:
+        """
+        Stop the background thread, e.g. when an epoch ends early.
+        """
+        self.stop_event.set()
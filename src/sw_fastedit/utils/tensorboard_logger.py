@@ -25,6 +25,8 @@ from ignite.contrib.handlers.tensorboard_logger import (
 )
 from ignite.engine import Events
 
+from sw_fastedit.utils.distributed import is_main_process
+
 
 def init_tensorboard_logger_separate(
     args,
@@ -38,6 +40,10 @@ def init_tensorboard_logger_separate(
     network=None,
 ):
     tb_logger = TensorboardLogger(log_dir=f"{output_dir}/tensorboard")
+    if not is_main_process():
+        # in distributed training only rank 0 writes, the other ranks get a logger to close
+        return tb_logger
+    # the evaluators run with the epoch of the trainer, with --async_val the epoch of the validated weights
 
 
     tb_logger.attach_output_handler(
@@ -45,14 +51,14 @@ def init_tensorboard_logger_separate(
         event_name=Events.EPOCH_COMPLETED,
         tag=f"1_validation/{args.source_dataset}_source",
         metric_names=all_val_metrics_names,
-        global_step_transform=global_step_from_engine(trainer),
+        global_step_transform=global_step_from_engine(evaluator[0]),
     )
     tb_logger.attach_output_handler(
         evaluator[1],
         event_name=Events.EPOCH_COMPLETED,
         tag=f"1_validation/{args.target_dataset}_target",
         metric_names=all_val_metrics_names,
-        global_step_transform=global_step_from_engine(trainer),
+        global_step_transform=global_step_from_engine(evaluator[1]),
     )
     tb_logger.attach_output_handler(
         trainer,
@@ -121,12 +127,16 @@ def init_tensorboard_logger_da(
     network=None,
 ):
     tb_logger = TensorboardLogger(log_dir=f"{output_dir}/tensorboard")
+    if not is_main_process():
+        # in distributed training only rank 0 writes, the other ranks get a logger to close
+        return tb_logger
+    # the evaluators run with the epoch of the trainer, with --async_val the epoch of the validated weights
     tb_logger.attach_output_handler(
         evaluator[0],
         event_name=Events.EPOCH_COMPLETED,
         tag=f"1_validation/{args.source_dataset}_source",
         metric_names=all_val_metrics_names,
-        global_step_transform=global_step_from_engine(trainer),
+        global_step_transform=global_step_from_engine(evaluator[0]),
 
     )
     tb_logger.attach_output_handler(
@@ -134,7 +144,7 @@ def init_tensorboard_logger_da(
         event_name=Events.EPOCH_COMPLETED,
         tag=f"1_validation/{args.target_dataset}_target",
         metric_names=all_val_metrics_names,
-        global_step_transform=global_step_from_engine(trainer),
+        global_step_transform=global_step_from_engine(evaluator[1]),
     )
     tb_logger.attach_output_handler(
         trainer,
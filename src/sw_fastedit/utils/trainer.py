@@ -14,6 +14,7 @@
 
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
 from typing import TYPE_CHECKING, Any, Callable, Iterable, Sequence
 
 import logging
@@ -31,16 +32,21 @@ from sw_fastedit.utils.enums import GanKeys
 from sw_fastedit.utils.enums import CommonKeys as Keys
 from sw_fastedit.utils.enums import EngineStatsKeys as ESKeys
 from sw_fastedit.utils.prepare_batch import default_prepare_batch
+from sw_fastedit.utils.distributed import all_reduce_gradients, broadcast_parameters, is_distributed, set_sampler_epoch
+from sw_fastedit.utils.logger import ITERATION_LOGGER_NAME
+from sw_fastedit.utils.metric_accumulator import accumulate, check_batch, run_sanity_checks
 
 logger = logging.getLogger("sw_fastedit")
+iteration_logger = logging.getLogger(ITERATION_LOGGER_NAME)
 
 if TYPE_CHECKING:
-    from ignite.engine import Engine, EventEnum
+    from ignite.engine import Engine, EventEnum, Events
     from ignite.metrics import Metric
 else:
     Engine, _ = optional_import("ignite.engine", IgniteInfo.OPT_IMPORT_VERSION, min_version, "Engine")
     Metric, _ = optional_import("ignite.metrics", IgniteInfo.OPT_IMPORT_VERSION, min_version, "Metric")
     EventEnum, _ = optional_import("ignite.engine", IgniteInfo.OPT_IMPORT_VERSION, min_version, "EventEnum")
+    Events, _ = optional_import("ignite.engine", IgniteInfo.OPT_IMPORT_VERSION, min_version, "Events")
 
 __all__ = ["Trainer", "SupervisedTrainerEp", "SupervisedTrainerDynUnet", "SupervisedTrainerDualDynUNet", "SupervisedTrainerDextr", "SupervisedTrainerPada", "SupervisedTrainerUgda"]
 
@@ -49,8 +55,24 @@ class Trainer(Workflow):
     """
     Base class for all kinds of trainers, inherits from Workflow.
 
+    Gradient accumulation: the gradients of `accumulate_steps` updates are summed up and the optimizers (and the
+    GradScaler) step once. An update is one iteration, or `iterations_per_update` alternating iterations (the source
+    and the target iteration of the adversarial trainers). The windows restart with every epoch and the last one of
+    an epoch may be shorter, so the optimizers have stepped whenever an epoch completes (LR scheduler, checkpoints).
+    The losses are divided by the number of updates in the window, i.e. the gradient is the mean of the window.
+
+    Distributed training (torchrun, see `init_distributed`): the networks are not wrapped in
+    DistributedDataParallel, whose reducer expects one forward and one backward per step, but the alternating
+    trainers run several forwards and partial backwards (`retain_graph`, `inputs`, `torch.autograd.grad`) per
+    update. Instead the parameters are broadcast from rank 0 when the run starts and the gradients of all
+    optimizers, so also of the discriminator, are averaged over the ranks once per accumulation window right
+    before the optimizers step.
+
     """
 
+    accumulate_steps: int = 1
+    iterations_per_update: int = 1
+
     def run(self) -> None:  # type: ignore[override]
         """
         Execute training based on Ignite Engine.
@@ -58,8 +80,16 @@ class Trainer(Workflow):
 
         """
         self.scaler = torch.cuda.amp.GradScaler() if self.amp else None
+        if is_distributed():
+            broadcast_parameters(self.networks)
+            if not self.has_event_handler(self._set_sampler_epoch, Events.EPOCH_STARTED):
+                self.add_event_handler(Events.EPOCH_STARTED, self._set_sampler_epoch)
         super().run()
 
+    def _set_sampler_epoch(self, engine: Engine) -> None:
+        # the distributed samplers shuffle with the same seed on every rank, changed with every epoch
+        set_sampler_epoch(self.data_loader, engine.state.epoch)
+
     def get_stats(self, *vars):
         """
         Get the statistics information of the training process.
@@ -82,7 +112,257 @@ class Trainer(Workflow):
             stats[k] = getattr(self.state, k, None)
         return stats
 
+    def accumulation_window(self) -> tuple[int, int]:
+        """
+        Position of the current iteration in its accumulation window and the length of the window, in iterations.
+        """
+        window = self.accumulate_steps * self.iterations_per_update
+        position = self.state.iteration - 1
+        remaining = None
+        if self.state.epoch_length is not None:
+            position %= self.state.epoch_length
+        start = position - position % window
+        if self.state.epoch_length is not None:
+            remaining = self.state.epoch_length - start
+            # an unpaired iteration at the end of the epoch is not part of the last update
+            remaining = max(remaining - remaining % self.iterations_per_update, 1)
+        return position - start, window if remaining is None else min(window, remaining)
+
+    def accumulation_loss_scale(self) -> float:
+        _, length = self.accumulation_window()
+        return self.iterations_per_update / max(length, self.iterations_per_update)
+
+    def optimizer_zero_grad(self, *optimizers: Optimizer) -> None:
+        """Zero the gradients at the start of an accumulation window."""
+        if self.accumulation_window()[0] == 0:
+            for optimizer in optimizers:
+                optimizer.zero_grad(set_to_none=self.optim_set_to_none)
+
+    def scaled_backward(self, loss: torch.Tensor, **kwargs) -> None:
+        """`loss.backward(**kwargs)`, with the loss divided by the updates of the window and scaled for AMP."""
+        scale = self.accumulation_loss_scale()
+        if scale != 1.0:
+            loss = loss * scale
+        if self.scaler is not None:
+            loss = self.scaler.scale(loss)
+        loss.backward(**kwargs)
+
+    def optimizer_step(self, *optimizers: Optimizer) -> bool:
+        """
+        Step the optimizers (through the GradScaler with AMP) at the end of an accumulation window.
 
+        Returns:
+            bool: Whether the optimizers stepped.
+        """
+        position, length = self.accumulation_window()
+        if position != length - 1:
+            return False
+        if is_distributed():
+            all_reduce_gradients(
+                param for optimizer in optimizers for group in optimizer.param_groups for param in group["params"]
+            )
+        for optimizer in optimizers:
+            if self.scaler is not None:
+                self.scaler.step(optimizer)
+            else:
+                optimizer.step()
+        if self.scaler is not None:
+            self.scaler.update()
+        return True
+
+
+def get_trainable_parameters(network: torch.nn.Module) -> list:
+    return [param for param in network.parameters() if param.requires_grad]
+
+
+def paired_adversarial_step(
+    seg_network: torch.nn.Module,
+    dis_network: torch.nn.Module,
+    optimizers: Sequence[Optimizer],
+    loss_functions: Sequence[Callable],
+    source: Sequence[torch.Tensor],
+    target: Sequence[torch.Tensor],
+    *,
+    get_seg_input: Callable,
+    get_dis_input: Callable,
+    lambda_adv: float,
+    seg_params: list | None = None,
+    inferer: Inferer | None = None,
+    scaler: torch.cuda.amp.GradScaler | None = None,
+    amp_kwargs: dict | None = None,
+    optim_set_to_none: bool = False,
+    zero_grad: bool = True,
+    step: bool = True,
+    loss_scale: float = 1.0,
+) -> dict:
+    """
+    One adversarial training step on a source and a target batch, with the updates of two alternating
+    source / target iterations of SupervisedTrainerPada / SupervisedTrainerUgda:
+
+        - segmentation network: loss_seg(source) + lambda_adv * BCE(D(pred_target), 1), the discriminator is frozen
+        - discriminator: BCE(D(pred_source), 1) + BCE(D(pred_target), 0)
+
+    The source graph is freed by the backward of the segmentation loss before the target forward. The adversarial
+    gradient is only taken w.r.t. `seg_params` (`torch.autograd.grad`) and the discriminator is trained on detached
+    predictions, so neither `retain_graph` nor toggling `requires_grad` is needed.
+
+    Args:
+        seg_network: the segmentation network.
+        dis_network: the discriminator.
+        optimizers: (segmentation optimizer, discriminator optimizer).
+        loss_functions: (segmentation loss, discriminator loss on logits).
+        source: (inputs, labels, extreme points) of the source batch.
+        target: (inputs, labels, extreme points) of the target batch, the labels are not used.
+        get_seg_input: fn(inputs, extreme points) returning the input of the segmentation network.
+        get_dis_input: fn(pred_seg, extreme points) returning the input of the discriminator.
+        lambda_adv: weight of the adversarial loss.
+        seg_params: trainable parameters of `seg_network`, pass them to avoid collecting them every step.
+        inferer: default is SimpleInferer.
+        scaler: GradScaler for AMP, None trains without autocast.
+        amp_kwargs: dict of the args for `torch.cuda.amp.autocast()`.
+        optim_set_to_none: when calling `optimizer.zero_grad()`, set the grads to None.
+        zero_grad: zero the gradients first, False to accumulate them over several steps.
+        step: step the optimizers (and the scaler) at the end, False to accumulate the gradients.
+        loss_scale: factor of all losses in the backward, e.g. 1 / the number of accumulated steps.
+
+    Returns:
+        dict: The source prediction (Keys.PRED_SEG) and discriminator output (GanKeys.GPRED) and all losses.
+    """
+    inferer = SimpleInferer() if inferer is None else inferer
+    seg_params = get_trainable_parameters(seg_network) if seg_params is None else seg_params
+    amp_kwargs = {} if amp_kwargs is None else amp_kwargs
+
+    def scale(loss):
+        loss = loss * loss_scale if loss_scale != 1.0 else loss
+        return scaler.scale(loss) if scaler is not None else loss
+
+    seg_optimizer, dis_optimizer = optimizers
+    seg_loss_function, dis_loss_function = loss_functions
+    inputs_source, labels_source, ep_source = source
+    inputs_target, _, ep_target = target
+
+    seg_network.train()
+    dis_network.train()
+    if zero_grad:
+        seg_optimizer.zero_grad(set_to_none=optim_set_to_none)
+        dis_optimizer.zero_grad(set_to_none=optim_set_to_none)
+
+    # Supervised loss on the source batch, only the segmentation network is part of its graph
+    with torch.cuda.amp.autocast(enabled=scaler is not None, **amp_kwargs):
+        pred_source = inferer(get_seg_input(inputs_source, ep_source), seg_network)
+        loss_seg = seg_loss_function(pred_source, labels_source)
+    scale(loss_seg).backward()
+
+    # Adversarial loss on the target batch, gradients for the segmentation network only
+    with torch.cuda.amp.autocast(enabled=scaler is not None, **amp_kwargs):
+        pred_target = inferer(get_seg_input(inputs_target, ep_target), seg_network)
+        gpred_target = inferer(get_dis_input(pred_target, ep_target), dis_network)
+        loss_adv = dis_loss_function(gpred_target, torch.ones_like(gpred_target))
+    grads = torch.autograd.grad(scale(lambda_adv * loss_adv), seg_params, allow_unused=True)
+    for param, grad in zip(seg_params, grads):
+        if grad is None:
+            continue
+        if param.grad is None:
+            param.grad = grad
+        else:
+            param.grad.add_(grad)
+
+    # Discriminator on the detached predictions
+    pred_source, pred_target = pred_source.detach(), pred_target.detach()
+    with torch.cuda.amp.autocast(enabled=scaler is not None, **amp_kwargs):
+        gpred_source = inferer(get_dis_input(pred_source, ep_source), dis_network)
+        loss_dis_source = dis_loss_function(gpred_source, torch.ones_like(gpred_source))
+        gpred_target = inferer(get_dis_input(pred_target, ep_target), dis_network)
+        loss_dis_target = dis_loss_function(gpred_target, torch.zeros_like(gpred_target))
+    loss_dis = loss_dis_source + loss_dis_target
+    scale(loss_dis).backward()
+
+    if step and scaler is not None:
+        scaler.step(seg_optimizer)
+        scaler.step(dis_optimizer)
+        scaler.update()
+    elif step:
+        seg_optimizer.step()
+        dis_optimizer.step()
+
+    loss_seg = loss_seg.detach()
+    loss_adv = loss_adv.detach()
+    return {
+        Keys.PRED_SEG: pred_source,
+        GanKeys.GPRED: gpred_source.detach(),
+        Keys.LOSS_SEG: loss_seg,
+        GanKeys.ADVLOSS: loss_adv,
+        GanKeys.DLOSS: loss_dis.detach(),
+        Keys.LOSS_SEG_ADV: loss_seg + lambda_adv * loss_adv,
+        "loss_dis_source": loss_dis_source.detach(),
+        "loss_dis_target": loss_dis_target.detach(),
+    }
+
+
+class _PairedAdversarialMixin(ABC):
+    """
+    --paired_adv_step of the adversarial trainers: every iteration gets a (source batch, target batch) pair from
+    `PairedBatchLoader` and runs `paired_adversarial_step`. The trainers define the inputs of their networks.
+    """
+
+    @abstractmethod
+    def get_seg_input(self, inputs: torch.Tensor, targets_ep: torch.Tensor) -> torch.Tensor:
+        pass
+
+    @abstractmethod
+    def get_dis_input(self, pred_seg: torch.Tensor, targets_ep: torch.Tensor) -> torch.Tensor:
+        pass
+
+    def _paired_iteration(self, engine: Trainer, batchdata: Sequence[dict]) -> dict:
+        batch_source, batch_target = batchdata
+        source = engine.prepare_batch(batch_source, engine.state.device, engine.non_blocking, **engine.to_kwargs)
+        target = engine.prepare_batch(batch_target, engine.state.device, engine.non_blocking, **engine.to_kwargs)
+        if run_sanity_checks(engine):
+            check_batch(source[0], batch_source["label"])
+            check_batch(target[0], batch_target["label"])
+        iteration_logger.info("source image file name: %s", batch_source["image_source_meta_dict"]["filename_or_obj"])
+        iteration_logger.info("target image file name: %s", batch_target["image_target_meta_dict"]["filename_or_obj"])
+        # the outputs (and so the train metrics and post transforms) are the ones of the source batch
+        engine.state.batch = batch_source
+
+        if self.seg_params is None:
+            self.seg_params = get_trainable_parameters(engine.networks[1])
+        position, _ = engine.accumulation_window()
+        results = paired_adversarial_step(
+            engine.networks[1],
+            engine.networks[2],
+            engine.optimizer,
+            engine.loss_function,
+            source,
+            target,
+            get_seg_input=self.get_seg_input,
+            get_dis_input=self.get_dis_input,
+            lambda_adv=self.args.lambda_adv,
+            seg_params=self.seg_params,
+            inferer=engine.inferer,
+            scaler=engine.scaler if engine.amp else None,
+            amp_kwargs=engine.amp_kwargs,
+            optim_set_to_none=engine.optim_set_to_none,
+            zero_grad=position == 0,
+            step=False,
+            loss_scale=engine.accumulation_loss_scale(),
+        )
+        engine.optimizer_step(*engine.optimizer)
+        accumulate(
+            engine,
+            source_loss_seg=results[Keys.LOSS_SEG],
+            source_loss_dis=results["loss_dis_source"],
+            target_loss_adv=results[GanKeys.ADVLOSS],
+            target_loss_dis=results["loss_dis_target"],
+        )
+        engine.state.output = {Keys.IMAGE_SOURCE: source[0], Keys.LABEL_SEG: source[1]}
+        engine.state.output.update({k: v for k, v in results.items() if not k.startswith("loss_dis_")})
+        engine.state.output[Keys.LOSS] = results[Keys.LOSS_SEG_ADV]
+        engine.fire_event(IterationEvents.FORWARD_COMPLETED)
+        engine.fire_event(IterationEvents.LOSS_COMPLETED)
+        engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
+        engine.fire_event(IterationEvents.MODEL_COMPLETED)
+        return engine.state.output
 
 
 class SupervisedTrainerEp(Trainer):
@@ -135,6 +415,7 @@ class SupervisedTrainerEp(Trainer):
             `device`, `non_blocking`.
         amp_kwargs: dict of the args for `torch.cuda.amp.autocast()` API, for more details:
             https://pytorch.org/docs/stable/amp.html#torch.cuda.amp.autocast.
+        accumulate_steps: number of updates whose gradients are accumulated before the optimizers step, see `Trainer`.
 
     """
 
@@ -163,6 +444,7 @@ class SupervisedTrainerEp(Trainer):
         optim_set_to_none: bool = False,
         to_kwargs: dict | None = None,
         amp_kwargs: dict | None = None,
+        accumulate_steps: int = 1,
         no_discriminator: bool = False,
         no_extreme_points: bool = False,
     ) -> None:
@@ -192,6 +474,7 @@ class SupervisedTrainerEp(Trainer):
         self.loss_function = loss_function
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.optim_set_to_none = optim_set_to_none
+        self.accumulate_steps = accumulate_steps
         self.loss_discriminator = {}
 
 
@@ -223,26 +506,23 @@ class SupervisedTrainerEp(Trainer):
         else:
             print('Problem with batch, check prepare_batch')
         
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("extreme points.shape is {}".format(targets_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("extreme points.shape is %s", targets_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
         if(keys[0]== 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
 
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
             
         def _forward_ep():
             engine.networks[0].train()
             
-            engine.optimizer.zero_grad(set_to_none=engine.optim_set_to_none)
+            engine.optimizer_zero_grad(engine.optimizer)
 
             if keys[0]=='image_target':    
                 engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg, Keys.LABEL_EP: targets_ep}
@@ -269,16 +549,15 @@ class SupervisedTrainerEp(Trainer):
         if engine.amp and engine.scaler is not None:
             with torch.cuda.amp.autocast(**engine.amp_kwargs):
                 _forward_ep()
-            engine.scaler.scale(engine.state.output[Keys.LOSS]).backward()
+            engine.scaled_backward(engine.state.output[Keys.LOSS])
             engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
-            engine.scaler.step(engine.optimizer)
-            engine.scaler.update()
+            engine.optimizer_step(engine.optimizer)
            
         else:
             _forward_ep()
-            engine.scaler.scale(engine.state.output[Keys.LOSS]).backward()
+            engine.scaled_backward(engine.state.output[Keys.LOSS])
             engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
-            engine.optimizer.step()
+            engine.optimizer_step(engine.optimizer)
         
         engine.fire_event(IterationEvents.MODEL_COMPLETED)  
 
@@ -337,6 +616,7 @@ class SupervisedTrainerDynUnet(Trainer):
             `device`, `non_blocking`.
         amp_kwargs: dict of the args for `torch.cuda.amp.autocast()` API, for more details:
             https://pytorch.org/docs/stable/amp.html#torch.cuda.amp.autocast.
+        accumulate_steps: number of updates whose gradients are accumulated before the optimizers step, see `Trainer`.
 
     """
 
@@ -365,6 +645,7 @@ class SupervisedTrainerDynUnet(Trainer):
         optim_set_to_none: bool = False,
         to_kwargs: dict | None = None,
         amp_kwargs: dict | None = None,
+        accumulate_steps: int = 1,
         no_discriminator: bool = False,
         no_extreme_points: bool = False,
     ) -> None:
@@ -394,6 +675,7 @@ class SupervisedTrainerDynUnet(Trainer):
         self.loss_function = loss_function
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.optim_set_to_none = optim_set_to_none
+        self.accumulate_steps = accumulate_steps
         self.loss_discriminator = {}
 
 
@@ -426,21 +708,18 @@ class SupervisedTrainerDynUnet(Trainer):
         else:
             print('Problem with batch, check prepare_batch')
         
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("extreme points.shape is {}".format(targets_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("extreme points.shape is %s", targets_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
         if(keys[0]== 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
 
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
 
 
         def _compute_seg_loss():
@@ -450,7 +729,7 @@ class SupervisedTrainerDynUnet(Trainer):
                 engine.state.output = {Keys.IMAGE_SOURCE: inputs, Keys.LABEL_SEG: target_seg}
 
             engine.networks[1].train()
-            engine.optimizer.zero_grad(set_to_none=engine.optim_set_to_none)
+            engine.optimizer_zero_grad(engine.optimizer)
 
             engine.state.output[Keys.PRED_SEG] = engine.inferer(inputs, engine.networks[1], *args, **kwargs)
             engine.fire_event(IterationEvents.FORWARD_COMPLETED)
@@ -461,14 +740,13 @@ class SupervisedTrainerDynUnet(Trainer):
         if engine.amp and engine.scaler is not None:
             with torch.cuda.amp.autocast(**engine.amp_kwargs):
                 _compute_seg_loss()
-            engine.scaler.scale(engine.state.output[Keys.LOSS]).backward()
+            engine.scaled_backward(engine.state.output[Keys.LOSS])
             engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
-            engine.scaler.step(engine.optimizer)
-            engine.scaler.update()
+            engine.optimizer_step(engine.optimizer)
            
         else:
             _compute_seg_loss()
-            engine.optimizer.step()
+            engine.optimizer_step(engine.optimizer)
         
         engine.fire_event(IterationEvents.MODEL_COMPLETED)  
         return engine.state.output    
@@ -524,6 +802,7 @@ class SupervisedTrainerDualDynUNet(Trainer):
             `device`, `non_blocking`.
         amp_kwargs: dict of the args for `torch.cuda.amp.autocast()` API, for more details:
             https://pytorch.org/docs/stable/amp.html#torch.cuda.amp.autocast.
+        accumulate_steps: number of updates whose gradients are accumulated before the optimizers step, see `Trainer`.
 
     """
 
@@ -553,6 +832,7 @@ class SupervisedTrainerDualDynUNet(Trainer):
         optim_set_to_none: bool = False,
         to_kwargs: dict | None = None,
         amp_kwargs: dict | None = None,
+        accumulate_steps: int = 1,
     ) -> None:
         super().__init__(
             device=device,
@@ -580,6 +860,7 @@ class SupervisedTrainerDualDynUNet(Trainer):
         self.loss_function = loss_function
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.optim_set_to_none = optim_set_to_none
+        self.accumulate_steps = accumulate_steps
         self.loss_ep = 0
         self.loss_seg = 0
         self.loss_adv = 0
@@ -616,21 +897,18 @@ class SupervisedTrainerDualDynUNet(Trainer):
         else:
             print('Problem with batch, check prepare_batch')
         
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("extreme points.shape is {}".format(targets_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("extreme points.shape is %s", targets_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
         if(keys[0]== "image_target"):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
 
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
 
         def set_requires_grad(nets, requires_grad=False):
             for net in nets:
@@ -640,7 +918,7 @@ class SupervisedTrainerDualDynUNet(Trainer):
         def _forward_seg():
             engine.networks[0].train()
             engine.networks[1].train()
-            engine.optimizer.zero_grad(set_to_none=engine.optim_set_to_none)
+            engine.optimizer_zero_grad(engine.optimizer)
             if keys[0]== "image_source":    
                 engine.state.output = {Keys.IMAGE_SOURCE: inputs, Keys.LABEL_SEG: target_seg, Keys.LABEL_EP: targets_ep}
                 engine.state.output[Keys.PRED_EP] = engine.inferer(inputs, engine.networks[0], *args, **kwargs)
@@ -653,7 +931,7 @@ class SupervisedTrainerDualDynUNet(Trainer):
             if(keys[0]== 'image_source'):
                 engine.state.output[Keys.LOSS_EP] = engine.loss_function[0](engine.state.output[Keys.PRED_EP], targets_ep)
                 engine.state.output[Keys.LOSS_SEG] = engine.loss_function[1](engine.state.output[Keys.PRED_SEG], target_seg)
-                logger.info(f'source image: loss_seg: {engine.state.output[Keys.LOSS_SEG].item()}, loss_ep: {engine.state.output[Keys.LOSS_EP].item()}')
+                accumulate(engine, source_loss_seg=engine.state.output[Keys.LOSS_SEG], source_loss_ep=engine.state.output[Keys.LOSS_EP])
                 engine.state.output[Keys.LOSS] = engine.state.output[Keys.LOSS_SEG] + engine.state.output[Keys.LOSS_EP]
 
             engine.fire_event(IterationEvents.LOSS_COMPLETED)
@@ -666,14 +944,16 @@ class SupervisedTrainerDualDynUNet(Trainer):
             if (self.args.backprop_ep_separate):
                 set_requires_grad([engine.networks[0]], True)
                 set_requires_grad([engine.networks[1]], False)
-                engine.scaler.scale(engine.state.output[Keys.LOSS_EP]).backward(retain_graph=True)
+                engine.scaled_backward(
+                    engine.state.output[Keys.LOSS_EP], retain_graph=True, inputs=list(engine.networks[0].parameters())
+                )
                 set_requires_grad([engine.networks[0]], False)
                 set_requires_grad([engine.networks[1]], True)
-                engine.scaler.scale(engine.state.output[Keys.LOSS_SEG]).backward()
+                # the frozen extreme point network is not part of the backward, see CheckpointedForward
+                engine.scaled_backward(engine.state.output[Keys.LOSS_SEG], inputs=list(engine.networks[1].parameters()))
             else:
-                engine.scaler.scale(engine.state.output[Keys.LOSS]).backward()
-            engine.scaler.step(engine.optimizer)
-            engine.scaler.update()
+                engine.scaled_backward(engine.state.output[Keys.LOSS])
+            engine.optimizer_step(engine.optimizer)
 
         else:
             print('no torch.amp')
@@ -732,6 +1012,7 @@ class SupervisedTrainerDextr(Trainer):
             `device`, `non_blocking`.
         amp_kwargs: dict of the args for `torch.cuda.amp.autocast()` API, for more details:
             https://pytorch.org/docs/stable/amp.html#torch.cuda.amp.autocast.
+        accumulate_steps: number of updates whose gradients are accumulated before the optimizers step, see `Trainer`.
 
     """
 
@@ -761,6 +1042,7 @@ class SupervisedTrainerDextr(Trainer):
         optim_set_to_none: bool = False,
         to_kwargs: dict | None = None,
         amp_kwargs: dict | None = None,
+        accumulate_steps: int = 1,
         no_discriminator: bool = False,
         no_extreme_points: bool = False,
     ) -> None:
@@ -790,6 +1072,7 @@ class SupervisedTrainerDextr(Trainer):
         self.loss_function = loss_function
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.optim_set_to_none = optim_set_to_none
+        self.accumulate_steps = accumulate_steps
         self.args = args
 
 
@@ -821,21 +1104,18 @@ class SupervisedTrainerDextr(Trainer):
         else:
             print('Problem with batch, check prepare_batch')
         
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("extreme points.shape is {}".format(targets_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("extreme points.shape is %s", targets_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
         if(keys[0]== 'image_target'):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
 
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
 
 
         def _compute_seg_loss_ground_truth_ep():
@@ -845,7 +1125,7 @@ class SupervisedTrainerDextr(Trainer):
                 engine.state.output = {Keys.IMAGE_SOURCE: inputs, Keys.LABEL_SEG: target_seg}
 
             engine.networks[1].train()
-            engine.optimizer.zero_grad(set_to_none=engine.optim_set_to_none)
+            engine.optimizer_zero_grad(engine.optimizer)
 
             engine.state.output[Keys.SEG_EP] = torch.cat((inputs,targets_ep), dim=1) 
             engine.state.output[Keys.PRED_SEG] = engine.inferer(engine.state.output[Keys.SEG_EP], engine.networks[1], *args, **kwargs)
@@ -862,7 +1142,7 @@ class SupervisedTrainerDextr(Trainer):
                 engine.state.output = {Keys.IMAGE_SOURCE: inputs, Keys.LABEL_SEG: target_seg}
 
             engine.networks[1].train()
-            engine.optimizer.zero_grad(set_to_none=engine.optim_set_to_none)
+            engine.optimizer_zero_grad(engine.optimizer)
             with torch.no_grad():
               engine.state.output[Keys.PRED_EP] = engine.inferer(inputs, engine.networks[0], *args, **kwargs)
             pred_ep_processed = torch.where(engine.state.output[Keys.PRED_EP] > 0.1, engine.state.output[Keys.PRED_EP], torch.tensor(0.0, device=engine.state.device)) 
@@ -880,19 +1160,18 @@ class SupervisedTrainerDextr(Trainer):
                     _compute_seg_loss_predicted_ep()
                 else:
                     _compute_seg_loss_ground_truth_ep()
-            engine.scaler.scale(engine.state.output[Keys.LOSS]).backward()
+            engine.scaled_backward(engine.state.output[Keys.LOSS])
             engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
-            engine.scaler.step(engine.optimizer)
-            engine.scaler.update()
+            engine.optimizer_step(engine.optimizer)
            
         else:
             if self.args.pred_ep:
                 _compute_seg_loss_predicted_ep()
             else:
                 _compute_seg_loss_ground_truth_ep()
-            engine.scaler.scale(engine.state.output[Keys.LOSS]).backward()
+            engine.scaled_backward(engine.state.output[Keys.LOSS])
             engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
-            engine.optimizer.step()
+            engine.optimizer_step(engine.optimizer)
         
         engine.fire_event(IterationEvents.MODEL_COMPLETED)  
         return engine.state.output
@@ -900,7 +1179,7 @@ class SupervisedTrainerDextr(Trainer):
 
 
 
-class SupervisedTrainerPada(Trainer):
+class SupervisedTrainerPada(_PairedAdversarialMixin, Trainer):
     """
     Standard supervised training method with image and label, inherits from ``Trainer`` and ``Workflow``.
 
@@ -950,6 +1229,7 @@ class SupervisedTrainerPada(Trainer):
             `device`, `non_blocking`.
         amp_kwargs: dict of the args for `torch.cuda.amp.autocast()` API, for more details:
             https://pytorch.org/docs/stable/amp.html#torch.cuda.amp.autocast.
+        accumulate_steps: number of updates whose gradients are accumulated before the optimizers step, see `Trainer`.
 
     """
 
@@ -979,6 +1259,7 @@ class SupervisedTrainerPada(Trainer):
         optim_set_to_none: bool = False,
         to_kwargs: dict | None = None,
         amp_kwargs: dict | None = None,
+        accumulate_steps: int = 1,
     ) -> None:
         super().__init__(
             device=device,
@@ -1006,15 +1287,27 @@ class SupervisedTrainerPada(Trainer):
         self.loss_function = loss_function
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.optim_set_to_none = optim_set_to_none
+        self.accumulate_steps = accumulate_steps
         self.loss_dis_source = 0
         self.loss_dis_target = 0
         self.loss_seg = 0
         self.loss_adv = 0
         self.source_target = [False, False]
         self.args = args
+        # the alternating iterations update once per source and target batch
+        self.iterations_per_update = 1 if args.paired_adv_step else 2
+        # trainable parameters of the segmentation network, collected in the first paired step
+        self.seg_params = None
 
 
 
+    def get_seg_input(self, inputs: torch.Tensor, targets_ep: torch.Tensor) -> torch.Tensor:
+        return torch.cat((inputs, targets_ep), dim=1) if self.args.extreme_points else inputs
+
+    def get_dis_input(self, pred_seg: torch.Tensor, targets_ep: torch.Tensor) -> torch.Tensor:
+        # the extreme points are not passed to the discriminator (pada)
+        return pred_seg
+
     def _iteration(self, engine: SupervisedTrainerPada, batchdata: dict[str, torch.Tensor]) -> dict:
         """
         Callback function for the Supervised Training processing logic of 1 iteration in Ignite Engine.
@@ -1035,6 +1328,8 @@ class SupervisedTrainerPada(Trainer):
 
         if batchdata is None:
             raise ValueError("Must provide batch data for current iteration.")
+        if self.args.paired_adv_step:
+            return self._paired_iteration(engine, batchdata)
         batch = engine.prepare_batch(batchdata, engine.state.device, engine.non_blocking, **engine.to_kwargs)
         if len(batch) == 3:
             inputs, target_seg, targets_ep= batch
@@ -1043,21 +1338,18 @@ class SupervisedTrainerPada(Trainer):
         else:
             print('Problem with batch, check prepare_batch')
         
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("extreme points.shape is {}".format(targets_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("extreme points.shape is %s", targets_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
         if(keys[0]== "image_target"):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
 
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
 
         def _forward_seg():
             if keys[0]== "image_source":    
@@ -1066,9 +1358,8 @@ class SupervisedTrainerPada(Trainer):
                 engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg}
 
             engine.networks[1].train()
-            engine.optimizer[0].zero_grad(set_to_none=engine.optim_set_to_none)
             engine.networks[2].train()
-            engine.optimizer[1].zero_grad(set_to_none=engine.optim_set_to_none)
+            engine.optimizer_zero_grad(*engine.optimizer)
 
             if self.args.extreme_points:
                 engine.state.output[Keys.SEG_EP] = torch.cat((inputs,targets_ep), dim=1) 
@@ -1086,13 +1377,13 @@ class SupervisedTrainerPada(Trainer):
                 self.loss_seg = engine.loss_function[0](engine.state.output[Keys.PRED_SEG], target_seg)
 
                 self.source_target[0] = True
-                logger.info(f'source image: loss_seg: {self.loss_seg.item()} loss_dis: {self.loss_dis_source.item()}')
+                accumulate(engine, source_loss_seg=self.loss_seg, source_loss_dis=self.loss_dis_source)
             else: 
                 self.loss_dis_target = engine.loss_function[1](engine.state.output[GanKeys.GPRED], torch.zeros_like(engine.state.output[GanKeys.GPRED]))
                 self.loss_adv = engine.loss_function[1](engine.state.output[GanKeys.GPRED], torch.ones_like(engine.state.output[GanKeys.GPRED]))
 
                 self.source_target[1] = True
-                logger.info(f'target image: loss_adv: {self.loss_adv.item()} loss_dis: {self.loss_dis_target.item()}')
+                accumulate(engine, target_loss_adv=self.loss_adv, target_loss_dis=self.loss_dis_target)
 
 
         def set_requires_grad(nets, requires_grad=False):
@@ -1119,19 +1410,18 @@ class SupervisedTrainerPada(Trainer):
                 #Backpropagate Discriminator
                 set_requires_grad([engine.networks[0], engine.networks[1]], False)
                 set_requires_grad([engine.networks[2]], True)
-                engine.scaler.scale(engine.state.output[GanKeys.DLOSS]).backward(retain_graph=True)
+                # only the discriminator is updated, `inputs` keeps the backward out of the (checkpointed) segmentation graph
+                engine.scaled_backward(
+                    engine.state.output[GanKeys.DLOSS], retain_graph=True, inputs=list(engine.networks[2].parameters())
+                )
 
                 #Backpropagate Segmentation
                 set_requires_grad([engine.networks[0], engine.networks[2]], False)
                 set_requires_grad([engine.networks[1]], True)
   
-                engine.scaler.scale(engine.state.output[Keys.LOSS_SEG_ADV]).backward()
+                engine.scaled_backward(engine.state.output[Keys.LOSS_SEG_ADV], inputs=list(engine.networks[1].parameters()))
                 engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
-                engine.scaler.step(engine.optimizer[0])
-                engine.scaler.step(engine.optimizer[1])
-
-
-                engine.scaler.update()
+                engine.optimizer_step(*engine.optimizer)
                 self.source_target = [False, False]
 
             else:
@@ -1148,7 +1438,7 @@ class SupervisedTrainerPada(Trainer):
     
     
 
-class SupervisedTrainerUgda(Trainer):
+class SupervisedTrainerUgda(_PairedAdversarialMixin, Trainer):
     """
     Standard supervised training method with image and label, inherits from ``Trainer`` and ``Workflow``.
 
@@ -1198,6 +1488,7 @@ class SupervisedTrainerUgda(Trainer):
             `device`, `non_blocking`.
         amp_kwargs: dict of the args for `torch.cuda.amp.autocast()` API, for more details:
             https://pytorch.org/docs/stable/amp.html#torch.cuda.amp.autocast.
+        accumulate_steps: number of updates whose gradients are accumulated before the optimizers step, see `Trainer`.
 
     """
 
@@ -1227,6 +1518,7 @@ class SupervisedTrainerUgda(Trainer):
         optim_set_to_none: bool = False,
         to_kwargs: dict | None = None,
         amp_kwargs: dict | None = None,
+        accumulate_steps: int = 1,
     ) -> None:
         super().__init__(
             device=device,
@@ -1254,15 +1546,27 @@ class SupervisedTrainerUgda(Trainer):
         self.loss_function = loss_function
         self.inferer = SimpleInferer() if inferer is None else inferer
         self.optim_set_to_none = optim_set_to_none
+        self.accumulate_steps = accumulate_steps
         self.loss_dis_source = 0
         self.loss_dis_target = 0
         self.loss_seg = 0
         self.loss_adv = 0
         self.source_target = [False, False]
         self.args = args
+        # the alternating iterations update once per source and target batch
+        self.iterations_per_update = 1 if args.paired_adv_step else 2
+        # trainable parameters of the segmentation network, collected in the first paired step
+        self.seg_params = None
 
 
 
+    def get_seg_input(self, inputs: torch.Tensor, targets_ep: torch.Tensor) -> torch.Tensor:
+        return torch.cat((inputs, targets_ep), dim=1)
+
+    def get_dis_input(self, pred_seg: torch.Tensor, targets_ep: torch.Tensor) -> torch.Tensor:
+        # the extreme points are passed to the discriminator as an extra channel (ugda)
+        return torch.cat((pred_seg, targets_ep), dim=1)
+
     def _iteration(self, engine: SupervisedTrainerUgda, batchdata: dict[str, torch.Tensor]) -> dict:
         """
         Callback function for the Supervised Training processing logic of 1 iteration in Ignite Engine.
@@ -1283,6 +1587,8 @@ class SupervisedTrainerUgda(Trainer):
 
         if batchdata is None:
             raise ValueError("Must provide batch data for current iteration.")
+        if self.args.paired_adv_step:
+            return self._paired_iteration(engine, batchdata)
         batch = engine.prepare_batch(batchdata, engine.state.device, engine.non_blocking, **engine.to_kwargs)
         if len(batch) == 3:
             inputs, target_seg, targets_ep= batch
@@ -1291,21 +1597,18 @@ class SupervisedTrainerUgda(Trainer):
         else:
             print('Problem with batch, check prepare_batch')
         
-        logger.info("inputs.shape is {}".format(inputs.shape))
-        logger.info("labels.shape is {}".format(target_seg.shape))
-        logger.info("extreme points.shape is {}".format(targets_ep.shape))
-        # Make sure the signal is empty in the first iteration assertion holds
-        assert torch.sum(inputs[:, 1:, ...]) == 0
+        iteration_logger.info("inputs.shape is %s", inputs.shape)
+        iteration_logger.info("labels.shape is %s", target_seg.shape)
+        iteration_logger.info("extreme points.shape is %s", targets_ep.shape)
+        if run_sanity_checks(engine):
+            check_batch(inputs, batchdata["label"])
         keys = list(batchdata.keys())
         if(keys[0]== "image_target"):
-            logger.info(f"image file name: {batchdata['image_target_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_target_meta_dict"]["filename_or_obj"])
         else:
-            logger.info(f"image file name: {batchdata['image_source_meta_dict']['filename_or_obj']}")
+            iteration_logger.info("image file name: %s", batchdata["image_source_meta_dict"]["filename_or_obj"])
 
-        logger.info(f"label file name: {batchdata['label_meta_dict']['filename_or_obj']}")
-        for i in range(len(batchdata["label"])):
-            if torch.sum(batchdata["label"][i, 0]) < 0.1:
-                logger.warning("No valid labels for this sample (probably due to crop)")
+        iteration_logger.info("label file name: %s", batchdata["label_meta_dict"]["filename_or_obj"])
 
         def _forward_seg():
             if keys[0]== "image_source":    
@@ -1314,9 +1617,8 @@ class SupervisedTrainerUgda(Trainer):
                 engine.state.output = {Keys.IMAGE_TARGET: inputs, Keys.LABEL_SEG: target_seg}
 
             engine.networks[1].train()
-            engine.optimizer[0].zero_grad(set_to_none=engine.optim_set_to_none)
             engine.networks[2].train()
-            engine.optimizer[1].zero_grad(set_to_none=engine.optim_set_to_none)
+            engine.optimizer_zero_grad(*engine.optimizer)
 
             engine.state.output[Keys.SEG_EP] = torch.cat((inputs,targets_ep), dim=1) 
             engine.state.output[Keys.PRED_SEG] = engine.inferer(engine.state.output[Keys.SEG_EP], engine.networks[1], *args, **kwargs)
@@ -1332,12 +1634,12 @@ class SupervisedTrainerUgda(Trainer):
                 self.loss_seg = engine.loss_function[0](engine.state.output[Keys.PRED_SEG], target_seg)
                 self.loss_dis_source = engine.loss_function[1](engine.state.output[GanKeys.GPRED], torch.ones_like(engine.state.output[GanKeys.GPRED]))
                 self.source_target[0] = True
-                logger.info(f'loss_dis: {self.loss_dis_source.item()}')
+                accumulate(engine, source_loss_seg=self.loss_seg, source_loss_dis=self.loss_dis_source)
             else:
                 self.loss_dis_target = engine.loss_function[1](engine.state.output[GanKeys.GPRED], torch.zeros_like(engine.state.output[GanKeys.GPRED]))
                 self.loss_adv = engine.loss_function[1](engine.state.output[GanKeys.GPRED], torch.ones_like(engine.state.output[GanKeys.GPRED]))
                 self.source_target[1] = True
-                logger.info(f'target image: loss_adv: {self.loss_adv.item()} loss_dis: {self.loss_dis_target.item()}')
+                accumulate(engine, target_loss_adv=self.loss_adv, target_loss_dis=self.loss_dis_target)
 
 
         def set_requires_grad(nets, requires_grad=False):
@@ -1363,17 +1665,17 @@ class SupervisedTrainerUgda(Trainer):
                 #Backpropagate Discriminator
                 set_requires_grad([engine.networks[0], engine.networks[1]], False)
                 set_requires_grad([engine.networks[2]], True)
-                engine.scaler.scale(engine.state.output[GanKeys.DLOSS]).backward(retain_graph=True)
+                # only the discriminator is updated, `inputs` keeps the backward out of the (checkpointed) segmentation graph
+                engine.scaled_backward(
+                    engine.state.output[GanKeys.DLOSS], retain_graph=True, inputs=list(engine.networks[2].parameters())
+                )
 
                 #Backpropagate Segmentation adversarial
                 set_requires_grad([engine.networks[0], engine.networks[2]], False)
                 set_requires_grad([engine.networks[1]], True)
-                engine.scaler.scale(engine.state.output[Keys.LOSS_SEG_ADV]).backward()
+                engine.scaled_backward(engine.state.output[Keys.LOSS_SEG_ADV], inputs=list(engine.networks[1].parameters()))
                 engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
-
-                engine.scaler.step(engine.optimizer[0])
-                engine.scaler.step(engine.optimizer[1])
-                engine.scaler.update()
+                engine.optimizer_step(*engine.optimizer)
                 self.source_target = [False, False]
 
             else:
@@ -11,8 +11,12 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Sequence
 
+import torch
 from monai.config import IgniteInfo
 from monai.engines.evaluator import Evaluator
 from monai.utils import min_version, optional_import
@@ -23,6 +27,8 @@ if TYPE_CHECKING:
 else:
     Engine, _ = optional_import("ignite.engine", IgniteInfo.OPT_IMPORT_VERSION, min_version, "Engine")
 
+logger = logging.getLogger("sw_fastedit")
+
 
 class ValidationHandler:
     """
@@ -84,3 +90,262 @@ class ValidationHandler:
         if self.validator is None:
             raise RuntimeError("please set validator in __init__() or call `set_validator()` before training.")
         self.validator.run(engine.state.epoch)
+
+
+class TieredValidator:
+    """
+    Tiered validation of one dataset, it is run by a (Async)ValidationHandler like an evaluator: every run
+    validates a small fixed subset of the val cases (`subset_validator`), the whole val set (`validator`) is only
+    validated every `full_interval` epochs and whenever the key metric of the subset improved.
+
+    `full_interval` has to be a multiple of the interval of the validation handler. With ValidationHandler the
+    TieredValidator is also attached to the trainer, which validates the whole val set when the training
+    completes, unless that epoch was already validated completely. AsyncValidationHandler does the same on its
+    snapshot.
+
+    Only `validator` should have a CheckpointSaver, so the best checkpoint is selected by the whole val set.
+    """
+
+    def __init__(self, subset_validator: Evaluator, validator: Evaluator, full_interval: int) -> None:
+        """
+        Args:
+            subset_validator: the evaluator of the val subset.
+            validator: the evaluator of the whole val set.
+            full_interval: validate the whole val set every N epochs.
+
+        """
+        self.subset_validator = subset_validator
+        self.validator = validator
+        self.full_interval = full_interval
+        self.best_subset_metric = None
+        self.last_full_epoch = None
+
+    def attach(self, engine: Engine) -> None:
+        """
+        Args:
+            engine: the trainer, the whole val set is validated when it completes.
+        """
+        engine.add_event_handler(Events.COMPLETED, lambda engine: self.run_full(engine.state.epoch))
+
+    def _subset_improved(self) -> bool:
+        state = self.subset_validator.state
+        metric = state.metrics.get(state.key_metric_name) if state.key_metric_name is not None else None
+        if metric is None:
+            return False
+        if self.best_subset_metric is None or self.subset_validator.metric_cmp_fn(metric, self.best_subset_metric):
+            self.best_subset_metric = metric
+            return True
+        return False
+
+    def run_full(self, global_epoch: int = 1) -> None:
+        """Validate the whole val set, unless it was already validated in `global_epoch`."""
+        if self.last_full_epoch != global_epoch:
+            self.last_full_epoch = global_epoch
+            self.validator.run(global_epoch)
+
+    def run(self, global_epoch: int = 1) -> None:
+        self.subset_validator.run(global_epoch)
+        improved = self._subset_improved()
+        if improved or global_epoch % self.full_interval == 0:
+            if improved:
+                logger.info(f"Validating the whole val set in epoch {global_epoch}, the val subset improved")
+            self.run_full(global_epoch)
+
+
+def _copy_to_cpu(state: Any) -> Any:
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return {k: _copy_to_cpu(v) for k, v in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(_copy_to_cpu(v) for v in state)
+    return copy.deepcopy(state)
+
+
+class _StateSnapshot:
+    """
+    Stands in for an object of a CheckpointSaver save_dict (trainer, optimizer, scheduler): `state_dict` returns
+    the state of the object at the last `capture`.
+    """
+
+    def __init__(self, obj: Any) -> None:
+        self.obj = obj
+        self.state = None
+
+    def capture(self) -> None:
+        self.state = _copy_to_cpu(self.obj.state_dict())
+
+    def state_dict(self) -> Dict:
+        return self.state if self.state is not None else self.obj.state_dict()
+
+    def load_state_dict(self, state_dict: Dict) -> None:
+        self.obj.load_state_dict(state_dict)
+
+
+class WeightSnapshot:
+    """
+    Copies of the trained networks on `device`, which AsyncValidationHandler validates while the training goes on.
+
+    `networks` is the network or the list of networks of a trainer (entries may be None), `copies` has the same
+    structure and is what the evaluators get. The copies are in eval mode and without grad, `capture` copies the
+    current weights into them.
+
+    Args:
+        networks: The trained network(s).
+        device: Device of the copies, e.g. another GPU or the CPU.
+    """
+
+    def __init__(
+        self, networks: torch.nn.Module | Sequence[torch.nn.Module | None], device: torch.device | str
+    ) -> None:
+        self.networks = networks
+        self.device = torch.device(device)
+        if isinstance(networks, torch.nn.Module):
+            self.copies = self._copy(networks)
+        else:
+            self.copies = [self._copy(network) for network in networks]
+        self._pairs = [
+            (network, network_copy)
+            for network, network_copy in zip(self._as_list(self.networks), self._as_list(self.copies))
+            if network is not None
+        ]
+        self._states: List[_StateSnapshot] = []
+
+    @staticmethod
+    def _as_list(networks) -> List:
+        return [networks] if isinstance(networks, torch.nn.Module) else list(networks)
+
+    def _copy(self, network: torch.nn.Module | None) -> torch.nn.Module | None:
+        if network is None:
+            return None
+        network_copy = copy.deepcopy(network).to(self.device).eval()
+        network_copy.requires_grad_(False)
+        return network_copy
+
+    def save_dict(self, save_dict: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The `save_dict` for a CheckpointSaver attached to an evaluator of the snapshot: the networks are replaced
+        by their copies and the other objects by the state they had at the last `capture`, so a checkpoint holds
+        the training state of the epoch it was validated for.
+        """
+        networks = {id(network): network_copy for network, network_copy in self._pairs}
+        snapshot_dict = {}
+        for key, obj in save_dict.items():
+            if id(obj) in networks:
+                snapshot_dict[key] = networks[id(obj)]
+            else:
+                snapshot_dict[key] = _StateSnapshot(obj)
+                self._states.append(snapshot_dict[key])
+        return snapshot_dict
+
+    def capture(self) -> None:
+        with torch.no_grad():
+            for network, network_copy in self._pairs:
+                network_copy.load_state_dict(network.state_dict())
+        for state in self._states:
+            state.capture()
+
+
+class AsyncValidationHandler:
+    """
+    Attach validators to the trainer engine which run in the background on a WeightSnapshot, like
+    ValidationHandler every N epochs or every N iterations.
+
+    When triggered the current weights are captured in the snapshot and every validator runs in its own thread
+    (the source and the target evaluator at the same time) while the training continues. On a CUDA device they
+    run on their own streams. The validators get the epoch of the snapshot as `global_epoch`, so their logs,
+    TensorBoard values and checkpoints belong to the validated epoch.
+
+    A validation first waits for the previous one, so at most one snapshot is validated at a time, and the
+    trainer waits for the last one when it completes (see `complete`). A failed validation is raised in the
+    training at the next trigger or at the end of the training.
+    """
+
+    def __init__(
+        self,
+        interval: int,
+        validators: Sequence[Evaluator],
+        snapshot: WeightSnapshot,
+        epoch_level: bool = True,
+        exec_at_start: bool = False,
+    ) -> None:
+        """
+        Args:
+            interval: do validation every N epochs or every N iterations during training.
+            validators: the validators (evaluators or TieredValidators) to run, their networks have to be
+                `snapshot.copies`.
+            snapshot: the snapshot of the trained networks.
+            epoch_level: execute validation every N epochs or N iterations.
+                `True` is epoch level, `False` is iteration level.
+            exec_at_start: whether to execute a validation first when starting the training.
+
+        """
+        self.validators = list(validators)
+        self.snapshot = snapshot
+        self.interval = interval
+        self.epoch_level = epoch_level
+        self.exec_at_start = exec_at_start
+        self.executor = ThreadPoolExecutor(max_workers=len(self.validators), thread_name_prefix="validation")
+        self.futures: List = []
+
+    def attach(self, engine: Engine) -> None:
+        """
+        Args:
+            engine: Ignite Engine, it can be a trainer, validator or evaluator.
+        """
+        if self.epoch_level:
+            engine.add_event_handler(Events.EPOCH_COMPLETED(every=self.interval), self)
+        else:
+            engine.add_event_handler(Events.ITERATION_COMPLETED(every=self.interval), self)
+        if self.exec_at_start:
+            engine.add_event_handler(Events.STARTED, self)
+        engine.add_event_handler(Events.COMPLETED, self.complete)
+
+    def _run(self, run: Callable[[int], None], global_epoch: int, event: torch.cuda.Event | None) -> None:
+        if event is None:
+            run(global_epoch)
+            return
+        stream = torch.cuda.Stream(device=self.snapshot.device)
+        # the weights were copied on the stream of the training
+        stream.wait_event(event)
+        with torch.cuda.stream(stream):
+            run(global_epoch)
+        stream.synchronize()
+
+    def _submit(self, runs: Sequence[Callable[[int], None]], global_epoch: int) -> None:
+        self.snapshot.capture()
+        event = None
+        if self.snapshot.device.type == "cuda":
+            event = torch.cuda.Event()
+            event.record(torch.cuda.current_stream(self.snapshot.device))
+        self.futures = [self.executor.submit(self._run, run, global_epoch, event) for run in runs]
+
+    def wait(self, engine: Engine | None = None) -> None:
+        """Wait for the running validation and raise its exception, if one of the validators failed."""
+        futures, self.futures = self.futures, []
+        wait(futures)
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        for e in errors:
+            logger.error(f"Validation failed: {e!r}")
+        if len(errors) > 0:
+            raise errors[0]
+
+    def complete(self, engine: Engine) -> None:
+        """
+        Wait for the running validation, then validate the whole val set of the TieredValidators on the final
+        weights, unless their last full validation was already in the final epoch.
+        """
+        self.wait()
+        epoch = engine.state.epoch
+        pending = [v for v in self.validators if isinstance(v, TieredValidator) and v.last_full_epoch != epoch]
+        if len(pending) > 0:
+            self._submit([v.run_full for v in pending], epoch)
+            self.wait()
+
+    def __call__(self, engine: Engine) -> None:
+        """
+        Args:
+            engine: Ignite Engine, it can be a trainer, validator or evaluator.
+        """
+        self.wait()
+        self._submit([validator.run for validator in self.validators], engine.state.epoch)
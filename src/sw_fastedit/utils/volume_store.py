@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from copy import deepcopy
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Mapping, Sequence, Tuple
+
+import numpy as np
+import torch
+from monai.data.meta_tensor import MetaTensor
+from monai.transforms import Compose, Randomizable, Transform, apply_transform
+from torch.utils.data import Dataset
+
+from sw_fastedit.helper_transforms import TrackTimed
+
+logger = logging.getLogger("sw_fastedit")
+
+# Bump this whenever the on-disk layout changes, it is part of every config hash
+STORE_VERSION = 1
+SIDECAR_NAME = "meta.pkl"
+CONFIG_NAME = "config.json"
+STATS_DIR_NAME = "intensity_stats"
+# Attributes of the transforms which do not change the stored volumes and are left out of the config hash: the
+# device the transforms run on, the logging setup of InitLoggerd and the location of the intensity statistics
+UNHASHED_ATTRIBUTES = frozenset({"device", "loglevel", "log_dir", "no_log", "stats_cache", "stats_dir"})
+# Guards against reference cycles between transforms
+MAX_DESCRIBE_DEPTH = 8
+
+# In memory entries of all MemmapDatasets with in_memory=True, keyed by (config hash, item hash), so datasets of
+# several loaders / evaluators over the same store share them
+_memory_cache: Dict[Tuple[str, str], Dict] = {}
+
+
+def get_config_hash(config: Mapping) -> str:
+    """
+    Hash a (json serializable) transform configuration.
+
+    Args:
+        config (Mapping): The configuration describing the deterministic transforms.
+
+    Returns:
+        str: The md5 hex digest of the sorted json representation.
+    """
+    return hashlib.md5(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get_item_hash(item: Mapping) -> str:
+    """
+    Hash a single data dictionary, usually the file paths from `get_data`.
+    """
+    return hashlib.md5(json.dumps(item, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def describe_transform(obj: Any, depth: int = 0) -> Any:
+    """
+    Json serializable description of a transform and everything it was constructed with (its attributes,
+    recursively), which is hashed into the store folder name. Changing a parameter of a cached transform
+    (intensity range, interpolation mode, axcodes, ...) therefore always selects a new store.
+
+    Attributes in UNHASHED_ATTRIBUTES are left out, functions and classes are described by their qualified name.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (np.ndarray, np.generic, torch.Tensor)):
+        return obj.tolist()
+    if depth >= MAX_DESCRIBE_DEPTH:
+        return type(obj).__name__
+    if isinstance(obj, Mapping):
+        return {str(k): describe_transform(v, depth + 1) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [describe_transform(v, depth + 1) for v in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted((describe_transform(v, depth + 1) for v in obj), key=str)
+    if isinstance(obj, logging.Logger):
+        return type(obj).__name__
+    if isinstance(obj, type) or callable(obj) and hasattr(obj, "__qualname__"):
+        return f"{getattr(obj, '__module__', '')}.{obj.__qualname__}"
+    if hasattr(obj, "__dict__"):
+        description = {"type": type(obj).__name__}
+        for key, value in sorted(vars(obj).items()):
+            if key not in UNHASHED_ATTRIBUTES:
+                description[key] = describe_transform(value, depth + 1)
+        return description
+    # e.g. torch.dtype, the default repr of other objects contains their address
+    description = repr(obj)
+    return type(obj).__name__ if " at 0x" in description else description
+
+
+def _unwrap_transform(transform):
+    return transform.transform if isinstance(transform, TrackTimed) else transform
+
+
+def split_deterministic_transforms(transform: Compose | Sequence) -> Tuple[List, List]:
+    """
+    Split a transform chain at the first random (or non MONAI) transform.
+
+    Args:
+        transform: Either a `Compose` or a list of transforms.
+
+    Returns:
+        Tuple[List, List]: The deterministic prefix and the remaining transforms.
+
+    Note:
+        This is the same boundary as the one PersistentDataset uses for caching. `TrackTimed` wrappers
+        are looked through so that the split is identical with and without --debug.
+    """
+    transforms = list(transform.transforms) if isinstance(transform, Compose) else list(transform)
+    for i, t in enumerate(transforms):
+        inner = _unwrap_transform(t)
+        if isinstance(inner, Randomizable) or not isinstance(inner, Transform):
+            return transforms[:i], transforms[i:]
+    return transforms, []
+
+
+class MemmapDataset(Dataset):
+    """
+    Dataset which stores the output of the deterministic transforms as raw arrays and memory-maps them on access.
+
+    Every tensor of the preprocessed data dictionary is written as a `.npy` file, everything else (meta dicts,
+    applied operations, label names) goes into a small pickled sidecar. On access the arrays are opened with
+    `mmap_mode="c"`, so no voxel data is unpickled or copied until a later transform writes to it.
+
+    Args:
+        data (Sequence[Dict]): The data dictionaries, e.g. from `get_data`.
+        transform (Compose): The full transform chain, it is split with `split_deterministic_transforms`.
+        cache_dir (str): Root folder of the store.
+        config (Dict): Description of everything the deterministic transforms depend on (spacing,
+            normalization, organ, ...). It is hashed into the sub folder name together with the parameters of
+            the deterministic transforms (see `describe_transform`), so a changed config never reads stale volumes.
+        in_memory (bool): Additionally keep every item in RAM after its first access. Meant for chains without
+            random transforms (the val pipelines), whose final samples are then neither read nor transformed again.
+
+    Note:
+        Writes go to a temporary folder which is renamed afterwards, so concurrent workers or an interrupted
+        run never leave a half written entry behind. With worker processes every worker holds the items it
+        loaded, persistent workers keep them across epochs.
+    """
+
+    def __init__(
+        self, data: Sequence[Dict], transform: Compose, cache_dir: str, config: Dict, in_memory: bool = False
+    ) -> None:
+        self.data = data
+        self.in_memory = in_memory
+        # Keep lazy resampling (see compose_pre_transforms) working within both parts of the chain
+        self.lazy = transform.lazy if isinstance(transform, Compose) else False
+        self.pre_transforms, post_transforms = split_deterministic_transforms(transform)
+        self.pre_transform = Compose(self.pre_transforms, lazy=self.lazy)
+        self.post_transform = Compose(post_transforms, lazy=self.lazy) if len(post_transforms) > 0 else None
+
+        self.config = dict(config)
+        self.config["store_version"] = STORE_VERSION
+        self.config["lazy"] = self.lazy
+        self.config["pre_transforms"] = [describe_transform(_unwrap_transform(t)) for t in self.pre_transforms]
+        self.config_hash = get_config_hash(self.config)
+
+        self.store_dir = Path(cache_dir) / self.config_hash
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        config_file = self.store_dir / CONFIG_NAME
+        if not config_file.exists():
+            with open(config_file, "w") as f:
+                json.dump(self.config, f, indent=2, sort_keys=True, default=str)
+        logger.info(f"Using preprocessed volume store {self.store_dir}")
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def get_item_dir(self, item: Mapping) -> Path:
+        return self.store_dir / get_item_hash(item)
+
+    def is_cached(self, index: int) -> bool:
+        return (self.get_item_dir(self.data[index]) / SIDECAR_NAME).is_file()
+
+    def _pre_transform(self, item: Mapping) -> Dict:
+        # Compose applies all pending lazy operations at the end, so only resampled volumes are stored
+        return self.pre_transform(item)
+
+    def _write(self, item_dir: Path, data: Mapping[Hashable, torch.Tensor]) -> None:
+        tmp_dir = Path(tempfile.mkdtemp(prefix=".tmp_", dir=self.store_dir))
+        try:
+            arrays, items = {}, {}
+            for key, value in data.items():
+                if isinstance(value, torch.Tensor):
+                    np.save(tmp_dir / f"{key}.npy", value.detach().cpu().numpy(), allow_pickle=False)
+                    if isinstance(value, MetaTensor):
+                        arrays[key] = {
+                            "type": "metatensor",
+                            "meta": dict(value.meta),
+                            "applied_operations": value.applied_operations,
+                        }
+                    else:
+                        arrays[key] = {"type": "tensor"}
+                elif isinstance(value, np.ndarray):
+                    np.save(tmp_dir / f"{key}.npy", value, allow_pickle=False)
+                    arrays[key] = {"type": "ndarray"}
+                else:
+                    items[key] = value
+            # the sidecar is written last, its existence marks a complete entry
+            with open(tmp_dir / SIDECAR_NAME, "wb") as f:
+                pickle.dump({"arrays": arrays, "items": items}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_dir, item_dir)
+        except OSError:
+            # Another worker was faster, keep its entry
+            if not (item_dir / SIDECAR_NAME).is_file():
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _read(self, item_dir: Path) -> Dict:
+        with open(item_dir / SIDECAR_NAME, "rb") as f:
+            sidecar = pickle.load(f)
+        data = dict(sidecar["items"])
+        for key, entry in sidecar["arrays"].items():
+            array = np.load(item_dir / f"{key}.npy", mmap_mode="c")
+            if entry["type"] == "metatensor":
+                data[key] = MetaTensor(
+                    torch.from_numpy(array), meta=entry["meta"], applied_operations=entry["applied_operations"]
+                )
+            elif entry["type"] == "tensor":
+                data[key] = torch.from_numpy(array)
+            else:
+                data[key] = array
+        return data
+
+    def _cachecheck(self, item: Mapping) -> Dict:
+        item_dir = self.get_item_dir(item)
+        if (item_dir / SIDECAR_NAME).is_file():
+            try:
+                return self._read(item_dir)
+            except Exception as e:
+                logger.warning(f"Corrupt store entry {item_dir}, recomputing it: {e}")
+                shutil.rmtree(item_dir, ignore_errors=True)
+
+        data = self._pre_transform(deepcopy(item))
+        self._write(item_dir, data)
+        return data
+
+    def get_cached_spatial_shape(self, index: int) -> Tuple[int, ...] | None:
+        """
+        Spatial shape of the largest stored volume of one item, read from the `.npy` headers only.
+        None if the item has not been stored yet.
+        """
+        item_dir = self.get_item_dir(self.data[index])
+        if not (item_dir / SIDECAR_NAME).is_file():
+            return None
+        shapes = [np.load(path, mmap_mode="r").shape[1:] for path in item_dir.glob("*.npy")]
+        shapes = [shape for shape in shapes if len(shape) > 0]
+        return max(shapes, key=lambda shape: int(np.prod(shape))) if len(shapes) > 0 else None
+
+    def _memorycheck(self, item: Mapping) -> Dict:
+        key = (self.config_hash, get_item_hash(item))
+        if key not in _memory_cache:
+            data = self._cachecheck(item)
+            # copy the memory-mapped arrays into RAM once
+            for k, v in data.items():
+                if isinstance(v, torch.Tensor):
+                    data[k] = v.clone()
+                elif isinstance(v, np.ndarray):
+                    data[k] = np.array(v)
+            _memory_cache[key] = data
+        # a shallow copy, the tensors themselves are only read, e.g. by the collation which copies them
+        return dict(_memory_cache[key])
+
+    def get_cached_item(self, index: int) -> Dict:
+        """
+        Return the output of the deterministic transforms for one item, computing and storing it if necessary.
+        """
+        if self.in_memory:
+            return self._memorycheck(self.data[index])
+        return self._cachecheck(self.data[index])
+
+    def __getitem__(self, index: int) -> Dict:
+        data = self.get_cached_item(index)
+        if self.post_transform is not None:
+            data = apply_transform(self.post_transform, data)
+        return data
+
+
+class IntensityStatsCache:
+    """
+    Per case intensity statistics (mean / std, percentiles) shared by all stores below one cache_dir.
+
+    An entry is keyed by the source file and the voxel grid the statistics were computed on (shape and affine
+    after Orientationd / Spacingd). The train and val pre transforms of a case and every later run, also with
+    a different store config, therefore reuse the statistics instead of recomputing them.
+
+    Args:
+        cache_dir (str): Root folder of the volume store, the statistics go into its STATS_DIR_NAME sub folder.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self.stats_dir = Path(cache_dir) / STATS_DIR_NAME
+        self.stats_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_key(self, img: torch.Tensor) -> str | None:
+        """
+        Key of the statistics of `img`, None if it cannot be identified (no MetaTensor or no source file).
+        """
+        if not isinstance(img, MetaTensor) or not isinstance(img.meta.get("filename_or_obj"), str):
+            return None
+        filename = img.meta["filename_or_obj"]
+        try:
+            # a replaced source file must not reuse the old statistics
+            stat = os.stat(filename)
+            file_info = [stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            file_info = None
+        affine = np.round(np.asarray(img.affine, dtype=np.float64), 4).tolist()
+        return get_item_hash({"filename": filename, "file": file_info, "shape": list(img.shape), "affine": affine})
+
+    def get(self, key: str | None) -> Dict:
+        if key is None:
+            return {}
+        try:
+            with open(self.stats_dir / f"{key}.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def update(self, key: str | None, stats: Mapping) -> None:
+        if key is None:
+            return
+        entry = self.get(key)
+        entry.update(stats)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=self.stats_dir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f, sort_keys=True)
+        os.replace(tmp_path, self.stats_dir / f"{key}.json")